@@ -0,0 +1,77 @@
+"""
+Background writer thread for batched database inserts
+The producer hands over full buffers through a bounded queue and keeps
+generating while the writer thread drains them; a full queue blocks the
+producer, which is the backpressure when the database falls behind
+"""
+
+import queue
+import threading
+import time
+from typing import Callable, Optional, Sized
+
+_STOP = object()
+
+
+class BackgroundWriter:
+    """Drains row batches on a dedicated thread"""
+
+    def __init__(self, write: Callable[[Sized], int], max_pending: int = 1, name: str = 'can-writer'):
+        """
+        write(batch) runs on the writer thread only and returns the rows
+        stored, for a row list or a MessageBatch; it owns the database connection for the writer's lifetime.
+        max_pending=1 is classic double buffering: one batch being
+        written, one queued, while the producer fills the next.
+        """
+        self._write = write
+        self._queue: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._error: Optional[BaseException] = None
+
+        self.rows_written = 0
+        self.batches_written = 0
+        self.write_time_s = 0.0    # time spent inside write(), i.e. in the database
+        self.blocked_time_s = 0.0  # producer time spent waiting on a full queue
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def submit(self, rows: Sized):
+        """Queue a batch; blocks while max_pending batches are already waiting"""
+        if self._error is not None:
+            raise RuntimeError("Background writer failed") from self._error
+        start = time.monotonic()
+        self._queue.put(rows)
+        self.blocked_time_s += time.monotonic() - start
+
+    def close(self) -> int:
+        """Flush everything queued, stop the thread and return total rows written"""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        if self._error is not None:
+            raise RuntimeError("Background writer failed") from self._error
+        return self.rows_written
+
+    @property
+    def sustained_rate(self) -> float:
+        """Rows/s the database absorbed while actually writing"""
+        return self.rows_written / self.write_time_s if self.write_time_s else 0.0
+
+    def _run(self):
+        while True:
+            rows = self._queue.get()
+            if rows is _STOP:
+                return
+            if self._error is not None:
+                # Keep draining so a blocked producer can observe the failure
+                continue
+            start = time.monotonic()
+            try:
+                self.rows_written += self._write(rows)
+                self.batches_written += 1
+            except BaseException as e:
+                self._error = e
+            finally:
+                self.write_time_s += time.monotonic() - start
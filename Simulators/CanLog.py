@@ -0,0 +1,493 @@
+"""
+Binary CAN log format
+Fixed-size little-endian frame records behind a 32-byte header, so a
+capture can be memory-mapped and used as a NumPy structured array without
+parsing. Converts to and from candump (-l) and Vector ASC logs, any of
+which may be gzip or zstd compressed.
+"""
+
+import argparse
+import os
+import re
+import struct
+from datetime import datetime
+from itertools import islice
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+from CompressedIO import compression_of, open_stream
+from MessageBatch import MessageBatch
+
+LOG_MAGIC = b'CANLOG\x00\x00'
+LOG_VERSION = 1
+LOG_HEADER = struct.Struct('<8sHHI16x')  # magic, version, payload size, record size
+PAYLOAD_SIZES = (8, 64)  # classic CAN, CAN FD
+
+# can_id carries the extended-frame flag the way SocketCAN does
+CAN_EFF_FLAG = 0x80000000
+CAN_EFF_MASK = 0x1FFFFFFF
+CAN_SFF_MASK = 0x7FF
+
+FLAG_FD = 0x01
+FLAG_BRS = 0x02
+FLAG_ESI = 0x04
+FLAG_RTR = 0x08
+
+# CAN FD DLC code -> data length
+FD_LENGTHS = (0, 1, 2, 3, 4, 5, 6, 7, 8, 12, 16, 20, 24, 32, 48, 64)
+
+CHUNK_FRAMES = 65536
+
+CANDUMP_RE = re.compile(
+    rb'\((\d+)\.(\d+)\)\s+(\S+)\s+([0-9A-Fa-f]{1,8})#(?:(R)\d?|#([0-9A-Fa-f])([0-9A-Fa-f]*)|([0-9A-Fa-f]*))')
+ASC_DATE_FORMATS = ('%a %b %d %I:%M:%S.%f %p %Y', '%a %b %d %H:%M:%S.%f %Y',
+                    '%a %b %d %I:%M:%S %p %Y', '%a %b %d %H:%M:%S %Y')
+
+
+def frame_dtype(payload_size: int = 8) -> np.dtype:
+    """Record layout: 16 bytes of metadata followed by the zero-padded payload"""
+    if payload_size not in PAYLOAD_SIZES:
+        raise ValueError(f"Unsupported payload size {payload_size}, expected one of {PAYLOAD_SIZES}")
+    return np.dtype([
+        ('timestamp_ns', '<i8'),
+        ('can_id', '<u4'),
+        ('dlc', 'u1'),  # data length in bytes, also for CAN FD
+        ('flags', 'u1'),
+        ('channel', '<u2'),
+        ('data', 'u1', (payload_size,)),
+    ])
+
+
+def frames_from_batch(batch: MessageBatch, payload_size: int = 8) -> np.ndarray:
+    """
+    Frame records behind a batch of signal rows. Consecutive rows of one
+    frame share timestamp, CAN ID and vehicle, which becomes the channel.
+    """
+    n = len(batch)
+    records = np.zeros(0, dtype=frame_dtype(payload_size))
+    if not n:
+        return records
+    timestamps, can_ids, vehicle_ids = batch.timestamps[:n], batch.can_ids[:n], batch.vehicle_ids[:n]
+    if vehicle_ids.min() < 0 or vehicle_ids.max() > 0xFFFF:
+        raise ValueError("vehicle_id does not fit the 16-bit channel field of a CAN log record")
+    first = np.ones(n, dtype=bool)
+    first[1:] = ((timestamps[1:] != timestamps[:-1]) | (can_ids[1:] != can_ids[:-1])
+                 | (vehicle_ids[1:] != vehicle_ids[:-1]))
+    frames = np.flatnonzero(first)
+    ids = can_ids[frames]
+
+    records = np.zeros(len(frames), dtype=records.dtype)
+    records['timestamp_ns'] = timestamps[frames] * 1000
+    records['can_id'] = np.where(ids > CAN_SFF_MASK, ids | CAN_EFF_FLAG, ids)
+    records['dlc'] = batch.dlc[frames]
+    records['channel'] = vehicle_ids[frames]
+    records['data'][:, :8] = batch.payload[frames]
+    return records
+
+
+class CanLogWriter:
+    """Appends frames to a binary CAN log"""
+
+    def __init__(self, path: str, payload_size: int = 8):
+        self.path = path
+        self.dtype = frame_dtype(payload_size)
+        self.payload_size = payload_size
+        self._file = open_stream(path, 'wb')
+        self._file.write(LOG_HEADER.pack(LOG_MAGIC, LOG_VERSION, payload_size, self.dtype.itemsize))
+        self.frames_written = 0
+
+    def write_records(self, records: np.ndarray) -> int:
+        """Write a structured array of this log's frame dtype as-is"""
+        if records.dtype != self.dtype:
+            raise ValueError(f"Expected records of dtype {self.dtype}, got {records.dtype}")
+        self._file.write(np.ascontiguousarray(records).data)
+        self.frames_written += len(records)
+        return len(records)
+
+    def write_frames(self, timestamp_ns: np.ndarray, can_id: np.ndarray, data: np.ndarray,
+                     dlc: Optional[np.ndarray] = None, channel=0, flags=0) -> int:
+        """Write frames from columns; data is (N, k) with k up to the payload size"""
+        data = np.asarray(data, dtype=np.uint8).reshape(len(timestamp_ns), -1)
+        if data.shape[1] > self.payload_size:
+            raise ValueError(f"{data.shape[1]}-byte payloads exceed the log's {self.payload_size}-byte payload size")
+        records = np.zeros(len(timestamp_ns), dtype=self.dtype)
+        records['timestamp_ns'] = timestamp_ns
+        records['can_id'] = can_id
+        records['dlc'] = data.shape[1] if dlc is None else dlc
+        records['flags'] = flags
+        records['channel'] = channel
+        records['data'][:, :data.shape[1]] = data
+        return self.write_records(records)
+
+    def write(self, batch: MessageBatch) -> int:
+        """Write the frames behind a batch of signal rows"""
+        return self.write_records(frames_from_batch(batch, self.payload_size))
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CanLogReader:
+    """
+    Memory-maps a binary CAN log; frames is a zero-copy structured array
+    over the file. A .gz/.zst log cannot be mapped and is read into memory.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        body = None
+        with open_stream(path, 'rb') as f:
+            header = f.read(LOG_HEADER.size)
+            if compression_of(path):
+                body = f.read()
+        if len(header) < LOG_HEADER.size or not header.startswith(LOG_MAGIC):
+            raise ValueError(f"{path} is not a binary CAN log")
+        _, version, payload_size, record_size = LOG_HEADER.unpack(header)
+        if version != LOG_VERSION:
+            raise ValueError(f"Unsupported CAN log version {version} in {path}")
+        self.dtype = frame_dtype(payload_size)
+        if record_size != self.dtype.itemsize:
+            raise ValueError(f"Record size {record_size} does not match payload size {payload_size}")
+        self.payload_size = payload_size
+
+        # A writer killed mid-record leaves a torn tail; it is ignored
+        count = ((len(body) if body is not None else os.path.getsize(path) - LOG_HEADER.size)
+                 // record_size)
+        if body is not None:
+            self.frames = np.frombuffer(body, dtype=self.dtype, count=count)
+        elif count:
+            self.frames = np.memmap(path, dtype=self.dtype, mode='r', offset=LOG_HEADER.size, shape=(count,))
+        else:
+            self.frames = np.empty(0, dtype=self.dtype)
+
+    def __len__(self):
+        return len(self.frames)
+
+    @property
+    def arbitration_ids(self) -> np.ndarray:
+        """CAN IDs without the extended-frame flag"""
+        return self.frames['can_id'] & CAN_EFF_MASK
+
+    @property
+    def is_extended(self) -> np.ndarray:
+        return (self.frames['can_id'] & CAN_EFF_FLAG) != 0
+
+
+def _timestamp_ns(seconds: bytes, fraction: bytes) -> int:
+    """Exact nanoseconds from the two halves of a decimal timestamp"""
+    return int(seconds) * 1000000000 + int(fraction[:9].ljust(9, b'0'))
+
+
+class _FrameBuffer:
+    """Collects parsed frames in Python lists and turns them into records a chunk at a time"""
+
+    def __init__(self, payload_size: int):
+        self.dtype = frame_dtype(payload_size)
+        self.payload_size = payload_size
+        self.columns = ([], [], [], [], [])  # timestamp_ns, can_id, dlc, flags, channel
+        self.data = []
+
+    def __len__(self):
+        return len(self.data)
+
+    def add(self, timestamp_ns: int, can_id: int, data: bytes, flags: int, channel: int):
+        if len(data) > self.payload_size:
+            raise ValueError(f"{len(data)}-byte frame exceeds the log's {self.payload_size}-byte payload size, "
+                             f"use payload_size=64")
+        for column, value in zip(self.columns, (timestamp_ns, can_id, len(data), flags, channel)):
+            column.append(value)
+        self.data.append(data.ljust(self.payload_size, b'\x00'))
+
+    def take(self) -> np.ndarray:
+        """Records of the collected frames; the buffer starts over empty"""
+        records = np.zeros(len(self.data), dtype=self.dtype)
+        if self.data:
+            for name, column in zip(('timestamp_ns', 'can_id', 'dlc', 'flags', 'channel'), self.columns):
+                records[name] = column
+                column.clear()
+            records['data'] = np.frombuffer(b''.join(self.data), dtype=np.uint8).reshape(-1, self.payload_size)
+            self.data.clear()
+        return records
+
+
+def _candump_records(lines: List[bytes], channels: Dict[bytes, int], payload_size: int) -> Optional[np.ndarray]:
+    """
+    Column-wise parse of a chunk of classic data frames: each line split in
+    one call, IDs and interfaces looked up once per distinct value, payloads
+    decoded in one fromhex. None if the chunk holds anything else (remote or
+    FD frames, comments, blank lines) and needs the line-by-line parser.
+    """
+    n = len(lines)
+    text = b''.join(lines)
+    tokens = text.split()
+    if len(tokens) != 3 * n or b'#R' in text or b'##' in text:
+        return None
+    stamps = b''.join(tokens[0::3]).replace(b'(', b' ').replace(b')', b' ').replace(b'.', b' ').split()
+    parts = b'#'.join(tokens[2::3]).split(b'#')
+    if len(stamps) != 2 * n or len(parts) != 2 * n:
+        return None
+    fractions = stamps[1::2]
+    width = len(fractions[0])
+    frame_ids, data = parts[0::2], parts[1::2]
+    lengths = np.fromiter(map(len, data), dtype=np.int64, count=n)
+    if (width > 9 or (np.fromiter(map(len, fractions), dtype=np.int64, count=n) != width).any()
+            or (lengths & 1).any() or lengths.max(initial=0) > 2 * payload_size):
+        return None
+    try:
+        ids = {frame_id: int(frame_id, 16) | (CAN_EFF_FLAG if len(frame_id) == 8 else 0)
+               for frame_id in set(frame_ids)}
+        flat = np.frombuffer(bytes.fromhex(b''.join(data).decode('ascii')), dtype=np.uint8)
+        seconds = np.array(stamps[0::2]).astype(np.int64)
+        nanoseconds = np.array(fractions).astype(np.int64) * 10 ** (9 - width)
+    except ValueError:
+        return None
+    for interface in dict.fromkeys(tokens[1::3]):
+        channels.setdefault(interface, len(channels))
+
+    records = np.zeros(n, dtype=frame_dtype(payload_size))
+    records['timestamp_ns'] = seconds * 1000000000 + nanoseconds
+    records['can_id'] = [ids[frame_id] for frame_id in frame_ids]
+    records['channel'] = [channels[interface] for interface in tokens[1::3]]
+    dlc = lengths // 2
+    records['dlc'] = dlc
+    if (dlc == 8).all():
+        records['data'][:, :8] = flat.reshape(n, 8)
+    else:
+        # Scatter the variable-length payloads into the zero-padded data column
+        row = np.repeat(np.arange(n), dlc)
+        records['data'][row, np.arange(len(flat)) - np.repeat(np.cumsum(dlc) - dlc, dlc)] = flat
+    return records
+
+
+def read_candump(src: str, payload_size: int = 8, chunk_frames: int = CHUNK_FRAMES) -> Iterator[np.ndarray]:
+    """
+    Parse a candump -l log ("(1436509052.249713) can0 123#DEADBEEF") into
+    chunks of frame records. Interfaces become channels in order of first
+    appearance.
+    """
+    channels: Dict[bytes, int] = {}
+    buffer = _FrameBuffer(payload_size)
+    match_line = CANDUMP_RE.match
+    with open_stream(src, 'rb') as f:
+        while True:
+            lines = list(islice(f, chunk_frames))
+            if not lines:
+                return
+            records = _candump_records(lines, channels, payload_size)
+            if records is not None:
+                yield records
+                continue
+            for line in lines:
+                m = match_line(line)
+                if m is None:
+                    continue
+                seconds, fraction, interface, frame_id, rtr, fd_flags, fd_data, data = m.groups()
+                channel = channels.setdefault(interface, len(channels))
+                can_id = int(frame_id, 16)
+                if len(frame_id) == 8:
+                    can_id |= CAN_EFF_FLAG
+                if rtr:
+                    payload, flags = b'', FLAG_RTR
+                elif fd_flags is not None:
+                    payload = bytes.fromhex(fd_data.decode())
+                    flags = (FLAG_FD | (FLAG_BRS if int(fd_flags, 16) & 1 else 0)
+                             | (FLAG_ESI if int(fd_flags, 16) & 2 else 0))
+                else:
+                    payload, flags = bytes.fromhex(data.decode()), 0
+                buffer.add(_timestamp_ns(seconds, fraction), can_id, payload, flags, channel)
+            if len(buffer):
+                yield buffer.take()
+
+
+def import_candump(src: str, dst: str, payload_size: int = 8) -> int:
+    """Convert a candump -l log to a binary log, see read_candump()"""
+    with CanLogWriter(dst, payload_size) as writer:
+        for records in read_candump(src, payload_size):
+            writer.write_records(records)
+        return writer.frames_written
+
+
+def export_candump(src: str, dst: str, interface: str = 'can{channel}') -> int:
+    """Write a binary log as candump -l text; interface is formatted with the channel number"""
+    frames = CanLogReader(src).frames
+    with open_stream(dst, 'wt') as out:
+        for start in range(0, len(frames), CHUNK_FRAMES):
+            chunk = frames[start:start + CHUNK_FRAMES]
+            data_hex = chunk['data'].tobytes().hex().upper()
+            width = 2 * chunk['data'].shape[1]
+            lines = []
+            for i, (timestamp_ns, can_id, dlc, flags, channel) in enumerate(zip(
+                    chunk['timestamp_ns'].tolist(), chunk['can_id'].tolist(), chunk['dlc'].tolist(),
+                    chunk['flags'].tolist(), chunk['channel'].tolist())):
+                frame_id = (f"{can_id & CAN_EFF_MASK:08X}" if can_id & CAN_EFF_FLAG
+                            else f"{can_id & CAN_SFF_MASK:03X}")
+                data = data_hex[i * width:i * width + 2 * dlc]
+                if flags & FLAG_RTR:
+                    frame = f"{frame_id}#R"
+                elif flags & FLAG_FD:
+                    fd_flags = (1 if flags & FLAG_BRS else 0) | (2 if flags & FLAG_ESI else 0)
+                    frame = f"{frame_id}##{fd_flags:X}{data}"
+                else:
+                    frame = f"{frame_id}#{data}"
+                seconds, nanoseconds = divmod(timestamp_ns, 1000000000)
+                lines.append(f"({seconds}.{nanoseconds // 1000:06d}) {interface.format(channel=channel)} {frame}\n")
+            out.writelines(lines)
+    return len(frames)
+
+
+def _asc_start_time(line: bytes) -> Optional[int]:
+    """Epoch nanoseconds of an ASC 'date' header line, taken as local time"""
+    text = line.decode('ascii', 'replace').split(None, 1)[1].strip()
+    for fmt in ASC_DATE_FORMATS:
+        try:
+            return round(datetime.strptime(text, fmt).timestamp() * 1000000) * 1000
+        except ValueError:
+            continue
+    return None
+
+
+def read_asc(src: str, payload_size: int = 8, chunk_frames: int = CHUNK_FRAMES) -> Iterator[np.ndarray]:
+    """
+    Parse a Vector ASC log into chunks of frame records. CAN and CANFD data
+    and remote frames are read; events, error frames and statistics are
+    skipped. Timestamps are offset by the 'date' header; ASC channel 1 is
+    channel 0.
+    """
+    start_ns = 0
+    base = 16
+    relative = False
+    last_ns = 0
+    buffer = _FrameBuffer(payload_size)
+    with open_stream(src, 'rb') as f:
+        for line in f:
+            tokens = line.split()
+            if not tokens:
+                continue
+            if tokens[0] == b'date':
+                start_ns = _asc_start_time(line) or 0
+                continue
+            if tokens[0] == b'base':
+                base = 10 if tokens[1] == b'dec' else 16
+                relative = b'relative' in tokens
+                continue
+            if len(tokens) < 5 or not tokens[0][:1].isdigit() or b'.' not in tokens[0]:
+                continue
+
+            seconds, fraction = tokens[0].split(b'.', 1)
+            if tokens[1] == b'CANFD':
+                # time CANFD ch dir id [name] brs esi dlc length data...
+                if len(tokens) < 9:
+                    continue
+                channel, frame_id = tokens[2], tokens[4]
+                rest = tokens[5:] if tokens[5] in (b'0', b'1') else tokens[6:]
+                if len(rest) < 4 or not rest[3].isdigit() or len(rest) < 4 + int(rest[3]):
+                    continue
+                brs, esi, length = rest[0], rest[1], int(rest[3])
+                payload = bytes(int(byte, base) for byte in rest[4:4 + length])
+                flags = FLAG_FD | (FLAG_BRS if brs == b'1' else 0) | (FLAG_ESI if esi == b'1' else 0)
+            elif tokens[1].isdigit() and tokens[4] in (b'd', b'r'):
+                # time ch id dir d dlc data...
+                channel, frame_id = tokens[1], tokens[2]
+                if tokens[4] == b'r':
+                    payload, flags = b'', FLAG_RTR
+                else:
+                    if len(tokens) < 6 or len(tokens) < 6 + int(tokens[5], 16):
+                        continue
+                    dlc = int(tokens[5], 16)
+                    payload, flags = bytes(int(byte, base) for byte in tokens[6:6 + dlc]), 0
+            else:
+                continue
+
+            extended = frame_id.endswith(b'x')
+            can_id = int(frame_id.rstrip(b'x'), base) | (CAN_EFF_FLAG if extended else 0)
+            offset_ns = _timestamp_ns(seconds, fraction)
+            if relative:
+                last_ns += offset_ns
+                offset_ns = last_ns
+            buffer.add(start_ns + offset_ns, can_id, payload, flags, int(channel) - 1)
+            if len(buffer) >= chunk_frames:
+                yield buffer.take()
+    if len(buffer):
+        yield buffer.take()
+
+
+def import_asc(src: str, dst: str, payload_size: int = 8) -> int:
+    """Convert a Vector ASC log to a binary log, see read_asc()"""
+    with CanLogWriter(dst, payload_size) as writer:
+        for records in read_asc(src, payload_size):
+            writer.write_records(records)
+        return writer.frames_written
+
+
+def export_asc(src: str, dst: str) -> int:
+    """Write a binary log as a Vector ASC log with absolute hex timestamps"""
+    frames = CanLogReader(src).frames
+    # Offsets count from the first frame truncated to the header's millisecond precision
+    start_ns = int(frames['timestamp_ns'][0]) // 1000000 * 1000000 if len(frames) else 0
+    start = datetime.fromtimestamp(start_ns / 1e9)
+    date = f"{start:%a %b %d %I:%M:%S}.{start.microsecond // 1000:03d} {start.strftime('%p').lower()} {start:%Y}"
+    with open_stream(dst, 'wt') as out:
+        out.write(f"date {date}\nbase hex  timestamps absolute\nno internal events logged\n"
+                  f"Begin Triggerblock {date}\n   0.000000 Start of measurement\n")
+        for start_index in range(0, len(frames), CHUNK_FRAMES):
+            chunk = frames[start_index:start_index + CHUNK_FRAMES]
+            lines = []
+            for timestamp_ns, can_id, dlc, flags, channel, data in zip(
+                    chunk['timestamp_ns'].tolist(), chunk['can_id'].tolist(), chunk['dlc'].tolist(),
+                    chunk['flags'].tolist(), chunk['channel'].tolist(), chunk['data'].tolist()):
+                seconds = (timestamp_ns - start_ns) / 1e9
+                frame_id = (f"{can_id & CAN_EFF_MASK:X}x" if can_id & CAN_EFF_FLAG
+                            else f"{can_id & CAN_SFF_MASK:X}")
+                data_text = ' '.join(f"{byte:02X}" for byte in data[:dlc])
+                if flags & FLAG_FD:
+                    code = FD_LENGTHS.index(dlc) if dlc in FD_LENGTHS else 15
+                    lines.append(f"{seconds:11.6f} CANFD {channel + 1:3d} Rx {frame_id:>8} "
+                                 f"{1 if flags & FLAG_BRS else 0} {1 if flags & FLAG_ESI else 0} "
+                                 f"{code:X} {dlc:2d} {data_text}\n")
+                elif flags & FLAG_RTR:
+                    lines.append(f"{seconds:11.6f} {channel + 1}  {frame_id:<15} Rx   r\n")
+                else:
+                    lines.append(f"{seconds:11.6f} {channel + 1}  {frame_id:<15} Rx   d {dlc} {data_text}\n")
+            out.writelines(lines)
+        out.write("End TriggerBlock\n")
+    return len(frames)
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Convert between binary CAN logs and candump/ASC text logs; "
+                                                     "any file may end in .gz or .zst")
+    arg_parser.add_argument('command', choices=['import-candump', 'import-asc', 'export-candump', 'export-asc',
+                                                'info'])
+    arg_parser.add_argument('src')
+    arg_parser.add_argument('dst', nargs='?')
+    arg_parser.add_argument('--fd', action='store_true', help="Create a 64-byte payload log for CAN FD traffic")
+    args = arg_parser.parse_args(argv)
+
+    payload_size = 64 if args.fd else 8
+    if args.command == 'info':
+        frames = CanLogReader(args.src).frames
+        print(f"{len(frames)} frames, {frames.dtype.itemsize} bytes each")
+        if len(frames):
+            print(f"{np.unique(frames['can_id']).size} IDs, "
+                  f"{(frames['timestamp_ns'].max() - frames['timestamp_ns'].min()) / 1e9:.3f}s span")
+        return
+    if args.dst is None:
+        arg_parser.error(f"{args.command} needs a destination file")
+    convert = {
+        'import-candump': lambda: import_candump(args.src, args.dst, payload_size),
+        'import-asc': lambda: import_asc(args.src, args.dst, payload_size),
+        'export-candump': lambda: export_candump(args.src, args.dst),
+        'export-asc': lambda: export_asc(args.src, args.dst),
+    }[args.command]
+    print(f"✓ {convert()} frames written to {args.dst}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Transparent gzip/zstd file streams
+The codec comes from the file extension. When pigz or zstd is on PATH the
+(de)compression runs in that child process, multithreaded where the tool
+supports it and always in parallel with the parsing in this process;
+otherwise the gzip module or the zstandard package is used in-process.
+"""
+
+import gzip
+import io
+import os
+import shutil
+import signal
+import subprocess
+from typing import IO, List, Optional
+
+COMPRESSION_SUFFIXES = {'.gz': 'gzip', '.zst': 'zstd'}
+BUFFER_SIZE = 1024 * 1024
+
+
+def compression_of(path: str) -> Optional[str]:
+    """'gzip', 'zstd' or None for an uncompressed file"""
+    return COMPRESSION_SUFFIXES.get(os.path.splitext(path)[1].lower())
+
+
+def _command(codec: str, reading: bool, threads: int, level: Optional[int]) -> Optional[List[str]]:
+    """Command line of an external (de)compressor for the codec, if one is installed"""
+    tool = 'pigz' if codec == 'gzip' else 'zstd'
+    if shutil.which(tool) is None:
+        return None
+    if reading:
+        return [tool, '-d', '-c', '-q'] if tool == 'zstd' else [tool, '-d', '-c']
+    command = [tool, '-c']
+    if tool == 'zstd':
+        command += ['-q', f'-T{threads}']
+    else:
+        command += ['-p', str(threads or os.cpu_count())]
+    if level is not None:
+        command.append(f'-{level}')
+    return command
+
+
+class _ProcessFile(io.RawIOBase):
+    """Raw stream over the stdout (reading) or stdin (writing) of a (de)compressor process"""
+
+    def __init__(self, command: List[str], path: str, reading: bool):
+        self.path = path
+        self.command = command
+        self.reading = reading
+        # The file is opened here so a missing path raises the usual FileNotFoundError
+        self._file = open(path, 'rb' if reading else 'wb')
+        if reading:
+            self._process = subprocess.Popen(command, stdin=self._file, stdout=subprocess.PIPE)
+            self._pipe = self._process.stdout
+        else:
+            self._process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=self._file)
+            self._pipe = self._process.stdin
+
+    def readable(self) -> bool:
+        return self.reading
+
+    def writable(self) -> bool:
+        return not self.reading
+
+    def readinto(self, buffer) -> int:
+        return self._pipe.readinto(buffer)
+
+    def write(self, data) -> int:
+        self._pipe.write(data)
+        return len(data)
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self._pipe.close()
+            code = self._process.wait()
+            self._file.close()
+        finally:
+            super().close()
+        # A reader closed before the end stops the decompressor with SIGPIPE
+        if code and not (self.reading and code == -signal.SIGPIPE):
+            raise OSError(f"{self.command[0]} exited with status {code} on {self.path}")
+
+
+def open_stream(path: str, mode: str = 'rb', threads: int = 0, level: Optional[int] = None) -> IO:
+    """
+    Open a file for sequential reading ('rb', 'rt') or writing ('wb', 'wt'),
+    compressed or decompressed on the fly if it ends in .gz or .zst.
+    threads is the compressor thread count, 0 for every core; level the
+    compression level, None for the codec default. Streams cannot seek.
+    """
+    if mode not in ('rb', 'rt', 'wb', 'wt'):
+        raise ValueError(f"Unsupported mode {mode!r}, expected 'rb', 'rt', 'wb' or 'wt'")
+    reading = mode[0] == 'r'
+    codec = compression_of(path)
+    if codec is None:
+        stream = open(path, mode[0] + 'b')
+    else:
+        command = _command(codec, reading, threads, level)
+        if command is not None:
+            raw = _ProcessFile(command, path, reading)
+            stream = io.BufferedReader(raw, BUFFER_SIZE) if reading else io.BufferedWriter(raw, BUFFER_SIZE)
+        elif codec == 'gzip':
+            stream = gzip.open(path, mode[0] + 'b', **({} if level is None else {'compresslevel': level}))
+        else:
+            try:
+                import zstandard
+            except ImportError:
+                raise RuntimeError(f"{path} needs the zstd command or the zstandard package") from None
+            if reading:
+                stream = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+            else:
+                compressor = zstandard.ZstdCompressor(level=3 if level is None else level, threads=threads or -1)
+                stream = compressor.stream_writer(open(path, 'wb'), closefd=True)
+            stream = io.BufferedReader(stream, BUFFER_SIZE) if reading else io.BufferedWriter(stream, BUFFER_SIZE)
+    if mode[1] == 't':
+        return io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    return stream
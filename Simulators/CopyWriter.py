@@ -0,0 +1,267 @@
+"""
+PostgreSQL COPY writer for CAN message batches
+Streams rows through an in-memory buffer in text or binary COPY format,
+with an optional staging-table merge for ON CONFLICT handling
+"""
+
+import io
+import struct
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple, Union
+
+import numpy as np
+
+from MessageBatch import MessageBatch
+
+# Column name and wire type of can_messages, in MessageBatch.rows() order
+CAN_MESSAGE_COLUMNS: List[Tuple[str, str]] = [
+    ('timestamp', 'timestamptz'),
+    ('can_id', 'int4'),
+    ('signal_type', 'text'),
+    ('signal_name', 'text'),
+    ('raw_value', 'int8'),
+    ('physical_value', 'float8'),
+    ('unit', 'text'),
+    ('data_hex', 'text'),
+    ('vehicle_id', 'int4'),
+]
+
+# Raw frame column per payload mode: hex text, or BYTEA (sql/03_add_payload_bytea.sql)
+PAYLOAD_COLUMNS = {
+    'hex': ('data_hex', 'text'),
+    'bytea': ('payload', 'bytea'),
+}
+PAYLOAD_FORMATS = tuple(PAYLOAD_COLUMNS)
+
+COPY_FORMATS = ('text', 'binary')
+
+BINARY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('>ii', 0, 0)
+BINARY_TRAILER = struct.pack('>h', -1)
+PG_EPOCH = datetime(2000, 1, 1, tzinfo=timezone.utc)
+PG_EPOCH_UNIX_US = 946684800000000
+NULL_FIELD = struct.pack('>i', -1)
+
+_INT4 = struct.Struct('>ii')
+_INT8 = struct.Struct('>iq')
+_FLOAT8 = struct.Struct('>id')
+_FIELD_COUNT = struct.Struct('>h')
+_LENGTH = struct.Struct('>i')
+
+_TEXT_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def _to_int(value) -> int:
+    """Integers, or hex/decimal strings such as the simulator's '0x100' CAN IDs"""
+    return int(value, 0) if isinstance(value, str) else int(value)
+
+
+def _to_datetime(value) -> datetime:
+    """
+    Aware datetime; float/int are Unix epoch seconds and naive datetimes are
+    taken as local time, as in the binary encoding, rather than left to the
+    server's TimeZone setting
+    """
+    if isinstance(value, datetime):
+        return value.astimezone() if value.tzinfo is None else value
+    return datetime.fromtimestamp(value, timezone.utc)
+
+
+def _pg_microseconds(value) -> int:
+    """Microseconds since 2000-01-01 UTC; naive datetimes are taken as local time"""
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.astimezone()
+        delta = value - PG_EPOCH
+        return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+    return round(value * 1000000) - PG_EPOCH_UNIX_US
+
+
+def can_message_columns(payload_format: str = 'hex') -> List[Tuple[str, str]]:
+    """can_messages columns with the raw frame stored in the given payload mode"""
+    if payload_format not in PAYLOAD_COLUMNS:
+        raise ValueError(f"Unknown payload format {payload_format!r}, expected one of {PAYLOAD_FORMATS}")
+    return [PAYLOAD_COLUMNS[payload_format] if name == 'data_hex' else (name, pg_type)
+            for name, pg_type in CAN_MESSAGE_COLUMNS]
+
+
+class CopyWriter:
+    """Encodes row tuples into a COPY stream and loads them through a cursor"""
+
+    def __init__(self, table: str = 'can_messages',
+                 columns: Sequence[Tuple[str, str]] = CAN_MESSAGE_COLUMNS,
+                 fmt: str = 'binary'):
+        if fmt not in COPY_FORMATS:
+            raise ValueError(f"Unknown COPY format {fmt!r}, expected one of {COPY_FORMATS}")
+        self.table = table
+        self.columns = list(columns)
+        self.fmt = fmt
+        self.column_list = ', '.join(name for name, _ in self.columns)
+        # Payload mode of a standard can_messages layout; MessageBatch encoding depends on it
+        self.payload_format = next(
+            (fmt for fmt in PAYLOAD_FORMATS if self.columns == can_message_columns(fmt)), None)
+        # Repeated strings (signal names, units, ...) are encoded once
+        self._text_cache: Dict[str, bytes] = {}
+        encoders = self._binary_encoder if fmt == 'binary' else self._text_encoder
+        self._encoders: List[Callable] = [encoders(pg_type) for _, pg_type in self.columns]
+
+    def _binary_encoder(self, pg_type: str) -> Callable:
+        """Return a function producing the length-prefixed binary field"""
+        if pg_type == 'timestamptz':
+            # Rows of one tick share a timestamp; convert it once
+            last = [None, None]
+
+            def encode_timestamp(v):
+                if v != last[0]:
+                    last[0], last[1] = v, _INT8.pack(8, _pg_microseconds(v))
+                return last[1]
+            return encode_timestamp
+        if pg_type == 'int4':
+            return lambda v: _INT4.pack(4, v if type(v) is int else _to_int(v))
+        if pg_type == 'int8':
+            return lambda v: _INT8.pack(8, v if type(v) is int else _to_int(v))
+        if pg_type == 'float8':
+            return lambda v: _FLOAT8.pack(8, v)
+        if pg_type == 'bytea':
+            return lambda v: _LENGTH.pack(len(v)) + bytes(v)
+        if pg_type == 'text':
+            cache = self._text_cache
+
+            def encode_text(v):
+                field = cache.get(v)
+                if field is None:
+                    data = v.encode('utf-8')
+                    field = _LENGTH.pack(len(data)) + data
+                    if len(cache) < 10000:
+                        cache[v] = field
+                return field
+            return encode_text
+        raise ValueError(f"Unsupported column type {pg_type!r}")
+
+    def _text_encoder(self, pg_type: str) -> Callable:
+        """Return a function producing the escaped text field"""
+        if pg_type == 'timestamptz':
+            return lambda v: _to_datetime(v).isoformat(' ')
+        if pg_type in ('int4', 'int8'):
+            return lambda v: str(_to_int(v))
+        if pg_type == 'float8':
+            return lambda v: repr(float(v))
+        if pg_type == 'bytea':
+            return lambda v: '\\\\x' + bytes(v).hex()
+        if pg_type == 'text':
+            return lambda v: v.translate(_TEXT_ESCAPES)
+        raise ValueError(f"Unsupported column type {pg_type!r}")
+
+    def encode(self, rows: Union[Iterable[Sequence], MessageBatch]) -> io.IOBase:
+        """Serialize rows, or a MessageBatch, into a rewound in-memory COPY buffer"""
+        if isinstance(rows, MessageBatch):
+            if self.fmt == 'binary' and self.payload_format:
+                return io.BytesIO(self._encode_batch_binary(rows))
+            rows = rows.rows(self.payload_format or 'hex')
+        encoders = self._encoders
+        if self.fmt == 'binary':
+            field_count = _FIELD_COUNT.pack(len(encoders))
+            parts = [BINARY_HEADER]
+            append = parts.append
+            for row in rows:
+                append(field_count)
+                for encode, value in zip(encoders, row):
+                    append(NULL_FIELD if value is None else encode(value))
+            append(BINARY_TRAILER)
+            return io.BytesIO(b''.join(parts))
+
+        lines = [
+            '\t'.join('\\N' if value is None else encode(value) for encode, value in zip(encoders, row))
+            for row in rows
+        ]
+        lines.append('')
+        return io.StringIO('\n'.join(lines))
+
+    def _encode_batch_binary(self, batch: MessageBatch) -> bytes:
+        """
+        Binary COPY of a MessageBatch without per-row Python work. Rows of
+        one signal have identical field lengths, so each signal's rows are
+        written as a packed record array whose string fields are constants.
+        """
+        n = len(batch)
+        timestamps = batch.timestamps[:n] - PG_EPOCH_UNIX_US
+        if self.payload_format == 'bytea':
+            payload_field, payload_len = ('payload', 'u1', (8,)), 8
+            payloads = batch.payload[:n]
+        else:
+            payload_field, payload_len = ('payload', 'S16'), 16
+            payloads = batch.hex_digits().view('S16').ravel()
+        signal_index = batch.signal_index[:n]
+        order = np.argsort(signal_index, kind='stable')
+        unique, starts, counts = np.unique(signal_index[order], return_index=True, return_counts=True)
+
+        encode_text = self._binary_encoder('text')
+        parts = [BINARY_HEADER]
+        for sig, start, count in zip(unique.tolist(), starts, counts):
+            rows = order[start:start + count]
+            signal_type, signal_name, unit = batch.signals.entries[sig]
+            names = encode_text(signal_type) + encode_text(signal_name)
+            unit = encode_text(unit)
+            records = np.empty(count, dtype=[
+                ('fields', '>i2'),
+                ('timestamp_len', '>i4'), ('timestamp', '>i8'),
+                ('can_id_len', '>i4'), ('can_id', '>i4'),
+                ('names', f'S{len(names)}'),
+                ('raw_len', '>i4'), ('raw', '>i8'),
+                ('physical_len', '>i4'), ('physical', '>f8'),
+                ('unit', f'S{len(unit)}'),
+                ('payload_len', '>i4'), payload_field,
+                ('vehicle_id_len', '>i4'), ('vehicle_id', '>i4'),
+            ])
+            records['fields'] = len(CAN_MESSAGE_COLUMNS)
+            records['timestamp_len'] = 8
+            records['timestamp'] = timestamps[rows]
+            records['can_id_len'] = 4
+            records['can_id'] = batch.can_ids[rows]
+            records['names'] = names
+            records['raw_len'] = 8
+            records['raw'] = batch.raw[rows]
+            records['physical_len'] = 8
+            records['physical'] = batch.physical[rows]
+            records['unit'] = unit
+            records['payload_len'] = payload_len
+            records['payload'] = payloads[rows]
+            records['vehicle_id_len'] = 4
+            records['vehicle_id'] = batch.vehicle_ids[rows]
+            parts.append(records.tobytes())
+        parts.append(BINARY_TRAILER)
+        return b''.join(parts)
+
+    def copy_sql(self, table: str) -> str:
+        options = ' WITH (FORMAT binary)' if self.fmt == 'binary' else ''
+        return f"COPY {table} ({self.column_list}) FROM STDIN{options}"
+
+    def copy(self, cur, rows: Union[Sequence[Sequence], MessageBatch]) -> int:
+        """COPY rows straight into the table. Duplicate keys abort the whole batch."""
+        if not rows:
+            return 0
+        cur.copy_expert(self.copy_sql(self.table), self.encode(rows))
+        return len(rows)
+
+    def copy_merge(self, cur, rows: Union[Sequence[Sequence], MessageBatch], conflict: str = 'DO NOTHING') -> int:
+        """
+        COPY rows into a session-local staging table, then merge them with
+        INSERT ... SELECT ... ON CONFLICT, which COPY itself cannot express.
+        Returns the number of rows actually inserted.
+        """
+        if not rows:
+            return 0
+        staging = f"{self.table}_staging"
+        cur.execute(f"""
+            CREATE TEMP TABLE IF NOT EXISTS {staging}
+            (LIKE {self.table} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS
+        """)
+        cur.copy_expert(self.copy_sql(staging), self.encode(rows))
+        cur.execute(f"""
+            INSERT INTO {self.table} ({self.column_list})
+            SELECT {self.column_list} FROM {staging}
+            ON CONFLICT {conflict}
+        """)
+        inserted = cur.rowcount
+        # Keep the staging table empty even if the caller batches several merges per commit
+        cur.execute(f"TRUNCATE {staging}")
+        return inserted
@@ -3,12 +3,52 @@ DBC (CAN Database) file parser
 Reads signal definitions and generates code/documentation
 """
 
+import gc
+import hashlib
+import io
+import os
+import pickle
 import re
-from dataclasses import dataclass
-from typing import List, Dict, Optional
+import struct
+import tempfile
+import types
+from dataclasses import dataclass, field, fields
+from typing import List, Dict, Iterable, Optional, Tuple
 from pathlib import Path
 
 
+# Bump whenever parsing output changes so stale caches are rebuilt
+PARSER_VERSION = 2
+CACHE_MAGIC = b'DBCCACHE'
+CACHE_HEADER = struct.Struct('<8sH32s')  # magic, parser version, sha256 of the DBC
+
+# Signal: SG_ Name [M|mN] : StartBit|Length@ByteOrder+ (Scale,Offset) [Min|Max] "Unit" Receivers
+SIGNAL_RE = re.compile(
+    r'SG_\s+(\w+)\s*(M|m\d+M?)?\s*:\s*(\d+)\|(\d+)@([01])([+-])\s*'
+    r'\(([^,]+),([^)]+)\)\s*\[([^|]+)\|([^\]]+)\]\s*"([^"]*)"\s*(.*)'
+)
+MESSAGE_RE = re.compile(r'BO_\s+(\d+)\s+(\w+)\s*:\s*(\d+)\s+(\w+)')
+# Object reference shared by CM_ and BA_: BO_ id | SG_ id name | BU_ node | EV_ name
+OBJECT_RE = r'(?:(BO_)\s+(\d+)|(SG_)\s+(\d+)\s+(\w+)|BU_\s+\w+|EV_\s+\w+)?'
+COMMENT_RE = re.compile(r'CM_\s+' + OBJECT_RE + r'\s*"((?:[^"\\]|\\.)*)"\s*;', re.DOTALL)
+ATTRIBUTE_RE = re.compile(r'BA_\s+"(\w+)"\s+' + OBJECT_RE + r'\s*(.*?)\s*;\s*$', re.DOTALL)
+VALUE_TABLE_RE = re.compile(r'VAL_\s+(\d+)\s+(\w+)\s+(.*?);\s*$', re.DOTALL)
+NODES_RE = re.compile(r'BU_\s*:')
+VALUE_ENTRY_RE = re.compile(r'(-?\d+)\s+"((?:[^"\\]|\\.)*)"')
+
+
+def _count_quotes(text: str) -> int:
+    """Count unescaped double quotes"""
+    return text.count('"') - text.count('\\"')
+
+
+def _unquote(text: str) -> str:
+    """Strip surrounding quotes and unescape a DBC string literal"""
+    if len(text) >= 2 and text[0] == '"' and text[-1] == '"':
+        text = text[1:-1]
+    return text.replace('\\"', '"')
+
+
 @dataclass
 class CANSignal:
     """Represents a CAN signal definition"""
@@ -23,6 +63,10 @@ class CANSignal:
     max_value: float
     unit: str
     receivers: List[str]
+    multiplexer: Optional[str] = None  # 'M' for the multiplexor, 'mN' for muxed signals
+    comment: Optional[str] = None
+    choices: Optional[Dict[int, str]] = None  # VAL_ descriptions
+    attributes: Dict[str, str] = field(default_factory=dict)
     
     def raw_to_physical(self, raw_value: int) -> float:
         """Convert raw CAN value to physical value"""
@@ -31,6 +75,29 @@ class CANSignal:
     def physical_to_raw(self, physical_value: float) -> int:
         """Convert physical value to raw CAN value"""
         return int((physical_value - self.offset) / self.scale)
+    
+    def bit_layout(self, frame_bytes: int = 8) -> Tuple[int, int]:
+        """
+        Locate the signal in a frame read as a single integer.
+        Returns (shift, mask): Intel signals index the little-endian
+        integer of the frame, Motorola signals the big-endian one.
+        """
+        if self.byte_order == 'little_endian':
+            shift = self.start_bit
+        else:
+            # Motorola start bit is the MSB in sawtooth numbering
+            msb = (frame_bytes - 1 - self.start_bit // 8) * 8 + self.start_bit % 8
+            shift = msb - self.length + 1
+        if shift < 0 or shift + self.length > frame_bytes * 8:
+            raise ValueError(f"Signal {self.name} does not fit in {frame_bytes} bytes")
+        return shift, (1 << self.length) - 1
+    
+    @property
+    def multiplexer_value(self) -> Optional[int]:
+        """Multiplexor value selecting this signal, None unless it is multiplexed"""
+        if self.multiplexer and self.multiplexer[0] == 'm':
+            return int(self.multiplexer[1:].rstrip('M'))
+        return None
 
 
 @dataclass
@@ -43,140 +110,262 @@ class CANMessage:
     signals: List[CANSignal]
     cycle_time: Optional[int] = None  # milliseconds
     comment: Optional[str] = None
+    attributes: Dict[str, str] = field(default_factory=dict)
+
+
+# Field order used to flatten the model into plain tuples for the cache
+SIGNAL_FIELDS = [f.name for f in fields(CANSignal)]
+MESSAGE_FIELDS = [f.name for f in fields(CANMessage)]
 
 
 class DBCParser:
     """Parser for DBC files"""
     
-    def __init__(self, dbc_file: str):
+    def __init__(self, dbc_file: str, use_cache: bool = True, cache_dir: Optional[str] = None):
         self.dbc_file = Path(dbc_file)
         self.messages: Dict[int, CANMessage] = {}
         self.nodes: List[str] = []
+        self.use_cache = use_cache
+        self.cache_dir = Path(cache_dir) if cache_dir else self.dbc_file.parent
         
+    @property
+    def cache_file(self) -> Path:
+        """Compiled cache location: next to the DBC unless cache_dir is given"""
+        return self.cache_dir / f"{self.dbc_file.name}.cache"
+    
     def parse(self):
-        """Parse the DBC file"""
+        """Parse the DBC file, reusing the compiled cache when it is current"""
         if not self.dbc_file.exists():
             raise FileNotFoundError(f"DBC file not found: {self.dbc_file}")
         
-        with open(self.dbc_file, 'r') as f:
-            content = f.read()
+        if not self.use_cache:
+            with open(self.dbc_file, 'r') as f:
+                self._parse_lines(f)
+            print(f"Parsed {len(self.messages)} messages from {self.dbc_file.name}")
+            return self.messages
         
-        self._parse_nodes(content)
-        self._parse_messages(content)
-        self._parse_comments(content)
-        self._parse_attributes(content)
+        content = self.dbc_file.read_bytes()
+        digest = hashlib.sha256(content).digest()
+        if self._load_cache(digest):
+            print(f"Loaded {len(self.messages)} messages from {self.cache_file.name}")
+            return self.messages
         
+        # Same decoding as open(..., 'r')
+        self._parse_lines(io.TextIOWrapper(io.BytesIO(content)))
         print(f"Parsed {len(self.messages)} messages from {self.dbc_file.name}")
+        self._write_cache(digest)
         return self.messages
     
-    def _parse_nodes(self, content: str):
-        """Parse network nodes (ECUs)"""
-        match = re.search(r'BU_:\s*(.+)', content)
-        if match:
-            self.nodes = match.group(1).split()
+    def _load_cache(self, digest: bytes) -> bool:
+        """Load messages/nodes from the cache; False if missing, stale or corrupt"""
+        # Collector passes over ~1M freshly unpickled objects dominate load time
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            with open(self.cache_file, 'rb') as f:
+                magic, version, cached_digest = CACHE_HEADER.unpack(f.read(CACHE_HEADER.size))
+                if magic != CACHE_MAGIC or version != PARSER_VERSION or cached_digest != digest:
+                    return False
+                nodes, records = pickle.load(f)
+            messages = {}
+            for record in records:
+                message = CANMessage(*record)
+                message.signals = [CANSignal(*sig) for sig in message.signals]
+                messages[message.message_id] = message
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            print(f"Ignoring unreadable DBC cache {self.cache_file}: {e}")
+            return False
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        
+        self.messages = messages
+        self.nodes = nodes
+        return True
     
-    def _parse_messages(self, content: str):
-        """Parse message and signal definitions"""
-        # Match message definitions
-        msg_pattern = r'BO_\s+(\d+)\s+(\w+):\s*(\d+)\s+(\w+)'
-        
-        for msg_match in re.finditer(msg_pattern, content):
-            msg_id = int(msg_match.group(1))
-            msg_name = msg_match.group(2)
-            dlc = int(msg_match.group(3))
-            sender = msg_match.group(4)
-            
-            # Find signals for this message
-            signals = self._parse_signals(content, msg_match.end())
-            
-            message = CANMessage(
-                message_id=msg_id,
-                name=msg_name,
-                dlc=dlc,
-                sender=sender,
-                signals=signals
-            )
-            
-            self.messages[msg_id] = message
+    def _cache_records(self) -> list:
+        """Flatten messages to tuples of builtins, which pickle far faster than dataclasses"""
+        records = []
+        for msg in self.messages.values():
+            record = [getattr(msg, name) for name in MESSAGE_FIELDS]
+            record[MESSAGE_FIELDS.index('signals')] = [
+                tuple(getattr(sig, name) for name in SIGNAL_FIELDS) for sig in msg.signals
+            ]
+            records.append(tuple(record))
+        return records
     
-    def _parse_signals(self, content: str, start_pos: int) -> List[CANSignal]:
-        """Parse signals within a message"""
-        signals = []
-        
-        # Signal pattern: SG_ SignalName : StartBit|Length@ByteOrder+ (Scale,Offset) [Min|Max] "Unit" Receivers
-        sig_pattern = r'SG_\s+(\w+)\s*:\s*(\d+)\|(\d+)@([01])([+-])\s*\(([^,]+),([^)]+)\)\s*\[([^|]+)\|([^\]]+)\]\s*"([^"]*)"\s*(.+)'
+    def _write_cache(self, digest: bytes):
+        """Atomically replace the cache; failures only cost the next startup"""
+        tmp_path = None
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile('wb', dir=self.cache_dir, delete=False,
+                                             prefix=f".{self.dbc_file.name}.") as f:
+                tmp_path = f.name
+                f.write(CACHE_HEADER.pack(CACHE_MAGIC, PARSER_VERSION, digest))
+                pickle.dump((self.nodes, self._cache_records()), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, self.cache_file)
+        except OSError as e:
+            print(f"Could not write DBC cache {self.cache_file}: {e}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+    
+    def _parse_lines(self, lines: Iterable[str]):
+        """
+        Single pass over the file. SG_ lines attach to the preceding BO_;
+        CM_/BA_/VAL_ statements are buffered until their closing ';' since
+        comment strings may span several lines.
+        """
+        current: Optional[CANMessage] = None
+        signal_index: Dict[Tuple[int, str], CANSignal] = {}
+        pending: Optional[List[str]] = None
+        quotes = 0
         
-        # Find all signals starting from current position
-        pos = start_pos
-        while True:
-            match = re.search(sig_pattern, content[pos:pos+500])
-            if not match:
-                break
+        for lineno, line in enumerate(lines, 1):
+            if pending is not None:
+                pending.append(line)
+                quotes += _count_quotes(line)
+                if quotes % 2 == 0 and line.rstrip().endswith(';'):
+                    self._parse_statement(''.join(pending), signal_index)
+                    pending = None
+                continue
             
-            name = match.group(1)
-            start_bit = int(match.group(2))
-            length = int(match.group(3))
-            byte_order = 'big_endian' if match.group(4) == '0' else 'little_endian'
-            value_type = 'signed' if match.group(5) == '-' else 'unsigned'
-            scale = float(match.group(6))
-            offset = float(match.group(7))
-            min_val = float(match.group(8))
-            max_val = float(match.group(9))
-            unit = match.group(10)
-            receivers = match.group(11).strip().split(',')
+            stripped = line.strip()
+            if not stripped:
+                continue
             
-            signal = CANSignal(
-                name=name,
-                start_bit=start_bit,
-                length=length,
-                byte_order=byte_order,
-                value_type=value_type,
-                scale=scale,
-                offset=offset,
-                min_value=min_val,
-                max_value=max_val,
-                unit=unit,
-                receivers=[r.strip() for r in receivers]
-            )
+            if stripped.startswith('SG_ '):
+                if current is None:
+                    continue
+                signal = self._parse_signal(stripped, lineno)
+                current.signals.append(signal)
+                signal_index[(current.message_id, signal.name)] = signal
+                continue
             
-            signals.append(signal)
-            pos += match.end()
-            
-            # Check if next line is another signal or new message
-            next_line = content[pos:pos+100].strip()
-            if not next_line.startswith('SG_'):
-                break
+            current = None
+            if stripped.startswith('BO_ '):
+                current = self._parse_message(stripped, lineno)
+            elif NODES_RE.match(stripped):
+                self.nodes = stripped.partition(':')[2].split()
+            elif stripped.startswith(('CM_ ', 'BA_ ', 'VAL_ ')):
+                quotes = _count_quotes(stripped)
+                if quotes % 2 == 0 and stripped.endswith(';'):
+                    self._parse_statement(stripped, signal_index)
+                else:
+                    pending = [line]
+    
+    def _parse_message(self, line: str, lineno: int) -> CANMessage:
+        """Parse a BO_ message definition"""
+        match = MESSAGE_RE.match(line)
+        if not match:
+            raise ValueError(f"{self.dbc_file.name}:{lineno}: malformed message definition")
         
-        return signals
+        message = CANMessage(
+            message_id=int(match.group(1)),
+            name=match.group(2),
+            dlc=int(match.group(3)),
+            sender=match.group(4),
+            signals=[]
+        )
+        self.messages[message.message_id] = message
+        return message
     
-    def _parse_comments(self, content: str):
-        """Parse message and signal comments"""
-        # Message comments: CM_ BO_ MessageID "Comment";
-        msg_comment_pattern = r'CM_\s+BO_\s+(\d+)\s+"([^"]+)"'
-        for match in re.finditer(msg_comment_pattern, content):
-            msg_id = int(match.group(1))
-            comment = match.group(2)
-            if msg_id in self.messages:
-                self.messages[msg_id].comment = comment
+    def _parse_signal(self, line: str, lineno: int) -> CANSignal:
+        """Parse an SG_ signal definition"""
+        match = SIGNAL_RE.match(line)
+        if not match:
+            raise ValueError(f"{self.dbc_file.name}:{lineno}: malformed signal definition")
+        
+        (name, multiplexer, start_bit, length, byte_order, sign,
+         scale, offset, min_val, max_val, unit, receivers) = match.groups()
+        return CANSignal(
+            name=name,
+            start_bit=int(start_bit),
+            length=int(length),
+            byte_order='big_endian' if byte_order == '0' else 'little_endian',
+            value_type='signed' if sign == '-' else 'unsigned',
+            scale=float(scale),
+            offset=float(offset),
+            min_value=float(min_val),
+            max_value=float(max_val),
+            unit=unit,
+            receivers=receivers.replace(',', ' ').split(),
+            multiplexer=multiplexer
+        )
     
-    def _parse_attributes(self, content: str):
-        """Parse message attributes (like cycle time)"""
-        # Cycle time: BA_ "GenMsgCycleTime" BO_ MessageID Value;
-        cycle_pattern = r'BA_\s+"GenMsgCycleTime"\s+BO_\s+(\d+)\s+(\d+)'
-        for match in re.finditer(cycle_pattern, content):
-            msg_id = int(match.group(1))
-            cycle_time = int(match.group(2))
-            if msg_id in self.messages:
-                self.messages[msg_id].cycle_time = cycle_time
+    def _parse_statement(self, text: str, signal_index: Dict[Tuple[int, str], CANSignal]):
+        """Parse a complete CM_, BA_ or VAL_ statement"""
+        if text.startswith('CM_'):
+            match = COMMENT_RE.match(text)
+            if not match:
+                return
+            comment = match.group(6).replace('\\"', '"')
+            if match.group(1):
+                message = self.messages.get(int(match.group(2)))
+                if message:
+                    message.comment = comment
+            elif match.group(3):
+                signal = signal_index.get((int(match.group(4)), match.group(5)))
+                if signal:
+                    signal.comment = comment
+        
+        elif text.startswith('BA_'):
+            match = ATTRIBUTE_RE.match(text)
+            if not match:
+                return
+            name, value = match.group(1), _unquote(match.group(7))
+            if match.group(2):
+                message = self.messages.get(int(match.group(3)))
+                if message:
+                    message.attributes[name] = value
+                    if name == 'GenMsgCycleTime':
+                        message.cycle_time = int(float(value))
+            elif match.group(4):
+                signal = signal_index.get((int(match.group(5)), match.group(6)))
+                if signal:
+                    signal.attributes[name] = value
+        
+        elif text.startswith('VAL_'):
+            match = VALUE_TABLE_RE.match(text)
+            if not match:
+                return
+            signal = signal_index.get((int(match.group(1)), match.group(2)))
+            if signal:
+                signal.choices = {
+                    int(raw): desc.replace('\\"', '"')
+                    for raw, desc in VALUE_ENTRY_RE.findall(match.group(3))
+                }
     
     def generate_python_code(self, output_file: str):
         """Generate Python code for signal encoding/decoding"""
+        code = self.generate_python_source()
+        
+        # Write to file
+        with open(output_file, 'w') as f:
+            f.write(code)
+        
+        print(f"Generated Python code: {output_file}")
+    
+    def compile_codecs(self) -> types.ModuleType:
+        """Build the generated encoders/decoders in memory, without writing a file"""
+        module = types.ModuleType(f"{self.dbc_file.stem}_codecs")
+        source = self.generate_python_source()
+        exec(compile(source, f"<generated from {self.dbc_file.name}>", 'exec'), module.__dict__)
+        return module
+    
+    def generate_python_source(self) -> str:
+        """Source of the generated encoder/decoder module"""
         code = """# Auto-generated from DBC file
 # CAN Signal Encoders/Decoders
 
 import struct
 from enum import Enum
 
+_from_bytes = int.from_bytes
+
 """
         
         # Generate enum for message IDs
@@ -187,51 +376,204 @@ from enum import Enum
         
         # Generate signal classes
         for msg in self.messages.values():
+            layout = self._codec_layout(msg)
             code += f"class {msg.name}:\n"
             code += f'    """Message: {msg.name} (ID: 0x{msg.message_id:03X})"""\n'
             if msg.comment:
-                code += f'    # {msg.comment}\n'
+                comment = ' '.join(msg.comment.split())
+                code += f'    # {comment}\n'
             code += f"    MSG_ID = 0x{msg.message_id:03X}\n"
             code += f"    DLC = {msg.dlc}\n"
             if msg.cycle_time:
                 code += f"    CYCLE_TIME_MS = {msg.cycle_time}\n"
+            code += f"    SIGNALS = {tuple(sig.name for sig, _, _ in layout)!r}\n"
+            code += "\n"
+            code += self._generate_encoder(msg, layout)
+            code += self._generate_decoders(msg, layout)
             code += "\n"
-            
-            # Encode method
-            code += "    @staticmethod\n"
-            code += "    def encode("
-            params = [f"{sig.name}: float" for sig in msg.signals]
-            code += ", ".join(params)
-            code += ") -> bytes:\n"
-            code += '        """Encode signals into CAN frame"""\n'
-            code += "        data = bytearray(8)\n"
-            
-            for sig in msg.signals:
-                code += f"        # {sig.name} ({sig.unit})\n"
-                code += f"        raw_{sig.name} = int(({sig.name} - {sig.offset}) / {sig.scale})\n"
-                code += f"        # TODO: Pack into data at bit {sig.start_bit}\n"
-            
-            code += "        return bytes(data)\n\n"
-            
-            # Decode method
-            code += "    @staticmethod\n"
-            code += "    def decode(data: bytes) -> dict:\n"
-            code += '        """Decode CAN frame into signals"""\n'
-            code += "        signals = {}\n"
-            
-            for sig in msg.signals:
-                code += f"        # {sig.name}\n"
-                code += f"        # TODO: Extract from data at bit {sig.start_bit}\n"
-                code += f"        raw_value = 0  # Extract {sig.length} bits\n"
-                code += f"        signals['{sig.name}'] = (raw_value * {sig.scale}) + {sig.offset}\n"
-            
-            code += "        return signals\n\n\n"
         
-        # Write to file
-        with open(output_file, 'w') as f:
-            f.write(code)
+        # Dispatch table for frame-by-frame decoding
+        code += "DECODERS = {\n"
+        for msg in self.messages.values():
+            code += f"    0x{msg.message_id:03X}: {msg.name}.decode,\n"
+        code += "}\n"
+        return code
+    
+    @staticmethod
+    def _codec_layout(msg: CANMessage) -> List[Tuple[CANSignal, int, int]]:
+        """
+        (signal, shift, mask) of every signal the generated codec handles.
+        Signals outside the message's dlc bytes, e.g. those of Vector's
+        dlc 0 VECTOR__INDEPENDENT_SIG_MSG, are skipped with a warning, as
+        are multiplexed signals of a message without a usable multiplexor.
+        """
+        layout = []
+        for sig in msg.signals:
+            try:
+                shift, mask = sig.bit_layout(msg.dlc)
+            except ValueError:
+                print(f"Skipping signal {msg.name}.{sig.name}: does not fit in {msg.dlc} bytes")
+                continue
+            layout.append((sig, shift, mask))
+        if not any(sig.multiplexer == 'M' for sig, _, _ in layout):
+            for sig, _, _ in layout:
+                if sig.multiplexer_value is not None:
+                    print(f"Skipping signal {msg.name}.{sig.name}: no multiplexor selects it")
+            layout = [entry for entry in layout if entry[0].multiplexer_value is None]
+        return layout
+    
+    @staticmethod
+    def _multiplexing(layout: List[Tuple[CANSignal, int, int]]):
+        """
+        Split a codec layout into the multiplexor entry (None if the message
+        is not multiplexed), the entries present in every frame, and the
+        multiplexed entries grouped by the multiplexor value selecting them
+        """
+        selector = next((entry for entry in layout if entry[0].multiplexer == 'M'), None)
+        always = []
+        branches: Dict[int, List[Tuple[CANSignal, int, int]]] = {}
+        for entry in layout:
+            value = entry[0].multiplexer_value
+            if value is None:
+                always.append(entry)
+            else:
+                branches.setdefault(value, []).append(entry)
+        return selector, always, branches
+    
+    @staticmethod
+    def _sign_extend(expr: str, sig: CANSignal) -> str:
+        """Branchless two's complement sign extension of a masked raw value"""
+        if sig.value_type != 'signed':
+            return expr
+        sign = 1 << (sig.length - 1)
+        return f"(({expr}) ^ 0x{sign:X}) - 0x{sign:X}"
+    
+    def _generate_encoder(self, msg: CANMessage, layout: List[Tuple[CANSignal, int, int]]) -> str:
+        """
+        Emit a straight-line encode() packing every signal with precomputed
+        shifts. Multiplexed signals are packed only when the multiplexor
+        value selects them; the others are ignored.
+        """
+        code = "    @staticmethod\n"
+        code += "    def encode("
+        params = [f"{sig.name}: float" for sig, _, _ in layout]
+        code += ", ".join(params)
+        code += ") -> bytes:\n"
+        code += '        """Encode signals into CAN frame"""\n'
         
-        print(f"Generated Python code: {output_file}")
+        def pack(sig: CANSignal, shift: int, mask: int, indent: str) -> Tuple[str, str]:
+            """Lines computing the raw value, and the term placing it in the frame integer"""
+            lines = f"{indent}# {sig.name} ({sig.unit})\n"
+            lines += f"{indent}raw_{sig.name} = round(({sig.name} - {sig.offset}) / {sig.scale})\n"
+            return lines, f"((raw_{sig.name} & 0x{mask:X}) << {shift})"
+        
+        selector, always, branches = self._multiplexing(layout)
+        intel, motorola = [], []
+        for sig, shift, mask in always:
+            lines, term = pack(sig, shift, mask, "        ")
+            code += lines
+            (intel if sig.byte_order == 'little_endian' else motorola).append(term)
+        
+        if not branches:
+            le = " | ".join(intel) or "0"
+            if motorola:
+                be = " | ".join(motorola)
+                code += f"        _be = {be}\n"
+                le = f"{le} | _from_bytes(_be.to_bytes({msg.dlc}, 'big'), 'little')"
+            code += f"        return ({le}).to_bytes({msg.dlc}, 'little')\n\n"
+            return code
+        
+        has_motorola = any(sig.byte_order == 'big_endian' for sig, _, _ in layout)
+        code += f"        _le = {' | '.join(intel) or '0'}\n"
+        if has_motorola:
+            code += f"        _be = {' | '.join(motorola) or '0'}\n"
+        # Compare the value the frame will carry, as the decoder reads it back
+        sel, _, sel_mask = selector
+        code += f"        _mux = {self._sign_extend(f'raw_{sel.name} & 0x{sel_mask:X}', sel)}\n"
+        keyword = "if"
+        for value, entries in branches.items():
+            code += f"        {keyword} _mux == {value}:\n"
+            for sig, shift, mask in entries:
+                lines, term = pack(sig, shift, mask, "            ")
+                code += lines
+                code += f"            {'_le' if sig.byte_order == 'little_endian' else '_be'} |= {term}\n"
+            keyword = "elif"
+        le = "_le"
+        if has_motorola:
+            le = f"_le | _from_bytes(_be.to_bytes({msg.dlc}, 'big'), 'little')"
+        code += f"        return ({le}).to_bytes({msg.dlc}, 'little')\n\n"
+        return code
+    
+    def _generate_decoders(self, msg: CANMessage, layout: List[Tuple[CANSignal, int, int]]) -> str:
+        """
+        Emit decode_raw() and decode() extracting signals with precomputed
+        masks. Multiplexed signals are only decoded from frames whose
+        multiplexor value selects them.
+        """
+        prologue = f"        if len(data) != {msg.dlc}:\n"
+        prologue += f"            data = bytes(data[:{msg.dlc}]).ljust({msg.dlc}, b'\\x00')\n"
+        if any(sig.byte_order == 'little_endian' for sig, _, _ in layout):
+            prologue += "        _le = _from_bytes(data, 'little')\n"
+        if any(sig.byte_order == 'big_endian' for sig, _, _ in layout):
+            prologue += "        _be = _from_bytes(data, 'big')\n"
+        
+        exprs = {}
+        for sig, shift, mask in layout:
+            src = '_le' if sig.byte_order == 'little_endian' else '_be'
+            expr = f"({src} >> {shift}) & 0x{mask:X}" if shift else f"{src} & 0x{mask:X}"
+            exprs[sig.name] = self._sign_extend(expr, sig)
+        
+        def physical(sig: CANSignal) -> str:
+            value = f"({exprs[sig.name]}) * {sig.scale}"
+            if sig.offset:
+                value += f" {'-' if sig.offset < 0 else '+'} {abs(sig.offset)}"
+            return value
+        
+        selector, always, branches = self._multiplexing(layout)
+        if branches:
+            prologue += f"        _mux = {exprs[selector[0].name]}\n"
+            exprs[selector[0].name] = "_mux"
+        
+        code = "    @staticmethod\n"
+        code += "    def decode_raw(data: bytes) -> tuple:\n"
+        if branches:
+            code += ('        """Decode CAN frame into raw signal values, in SIGNALS order; '
+                     'None for multiplexed signals the frame does not carry"""\n')
+        else:
+            code += '        """Decode CAN frame into raw signal values, in SIGNALS order"""\n'
+        code += prologue
+        code += "        return (\n"
+        for sig, _, _ in layout:
+            value = sig.multiplexer_value
+            if value is None:
+                code += f"            {exprs[sig.name]},\n"
+            else:
+                code += f"            ({exprs[sig.name]}) if _mux == {value} else None,\n"
+        code += "        )\n\n"
+        
+        code += "    @staticmethod\n"
+        code += "    def decode(data: bytes) -> dict:\n"
+        code += '        """Decode CAN frame into signals"""\n'
+        code += prologue
+        if not branches:
+            code += "        return {\n"
+            for sig, _, _ in layout:
+                code += f"            '{sig.name}': {physical(sig)},\n"
+            code += "        }\n\n"
+            return code
+        
+        code += "        signals = {\n"
+        for sig, _, _ in always:
+            code += f"            '{sig.name}': {physical(sig)},\n"
+        code += "        }\n"
+        keyword = "if"
+        for value, entries in branches.items():
+            code += f"        {keyword} _mux == {value}:\n"
+            for sig, _, _ in entries:
+                code += f"            signals['{sig.name}'] = {physical(sig)}\n"
+            keyword = "elif"
+        code += "        return signals\n\n"
+        return code
     
     def generate_documentation(self, output_file: str):
         """Generate Markdown documentation"""
@@ -5,18 +5,88 @@ Supports PostgreSQL/TimescaleDB and InfluxDB
 
 import psycopg2
 from psycopg2.extras import execute_batch
+from psycopg2.pool import ThreadedConnectionPool
 from influxdb_client import InfluxDBClient, Point
 from influxdb_client.client.write_api import SYNCHRONOUS
-from datetime import datetime
-from typing import List, Dict
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import List, Dict, Iterator, Tuple
+import numpy as np
 import os
+import threading
+import time
+
+from CopyWriter import PAYLOAD_COLUMNS, PAYLOAD_FORMATS
+from LatestValues import LATEST_TABLE, LatestValues
+
+# Rows per server-side cursor round trip when streaming history
+STREAM_CHUNK_ROWS = 50000
+# Downsampling for query_signal_history(max_points=...)
+AGGREGATIONS = ('avg', 'minmax', 'lttb')
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Continuous aggregates of can_messages, finest first:
+# (view, bucket width, refresh policy window, refresh policy interval)
+ROLLUPS = (
+    ('can_signals_1s', timedelta(seconds=1), timedelta(minutes=10), timedelta(seconds=10)),
+    ('can_signals_1min', timedelta(minutes=1), timedelta(hours=2), timedelta(minutes=1)),
+    ('can_signals_1h', timedelta(hours=1), timedelta(days=3), timedelta(minutes=30)),
+)
+# materialized_only = false appends not-yet-materialized buckets from the raw rows
+ROLLUP_DDL = """
+    CREATE MATERIALIZED VIEW IF NOT EXISTS {view}
+    WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+    SELECT time_bucket(%s, timestamp) AS bucket,
+           vehicle_id,
+           signal_name,
+           min(unit) AS unit,
+           avg(physical_value) AS avg_value,
+           min(physical_value) AS min_value,
+           max(physical_value) AS max_value,
+           count(physical_value) AS sample_count
+    FROM can_messages
+    GROUP BY bucket, vehicle_id, signal_name
+    WITH NO DATA
+"""
+
+
+def lttb(timestamps: np.ndarray, values: np.ndarray, max_points: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Largest-Triangle-Three-Buckets: keep the first and last points plus,
+    from each of max_points - 2 equal-count buckets, the point forming the
+    largest triangle with the previously kept point and the next bucket's mean
+    """
+    n = len(values)
+    if max_points >= n:
+        return timestamps, values
+    # Seconds from the first point keep float64 precision
+    x = (timestamps - timestamps[0]) / 1e9
+    every = (n - 2) / (max_points - 2)
+    edges = np.append((np.arange(max_points - 1) * every).astype(np.int64) + 1, n)
+    keep = np.empty(max_points, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(max_points - 2):
+        start, end, next_end = edges[i], edges[i + 1], edges[i + 2]
+        cx, cy = x[end:next_end].mean(), values[end:next_end].mean()
+        ax, ay = x[a], values[a]
+        area = np.abs((ax - cx) * (values[start:end] - ay) - (ax - x[start:end]) * (cy - ay))
+        a = start + int(area.argmax())
+        keep[i + 1] = a
+    return timestamps[keep], values[keep]
 
 
 class TimescaleDBConnector:
-    """PostgreSQL/TimescaleDB connector for CAN messages"""
+    """
+    PostgreSQL/TimescaleDB connector for CAN messages.
+    Connections come from a thread-safe pool of up to max_connections, so
+    ingest and query threads can share one connector; with the default of
+    one connection the callers take turns on it.
+    """
     
     def __init__(self, host="localhost", port=5432, database="canbus", 
-                 user="postgres", password=""):
+                 user="postgres", password="", payload_format="hex",
+                 max_connections=1, min_connections=None, health_check_s=30.0):
         self.conn_params = {
             'host': host,
             'port': port,
@@ -24,35 +94,123 @@ class TimescaleDBConnector:
             'user': user,
             'password': password
         }
-        self.conn = None
+        # 'bytea' stores frames in the payload column (sql/03_add_payload_bytea.sql)
+        if payload_format not in PAYLOAD_FORMATS:
+            raise ValueError(f"Unknown payload format {payload_format!r}, expected one of {PAYLOAD_FORMATS}")
+        self.payload_format = payload_format
+        # The pool closes connections returned beyond min_connections, so keep them all by default
+        if min_connections is None:
+            min_connections = max_connections
+        if not 1 <= min_connections <= max_connections:
+            raise ValueError(f"Need 1 <= min_connections <= max_connections, got {min_connections}, {max_connections}")
+        self.min_connections = min_connections
+        self.max_connections = max_connections
+        # Connections idle longer than this are pinged before being handed out
+        self.health_check_s = health_check_s
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        # ThreadedConnectionPool raises when exhausted, so checkouts wait here instead
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._last_used = {}
+        # Continuous aggregates present in the database, looked up on first use
+        self._rollups = None
         
     def connect(self):
-        """Establish database connection"""
-        self.conn = psycopg2.connect(**self.conn_params)
-        print("Connected to TimescaleDB")
+        """Open the connection pool"""
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadedConnectionPool(self.min_connections, self.max_connections,
+                                                    **self.conn_params)
+                print(f"Connected to TimescaleDB ({self.max_connections} connection pool)")
+        return self._pool
         
     def disconnect(self):
-        """Close database connection"""
-        if self.conn:
-            self.conn.close()
-            print("Disconnected from TimescaleDB")
+        """Close every pooled connection"""
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
+                self._last_used.clear()
+                print("Disconnected from TimescaleDB")
+
+    @contextmanager
+    def connection(self, autocommit=False):
+        """
+        Check out a healthy pooled connection for the duration of the block,
+        committing on success and rolling back on error. Blocks while all
+        max_connections are in use. autocommit is for statements that cannot
+        run inside a transaction, such as CALL refresh_continuous_aggregate.
+        """
+        pool = self._pool or self.connect()
+        with self._slots:
+            conn = self._checkout(pool)
+            conn.autocommit = autocommit
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                if not conn.closed:
+                    try:
+                        conn.rollback()
+                    except psycopg2.Error:
+                        pass
+                raise
+            finally:
+                if autocommit and not conn.closed:
+                    conn.autocommit = False
+                # A dropped connection is discarded so the pool opens a fresh one
+                pool.putconn(conn, close=bool(conn.closed))
+                if conn.closed:
+                    self._last_used.pop(conn, None)
+                else:
+                    self._last_used[conn] = time.monotonic()
+
+    def _checkout(self, pool):
+        """Pooled connection that is open and, if it sat idle, answers a ping"""
+        while True:
+            conn = pool.getconn()
+            last_used = self._last_used.get(conn)
+            if not conn.closed and (last_used is None or time.monotonic() - last_used < self.health_check_s):
+                return conn
+            if not conn.closed:
+                try:
+                    with conn.cursor() as cur:
+                        cur.execute("SELECT 1")
+                    conn.rollback()
+                    return conn
+                except psycopg2.Error:
+                    pass
+            self._last_used.pop(conn, None)
+            pool.putconn(conn, close=True)
+
+    def _run(self, operation):
+        """
+        operation(cursor) in its own transaction, retried once on a new
+        connection if the server connection dropped. Every operation here is
+        safe to repeat; inserts skip rows that already exist.
+        """
+        for attempt in range(2):
+            conn = None
+            try:
+                with self.connection() as conn, conn.cursor() as cur:
+                    return operation(cur)
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                if attempt or conn is None or not conn.closed:
+                    raise
+                print("TimescaleDB connection lost, retrying on a new connection")
     
     def insert_messages(self, messages: List[Dict], batch_size=1000):
         """Batch insert CAN messages"""
-        if not self.conn:
-            self.connect()
-            
-        cursor = self.conn.cursor()
-        
-        insert_query = """
+        insert_query = f"""
             INSERT INTO can_messages 
             (timestamp, can_id, signal_type, signal_name, raw_value, 
-             physical_value, unit, data_hex)
-            VALUES (to_timestamp(%s), %s, %s, %s, %s, %s, %s, %s)
-            ON CONFLICT (timestamp, can_id, signal_name) DO NOTHING
+             physical_value, unit, {PAYLOAD_COLUMNS[self.payload_format][0]}, vehicle_id)
+            VALUES (to_timestamp(%s), %s, %s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (timestamp, vehicle_id, can_id, signal_name) DO NOTHING
         """
         
         # Prepare data tuples
+        encode_payload = self._payload_encoder()
         data = [
             (
                 msg['timestamp'],
@@ -62,24 +220,50 @@ class TimescaleDBConnector:
                 msg['raw_value'],
                 msg['physical_value'],
                 msg['unit'],
-                msg['data_hex']
+                encode_payload(msg),
+                msg.get('vehicle_id', 0)
             )
             for msg in messages
         ]
         
+        def insert(cursor):
+            execute_batch(cursor, insert_query, data, page_size=batch_size)
+            # Newest value per vehicle and signal, in the same transaction
+            latest = LatestValues()
+            for msg in messages:
+                latest.add(msg.get('vehicle_id', 0), int(msg['can_id'], 16), msg['signal_name'],
+                           round(msg['timestamp'] * 1000000), msg['physical_value'], msg['unit'])
+            latest.upsert(cursor)
+
         # Batch insert
-        execute_batch(cursor, insert_query, data, page_size=batch_size)
-        self.conn.commit()
+        self._run(insert)
         
         print(f"Inserted {len(messages)} messages")
-        cursor.close()
     
-    def query_signal_history(self, signal_name: str, hours: int = 1):
-        """Query signal history"""
-        if not self.conn:
-            self.connect()
-            
-        cursor = self.conn.cursor()
+    def _payload_encoder(self):
+        """Frame value for the payload column; bytea mode accepts a 'payload' bytes key or converts data_hex"""
+        if self.payload_format == 'bytea':
+            return lambda msg: msg['payload'] if 'payload' in msg else bytes.fromhex(msg['data_hex'])
+        return lambda msg: msg['data_hex']
+    
+    def query_signal_history(self, signal_name: str, hours: int = 1, max_points: int = None,
+                             aggregation: str = 'avg'):
+        """
+        Query signal history, every row or, with max_points, at most that many
+        points. avg and minmax average, or take the min/max envelope of,
+        time_bucket buckets in SQL ('min' and 'max' keys instead of 'value'),
+        read from a continuous aggregate when one is fine enough;
+        lttb picks representative raw points in Python from the streamed rows.
+        """
+        if max_points is not None:
+            if aggregation not in AGGREGATIONS:
+                raise ValueError(f"Unknown aggregation {aggregation!r}, expected one of {AGGREGATIONS}")
+            if max_points < 3:
+                raise ValueError(f"max_points must be at least 3, got {max_points}")
+            if aggregation == 'lttb':
+                return self._lttb_history(signal_name, hours, max_points)
+            return self._bucketed_history(signal_name, hours, max_points, aggregation)
+
         query = """
             SELECT timestamp, physical_value, unit
             FROM can_messages
@@ -87,32 +271,181 @@ class TimescaleDBConnector:
             AND timestamp > NOW() - INTERVAL '%s hours'
             ORDER BY timestamp
         """
-        cursor.execute(query, (signal_name, hours))
-        results = cursor.fetchall()
-        cursor.close()
+
+        def fetch(cursor):
+            cursor.execute(query, (signal_name, hours))
+            return cursor.fetchall()
+
+        results = self._run(fetch)
         
         return [
             {'timestamp': row[0], 'value': row[1], 'unit': row[2]}
             for row in results
         ]
+
+    def _bucketed_history(self, signal_name: str, hours: int, max_points: int, aggregation: str):
+        """
+        avg or min/max per time_bucket, sized so the range spans at most
+        max_points buckets, computed from the coarsest continuous aggregate
+        no wider than a bucket, or from the raw rows if none is
+        """
+        # Buckets are aligned to the epoch, so the range can touch one more bucket than it spans
+        width = timedelta(microseconds=-(-hours * 3600 * 10**6 // (max_points - 1)))
+        rollup = self._rollup_for(width)
+        if rollup is None:
+            values = "avg(physical_value)" if aggregation == 'avg' else "min(physical_value), max(physical_value)"
+            query = f"""
+                SELECT time_bucket(%s, timestamp) AS bucket, {values}, min(unit)
+                FROM can_messages
+                WHERE signal_name = %s 
+                AND timestamp > NOW() - INTERVAL '%s hours'
+                GROUP BY bucket
+                ORDER BY bucket
+            """
+            params = (width, signal_name, hours)
+        else:
+            view, rollup_width = rollup
+            # Whole rollup buckets per display bucket, so none straddles two
+            width = -(-width // rollup_width) * rollup_width
+            if aggregation == 'avg':
+                values = "sum(avg_value * sample_count) / nullif(sum(sample_count), 0)"
+            else:
+                values = "min(min_value), max(max_value)"
+            query = f"""
+                SELECT time_bucket(%s, bucket) AS display_bucket, {values}, min(unit)
+                FROM {view}
+                WHERE signal_name = %s 
+                AND bucket >= time_bucket(%s, NOW() - INTERVAL '%s hours')
+                GROUP BY display_bucket
+                ORDER BY display_bucket
+            """
+            params = (width, signal_name, rollup_width, hours)
+
+        def fetch(cursor):
+            cursor.execute(query, params)
+            return cursor.fetchall()
+
+        results = self._run(fetch)
+        if aggregation == 'avg':
+            return [{'timestamp': row[0], 'value': row[1], 'unit': row[2]} for row in results]
+        return [{'timestamp': row[0], 'min': row[1], 'max': row[2], 'unit': row[3]} for row in results]
+
+    def _rollup_for(self, width: timedelta):
+        """(view, bucket width) of the coarsest existing continuous aggregate no wider than width"""
+        if self._rollups is None:
+            def fetch(cursor):
+                cursor.execute("""
+                    SELECT view_name FROM timescaledb_information.continuous_aggregates
+                    WHERE hypertable_name = 'can_messages'
+                """)
+                return {row[0] for row in cursor.fetchall()}
+
+            self._rollups = self._run(fetch)
+        usable = [(view, rollup_width) for view, rollup_width, _, _ in ROLLUPS
+                  if view in self._rollups and rollup_width <= width]
+        return usable[-1] if usable else None
+
+    def create_continuous_aggregates(self):
+        """
+        Create the ROLLUPS continuous aggregates (min/max/avg/count per
+        vehicle, signal and bucket) and their refresh policies, if missing.
+        Policies only refresh recent buckets; call
+        refresh_continuous_aggregates after importing older data.
+        """
+        def create(cursor):
+            for view, width, window, interval in ROLLUPS:
+                cursor.execute(ROLLUP_DDL.format(view=view), (width,))
+                cursor.execute(
+                    "SELECT add_continuous_aggregate_policy(%s, start_offset => %s, end_offset => %s, "
+                    "schedule_interval => %s, if_not_exists => true)",
+                    (view, window, width, interval))
+
+        self._run(create)
+        self._rollups = None
+        print(f"Continuous aggregates ready: {', '.join(view for view, _, _, _ in ROLLUPS)}")
+
+    def refresh_continuous_aggregates(self, start: datetime = None, end: datetime = None):
+        """Materialize every continuous aggregate between start and end, None for unbounded"""
+        with self.connection(autocommit=True) as conn, conn.cursor() as cursor:
+            for view, _, _, _ in ROLLUPS:
+                cursor.execute("CALL refresh_continuous_aggregate(%s, %s, %s)", (view, start, end))
+                print(f"Refreshed {view}")
+
+    def _lttb_history(self, signal_name: str, hours: int, max_points: int):
+        """LTTB over the raw rows, which are streamed as arrays rather than fetched as tuples"""
+        chunks = list(self.stream_signal_history(signal_name, hours))
+        if not chunks:
+            return []
+        timestamps = np.concatenate([chunk[0] for chunk in chunks])
+        values = np.concatenate([chunk[1] for chunk in chunks])
+        valid = ~np.isnan(values)
+        timestamps, values = lttb(timestamps[valid], values[valid], max_points)
+
+        def fetch_unit(cursor):
+            cursor.execute("SELECT unit FROM can_messages WHERE signal_name = %s LIMIT 1", (signal_name,))
+            row = cursor.fetchone()
+            return row[0] if row else None
+
+        unit = self._run(fetch_unit)
+        return [
+            {'timestamp': EPOCH + timedelta(microseconds=ts // 1000), 'value': value, 'unit': unit}
+            for ts, value in zip(timestamps.tolist(), values.tolist())
+        ]
     
-    def get_latest_values(self):
-        """Get latest value for each signal"""
-        if not self.conn:
-            self.connect()
-            
-        cursor = self.conn.cursor()
-        query = "SELECT * FROM latest_vehicle_state"
-        cursor.execute(query)
-        results = cursor.fetchall()
-        cursor.close()
+    def stream_signal_history(self, signal_name: str, hours: int = 1,
+                              chunk_rows: int = STREAM_CHUNK_ROWS) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Yield signal history in order as (timestamps, values) chunks of up to
+        chunk_rows: int64 nanoseconds since the epoch and float64 values, NaN
+        where NULL. Rows come from a server-side cursor, so memory stays at
+        one chunk however long the range. A pooled connection stays checked
+        out until the generator is exhausted or closed.
+        """
+        # timestamptz is microsecond precision, and epoch microseconds are exact in float64
+        query = """
+            SELECT (extract(epoch FROM timestamp) * 1000000)::bigint, physical_value
+            FROM can_messages
+            WHERE signal_name = %s 
+            AND timestamp > NOW() - INTERVAL '%s hours'
+            ORDER BY timestamp
+        """
+        with self.connection() as conn, conn.cursor(name='signal_history') as cursor:
+            cursor.execute(query, (signal_name, hours))
+            while True:
+                rows = cursor.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                chunk = np.array(rows, dtype=np.float64)
+                yield chunk[:, 0].astype(np.int64) * 1000, chunk[:, 1]
+
+    def get_latest_values(self, vehicle_id: int = None):
+        """
+        Get latest value for each signal, across vehicles or for one. Reads
+        the writers' one-row-per-signal table (sql/04_latest_signal_values.sql),
+        so the cost does not grow with can_messages. Signals are told apart
+        by CAN ID and name, since different messages may reuse a name.
+        """
+        vehicle_filter = "" if vehicle_id is None else "WHERE vehicle_id = %s"
+        query = f"""
+            SELECT DISTINCT ON (can_id, signal_name) signal_name, physical_value, unit, timestamp, can_id
+            FROM {LATEST_TABLE}
+            {vehicle_filter}
+            ORDER BY can_id, signal_name, timestamp DESC
+        """
+
+        def fetch(cursor):
+            cursor.execute(query, None if vehicle_id is None else (vehicle_id,))
+            return cursor.fetchall()
+
+        results = self._run(fetch)
         
         return [
             {
                 'signal_name': row[0],
                 'value': row[1],
                 'unit': row[2],
-                'timestamp': row[3]
+                'timestamp': row[3],
+                'can_id': row[4]
             }
             for row in results
         ]
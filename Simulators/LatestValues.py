@@ -0,0 +1,101 @@
+"""
+Newest value per vehicle, CAN ID and signal (sql/04_latest_signal_values.sql)
+Writers fold each batch into a LatestValues and upsert it just before they
+commit, so the dashboard's latest-state query reads one row per signal
+instead of scanning can_messages
+"""
+
+from datetime import timedelta
+from typing import Dict, Tuple
+
+import numpy as np
+from psycopg2.extras import execute_values
+
+from MessageBatch import UNIX_EPOCH, MessageBatch
+
+LATEST_TABLE = 'latest_signal_values'
+
+# Rows may arrive out of order or be re-imported, so only a newer timestamp replaces a value
+UPSERT_SQL = f"""
+    INSERT INTO {LATEST_TABLE} (vehicle_id, can_id, signal_name, timestamp, physical_value, unit)
+    VALUES %s
+    ON CONFLICT (vehicle_id, can_id, signal_name) DO UPDATE
+    SET timestamp = EXCLUDED.timestamp,
+        physical_value = EXCLUDED.physical_value,
+        unit = EXCLUDED.unit
+    WHERE {LATEST_TABLE}.timestamp < EXCLUDED.timestamp
+"""
+
+
+def _newest_rows(batch: MessageBatch) -> np.ndarray:
+    """Index of the newest row per vehicle and signal; the last one when timestamps tie"""
+    n = len(batch)
+    if not n:
+        return np.empty(0, dtype=np.int64)
+    vehicle_ids, signal_index = batch.vehicle_ids[:n], batch.signal_index[:n]
+    timestamps = batch.timestamps[:n]
+    first_vehicle = int(vehicle_ids.min())
+    num_signals = len(batch.signals)
+    num_keys = (int(vehicle_ids.max()) - first_vehicle + 1) * num_signals
+    if num_keys > max(4 * n, 65536):
+        # Sparse vehicle IDs: sort instead of scattering into a table per key
+        keys = (vehicle_ids.astype(np.int64) << 32) | signal_index
+        order = np.lexsort((timestamps, keys))
+        sorted_keys = keys[order]
+        return order[np.append(sorted_keys[1:] != sorted_keys[:-1], True)]
+    # Two scatter passes, O(n) and ~15x faster than the sort on a 200k-row batch
+    keys = (vehicle_ids - first_vehicle).astype(np.int64) * num_signals + signal_index
+    newest = np.full(num_keys, np.iinfo(np.int64).min)
+    np.maximum.at(newest, keys, timestamps)
+    candidates = np.flatnonzero(timestamps == newest[keys])
+    last = np.full(num_keys, -1)
+    np.maximum.at(last, keys[candidates], candidates)
+    return last[last >= 0]
+
+
+class LatestValues:
+    """
+    Newest (timestamp, value, unit) per (vehicle_id, can_id, signal_name)
+    seen since the last upsert. The CAN ID keeps same-named signals of
+    different messages, common in DBCs, apart.
+    """
+
+    def __init__(self):
+        self.values: Dict[Tuple[int, int, str], Tuple[int, float, str]] = {}
+
+    def __len__(self):
+        return len(self.values)
+
+    def add(self, vehicle_id: int, can_id: int, signal_name: str, timestamp_us: int, value: float, unit: str):
+        """Keep the value if it is the newest for its vehicle and signal"""
+        key = (vehicle_id, can_id, signal_name)
+        current = self.values.get(key)
+        if current is None or timestamp_us >= current[0]:
+            self.values[key] = (timestamp_us, value, unit)
+
+    def add_batch(self, batch: MessageBatch):
+        """Fold in the newest row of each vehicle and signal in the batch"""
+        newest = _newest_rows(batch)
+        entries = batch.signals.entries
+        for vehicle_id, can_id, sig, timestamp_us, value in zip(
+                batch.vehicle_ids[newest].tolist(), batch.can_ids[newest].tolist(),
+                batch.signal_index[newest].tolist(), batch.timestamps[newest].tolist(),
+                batch.physical[newest].tolist()):
+            _, signal_name, unit = entries[sig]
+            self.add(vehicle_id, can_id, signal_name, timestamp_us, value, unit)
+
+    def upsert(self, cur) -> int:
+        """
+        Write the collected values through cur and start over. Rows go in key
+        order so concurrent writers lock them in the same order. Returns the
+        number of values written.
+        """
+        if not self.values:
+            return 0
+        rows = [
+            (vehicle_id, can_id, signal_name, UNIX_EPOCH + timedelta(microseconds=timestamp_us), value, unit)
+            for (vehicle_id, can_id, signal_name), (timestamp_us, value, unit) in sorted(self.values.items())
+        ]
+        execute_values(cur, UPSERT_SQL, rows, page_size=len(rows))
+        self.values.clear()
+        return len(rows)
@@ -0,0 +1,163 @@
+"""
+Columnar batch of CAN signal records
+Preallocated typed arrays filled in place by the generators and handed to
+sinks whole, instead of one dataclass, frame and tuple per record
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+UNIX_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+HEX_DIGITS = np.frombuffer(b'0123456789abcdef', dtype=np.uint8)
+
+# Column attribute, dtype and per-row shape of a MessageBatch
+BATCH_COLUMNS = [
+    ('timestamps', np.int64, ()),    # microseconds since the Unix epoch
+    ('can_ids', np.uint32, ()),
+    ('signal_index', np.int32, ()),  # into MessageBatch.signals
+    ('raw', np.int64, ()),
+    ('physical', np.float64, ()),
+    ('vehicle_ids', np.int32, ()),
+    ('payload', np.uint8, (8,)),     # frame zero-padded or, for CAN FD, cut to 8 bytes
+    ('dlc', np.uint8, ()),           # frame length before padding or cutting
+]
+
+
+def epoch_us(value: datetime) -> int:
+    """Exact microseconds since the Unix epoch; naive datetimes are taken as local time"""
+    if value.tzinfo is None:
+        value = value.astimezone()
+    return (value - UNIX_EPOCH) // timedelta(microseconds=1)
+
+
+class SignalTable:
+    """Interns the per-signal strings so each record stores a small index"""
+
+    def __init__(self):
+        # (signal_type, signal_name, unit) per index
+        self.entries: List[Tuple[str, str, str]] = []
+        self._index: Dict[Tuple[int, str, str, str], int] = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def index(self, can_id: int, signal_type: str, signal_name: str, unit: str) -> int:
+        """Index of a signal, registering it on first use"""
+        key = (can_id, signal_type, signal_name, unit)
+        idx = self._index.get(key)
+        if idx is None:
+            idx = self._index[key] = len(self.entries)
+            self.entries.append((signal_type, signal_name, unit))
+        return idx
+
+
+class MessageBatch:
+    """
+    Struct-of-arrays buffer of decoded CAN records, one row per signal
+    sample. Generators reserve a slice with extend() and write whole
+    columns into it; clear() rewinds without freeing, so a batch that is
+    reused allocates nothing after warm-up.
+    """
+
+    def __init__(self, capacity: int = 1024, signals: SignalTable = None):
+        self.signals = signals if signals is not None else SignalTable()
+        self.size = 0
+        self.capacity = 0
+        self._resize(max(1, capacity))
+
+    def __len__(self):
+        return self.size
+
+    def _resize(self, capacity: int):
+        """Reallocate every column at the new capacity, keeping the filled rows"""
+        for name, dtype, shape in BATCH_COLUMNS:
+            column = np.empty((capacity,) + shape, dtype=dtype)
+            if self.capacity:
+                column[:self.size] = getattr(self, name)[:self.size]
+            setattr(self, name, column)
+        self.capacity = capacity
+
+    def extend(self, count: int) -> slice:
+        """Append count rows and return their slice for the caller to fill; payloads start zeroed, DLC at 8"""
+        start = self.size
+        end = start + count
+        if end > self.capacity:
+            self._resize(max(end, 2 * self.capacity))
+        self.payload[start:end] = 0
+        self.dlc[start:end] = 8
+        self.size = end
+        return slice(start, end)
+
+    def append(self, timestamp_us: int, can_id: int, signal: int, raw: int, physical: float,
+               vehicle_id: int, payload: bytes):
+        """Append a single row"""
+        i = self.extend(1).start
+        self.timestamps[i] = timestamp_us
+        self.can_ids[i] = can_id
+        self.signal_index[i] = signal
+        self.raw[i] = raw
+        self.physical[i] = physical
+        self.vehicle_ids[i] = vehicle_id
+        self.payload[i, :len(payload)] = np.frombuffer(payload, dtype=np.uint8)
+
+    def append_rows(self, rows: Sequence[Sequence]):
+        """
+        Append (timestamp, can_id, signal_type, signal_name, raw, physical,
+        unit, frame[, vehicle_id]) row tuples. Timestamps may be datetimes or
+        epoch seconds, can_id an int or '0x100' string, and the frame hex
+        text or bytes; a missing vehicle_id means 0.
+        """
+        signals = self.signals
+        for timestamp, can_id, signal_type, signal_name, raw, physical, unit, frame, *rest in rows:
+            if isinstance(can_id, str):
+                can_id = int(can_id, 0)
+            timestamp_us = epoch_us(timestamp) if isinstance(timestamp, datetime) else round(timestamp * 1000000)
+            if isinstance(frame, str):
+                frame = bytes.fromhex(frame)
+            self.append(timestamp_us, can_id, signals.index(can_id, signal_type, signal_name, unit), raw, physical,
+                        rest[0] if rest else 0, frame or b'')
+
+    def clear(self):
+        self.size = 0
+
+    def empty_like(self) -> 'MessageBatch':
+        """New empty batch of the same capacity sharing this batch's signal table"""
+        return MessageBatch(self.capacity, self.signals)
+
+    def hex_digits(self) -> np.ndarray:
+        """Lowercase hex of every payload as an (N, 16) array of ASCII codes"""
+        payload = self.payload[:self.size]
+        digits = np.empty((self.size, 16), dtype=np.uint8)
+        digits[:, 0::2] = HEX_DIGITS[payload >> 4]
+        digits[:, 1::2] = HEX_DIGITS[payload & 0x0F]
+        return digits
+
+    def rows(self, payload_format: str = 'hex') -> List[tuple]:
+        """
+        Materialize row tuples shaped like append_rows() takes, for sinks
+        that need them. Timestamps become UTC datetimes and can_id an int;
+        with payload_format='bytea' the frame is 8 raw bytes instead of hex.
+        """
+        n = self.size
+        if not n:
+            return []
+        timestamps = self.timestamps[:n]
+        # Rows of one tick share a timestamp; convert each distinct value once
+        unique, inverse = np.unique(timestamps, return_inverse=True)
+        stamps = [UNIX_EPOCH + timedelta(microseconds=us) for us in unique.tolist()]
+        entries = self.signals.entries
+        if payload_format == 'bytea':
+            width, frames = 8, self.payload[:n].tobytes()
+        else:
+            width, frames = 16, self.hex_digits().tobytes().decode('ascii')
+        rows = []
+        append = rows.append
+        for i, (t, can_id, sig, raw, physical, vehicle_id) in enumerate(zip(
+                inverse.tolist(), self.can_ids[:n].tolist(), self.signal_index[:n].tolist(),
+                self.raw[:n].tolist(), self.physical[:n].tolist(), self.vehicle_ids[:n].tolist())):
+            signal_type, signal_name, unit = entries[sig]
+            append((stamps[t], can_id, signal_type, signal_name, raw, physical, unit,
+                    frames[width * i:width * i + width], vehicle_id))
+        return rows
@@ -0,0 +1,403 @@
+"""
+Asyncio MQTT publisher sink for CAN records
+Packs each MessageBatch into a few compact payloads per topic and publishes
+them with a bounded number of unacknowledged messages, so live dashboards
+get frames without waiting for a database round trip
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import struct
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from CanLog import LOG_HEADER, LOG_MAGIC, LOG_VERSION, frames_from_batch
+from MessageBatch import MessageBatch
+
+MQTT_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                                'backend', 'config', 'mqtt_config.json')
+
+# MQTT 3.1.1 control packet types (high nibble of the fixed header)
+CONNECT = 0x10
+CONNACK = 0x20
+PUBLISH = 0x30
+PUBACK = 0x40
+PINGREQ = 0xC0
+PINGRESP = 0xD0
+DISCONNECT = 0xE0
+
+CONNACK_ERRORS = {1: 'unacceptable protocol version', 2: 'identifier rejected', 3: 'server unavailable',
+                  4: 'bad user name or password', 5: 'not authorized'}
+
+
+def load_mqtt_config(path: Optional[str] = None) -> dict:
+    """Broker, topics and QoS from backend/config/mqtt_config.json"""
+    with open(path or MQTT_CONFIG_PATH) as f:
+        return json.load(f)
+
+
+def _packet(first: int, body: bytes) -> bytes:
+    """Fixed header (type and flags, variable-length remaining length) plus body"""
+    length = len(body)
+    header = bytearray([first])
+    while True:
+        length, byte = divmod(length, 128)
+        header.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(header) + body
+
+
+def _string(value: str) -> bytes:
+    encoded = value.encode('utf-8')
+    return struct.pack('>H', len(encoded)) + encoded
+
+
+async def _read_packet(reader: asyncio.StreamReader) -> Tuple[int, bytes]:
+    """First header byte and body of the next packet"""
+    first = (await reader.readexactly(1))[0]
+    length = shift = 0
+    while True:
+        byte = (await reader.readexactly(1))[0]
+        length |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            break
+        shift += 7
+    return first, await reader.readexactly(length)
+
+
+def raw_payloads(batch: MessageBatch, max_records: int = 1000) -> Iterator[bytes]:
+    """
+    The frames behind a batch as CAN log records, at most max_records per
+    payload. Each payload is a complete CAN log (header and records), so
+    subscribers read it with the same frame_dtype as a capture file.
+    """
+    records = frames_from_batch(batch)
+    header = LOG_HEADER.pack(LOG_MAGIC, LOG_VERSION, 8, records.dtype.itemsize)
+    for start in range(0, len(records), max_records):
+        yield header + records[start:start + max_records].tobytes()
+
+
+def decoded_payloads(batch: MessageBatch, max_records: int = 1000) -> Iterator[bytes]:
+    """
+    Decoded signals as columnar JSON, at most max_records rows per payload.
+    Signal names are dictionary-encoded per payload: 'signal' indexes into
+    'names', 'types' and 'units'.
+    """
+    n = len(batch)
+    entries = batch.signals.entries
+    for start in range(0, n, max_records):
+        rows = slice(start, min(n, start + max_records))
+        used, signal = np.unique(batch.signal_index[rows], return_inverse=True)
+        used = used.tolist()
+        yield json.dumps({
+            'timestamp_us': batch.timestamps[rows].tolist(),
+            'vehicle_id': batch.vehicle_ids[rows].tolist(),
+            'can_id': batch.can_ids[rows].tolist(),
+            'signal': signal.tolist(),
+            'value': batch.physical[rows].tolist(),
+            'names': [entries[i][1] for i in used],
+            'types': [entries[i][0] for i in used],
+            'units': [entries[i][2] for i in used],
+        }, separators=(',', ':')).encode()
+
+
+class MqttClient:
+    """
+    Minimal asyncio MQTT 3.1.1 publisher: CONNECT, PUBLISH at QoS 0 or 1
+    and keepalive pings. At most max_in_flight QoS 1 messages are awaiting
+    PUBACK at any time; publish() waits for a free slot, which is the
+    backpressure a slow broker exerts on the producer.
+    """
+
+    def __init__(self, host: str = 'localhost', port: int = 1883, client_id: str = '',
+                 keepalive: int = 60, max_in_flight: int = 64):
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1")
+        self.host = host
+        self.port = port
+        self.client_id = client_id
+        self.keepalive = keepalive
+        self.max_in_flight = max_in_flight
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._drained: Optional[asyncio.Event] = None
+        self._pending: Dict[int, float] = {}  # packet id -> loop time sent
+        self._next_id = 0
+        self._tasks: List[asyncio.Task] = []
+        self._error: Optional[BaseException] = None
+
+        self.messages_sent = 0
+        self.bytes_sent = 0
+        self.ack_latency_s: List[float] = []
+
+    async def connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        # Protocol name, level 4 (3.1.1), clean session, keepalive, then the client id
+        self._writer.write(_packet(CONNECT, _string('MQTT') + bytes([4, 0x02])
+                                   + struct.pack('>H', self.keepalive) + _string(self.client_id)))
+        await self._writer.drain()
+        first, body = await _read_packet(self._reader)
+        if first & 0xF0 != CONNACK or len(body) < 2:
+            raise ConnectionError(f"Expected CONNACK from {self.host}:{self.port}, got packet type {first >> 4}")
+        if body[1]:
+            raise ConnectionError(f"MQTT broker refused the connection: {CONNACK_ERRORS.get(body[1], body[1])}")
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self._tasks = [asyncio.ensure_future(self._read_loop()), asyncio.ensure_future(self._keepalive_loop())]
+
+    async def publish(self, topic: str, payload: bytes, qos: int = 1):
+        """Send one message; returns once it is written, not once it is acknowledged"""
+        if qos not in (0, 1):
+            raise ValueError(f"Unsupported QoS {qos}, expected 0 or 1")
+        self._check()
+        body = _string(topic)
+        if qos:
+            await self._slots.acquire()
+            self._check()
+            packet_id = self._allocate_id()
+            self._pending[packet_id] = asyncio.get_running_loop().time()
+            self._drained.clear()
+            body += struct.pack('>H', packet_id)
+        self._writer.write(_packet(PUBLISH | qos << 1, body + payload))
+        await self._writer.drain()
+        self.messages_sent += 1
+        self.bytes_sent += len(payload)
+
+    async def flush(self):
+        """Wait until every QoS 1 message has been acknowledged"""
+        self._check()
+        await self._drained.wait()
+        self._check()
+
+    async def disconnect(self):
+        for task in self._tasks:
+            task.cancel()
+        if self._writer is not None:
+            writer, self._writer = self._writer, None
+            # Flush DISCONNECT and wait for the socket to close before the caller stops the loop
+            try:
+                if self._error is None:
+                    writer.write(_packet(DISCONNECT, b''))
+                    await writer.drain()
+            except (ConnectionError, OSError):
+                pass
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+
+    def _check(self):
+        if self._error is not None:
+            raise ConnectionError(f"MQTT connection to {self.host}:{self.port} lost") from self._error
+
+    def _allocate_id(self) -> int:
+        """Next packet id in 1..65535 not awaiting an ack"""
+        while True:
+            self._next_id = self._next_id % 0xFFFF + 1
+            if self._next_id not in self._pending:
+                return self._next_id
+
+    async def _read_loop(self):
+        try:
+            while True:
+                first, body = await _read_packet(self._reader)
+                if first & 0xF0 == PUBACK:
+                    sent = self._pending.pop(struct.unpack('>H', body[:2])[0], None)
+                    if sent is not None:
+                        self.ack_latency_s.append(asyncio.get_running_loop().time() - sent)
+                        self._slots.release()
+                        if not self._pending:
+                            self._drained.set()
+        except asyncio.CancelledError:
+            raise
+        except Exception as error:
+            # Wake every publisher and flush waiting on acks that will never come
+            self._error = error
+            for _ in range(self.max_in_flight):
+                self._slots.release()
+            self._drained.set()
+
+    async def _keepalive_loop(self):
+        if not self.keepalive:
+            return
+        while True:
+            await asyncio.sleep(self.keepalive / 2)
+            self._writer.write(_packet(PINGREQ, b''))
+            try:
+                await self._writer.drain()
+            except (ConnectionError, OSError):
+                # The read loop reports the lost connection
+                return
+
+
+class MqttSink:
+    """
+    Publishes MessageBatches to MQTT from synchronous code such as
+    CANSimulator, with the same write()/close() interface as the file sinks.
+
+    Frames go to the raw_can topic as CAN log records and decoded signals to
+    the decoded topic as columnar JSON, at most max_records per message.
+    The client runs on its own event loop thread; write() encodes on the
+    caller's thread and returns once every message is sent, blocking while
+    max_in_flight messages are unacknowledged.
+    """
+
+    def __init__(self, config_path: Optional[str] = None, host: Optional[str] = None, port: Optional[int] = None,
+                 max_in_flight: int = 64, max_records: int = 1000, client_id: Optional[str] = None):
+        config = load_mqtt_config(config_path)
+        broker = config['broker']
+        self.topics = config['topics']
+        self.qos = config.get('qos', 1)
+        self.max_records = max_records
+        # Not the backend's client_id: the broker would disconnect whichever connected first
+        self.client = MqttClient(host or broker['host'], port or broker['port'],
+                                 client_id or f"can_simulator_{os.getpid()}",
+                                 broker.get('keepalive', 60), max_in_flight)
+        self.broker = f"mqtt://{self.client.host}:{self.client.port}"
+        self.rows_written = 0
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='mqtt-sink', daemon=True)
+        self._thread.start()
+        try:
+            self._call(self.client.connect())
+        except BaseException:
+            self._stop_loop()
+            raise
+
+    def encode(self, batch: MessageBatch) -> List[Tuple[str, bytes]]:
+        """(topic, payload) of every message for a batch"""
+        return ([(self.topics['raw_can'], payload) for payload in raw_payloads(batch, self.max_records)]
+                + [(self.topics['decoded'], payload) for payload in decoded_payloads(batch, self.max_records)])
+
+    def write(self, batch: MessageBatch) -> int:
+        n = len(batch)
+        if not n:
+            return 0
+        self._call(self._publish_all(self.encode(batch)))
+        self.rows_written += n
+        return n
+
+    def flush(self):
+        """Wait until the broker has acknowledged every message"""
+        self._call(self.client.flush())
+
+    def close(self):
+        try:
+            self.flush()
+            latency = self.client.ack_latency_s
+            p50, p99 = (np.percentile(latency, (50, 99)) * 1000).tolist() if latency else (0.0, 0.0)
+            print(f"✓ Published {self.client.messages_sent} messages ({self.client.bytes_sent / 1e6:.1f} MB) "
+                  f"to {self.broker}; ack latency p50 {p50:.2f} ms, p99 {p99:.2f} ms")
+        finally:
+            try:
+                self._call(self.client.disconnect())
+            finally:
+                self._stop_loop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    async def _publish_all(self, messages: List[Tuple[str, bytes]]):
+        for topic, payload in messages:
+            await self.client.publish(topic, payload, self.qos)
+
+    def _call(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def _stop_loop(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+class LocalBroker:
+    """
+    In-process stand-in for an MQTT broker, for testing publishers without
+    Mosquitto. Accepts any client, acknowledges QoS 1 messages after
+    ack_delay_s (to emulate a slow broker) and records (topic, payload)
+    instead of routing to subscribers.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, ack_delay_s: float = 0.0):
+        self.host = host
+        self.port = port
+        self.ack_delay_s = ack_delay_s
+        self.messages: List[Tuple[str, bytes]] = []
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> int:
+        """Start listening and return the port, which is picked by the OS if 0"""
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                first, body = await _read_packet(reader)
+                packet_type = first & 0xF0
+                if packet_type == CONNECT:
+                    writer.write(_packet(CONNACK, b'\x00\x00'))
+                elif packet_type == PUBLISH:
+                    qos = (first >> 1) & 0x03
+                    end = 2 + struct.unpack('>H', body[:2])[0]
+                    topic = body[2:end].decode('utf-8')
+                    self.messages.append((topic, body[end + 2:] if qos else body[end:]))
+                    if qos:
+                        if self.ack_delay_s:
+                            await asyncio.sleep(self.ack_delay_s)
+                        writer.write(_packet(PUBACK, body[end:end + 2]))
+                elif packet_type == PINGREQ:
+                    writer.write(_packet(PINGRESP, b''))
+                elif packet_type == DISCONNECT:
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+def main(argv: Optional[List[str]] = None):
+    arg_parser = argparse.ArgumentParser(description="Local MQTT broker stand-in that acknowledges and counts messages")
+    arg_parser.add_argument('--host', default='127.0.0.1')
+    arg_parser.add_argument('--port', type=int, default=1883)
+    arg_parser.add_argument('--ack-delay', type=float, default=0.0, help="Seconds before each PUBACK")
+    args = arg_parser.parse_args(argv)
+
+    async def serve():
+        broker = LocalBroker(args.host, args.port, args.ack_delay)
+        print(f"✓ Broker stand-in listening on {args.host}:{await broker.start()}")
+        try:
+            while True:
+                await asyncio.sleep(1)
+                if broker.messages:
+                    size = sum(len(payload) for _, payload in broker.messages)
+                    print(f"  {len(broker.messages)} messages, {size / 1e6:.2f} MB")
+                    broker.messages.clear()
+        finally:
+            await broker.stop()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
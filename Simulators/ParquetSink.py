@@ -0,0 +1,189 @@
+"""
+Parquet file sink for CAN signal records
+Writes MessageBatches into Hive-style date/hour/signal_type partitions,
+buffering each partition up to a row group and rolling files on size or age
+"""
+
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from MessageBatch import MessageBatch, SignalTable
+
+US_PER_HOUR = 3600 * 1000000
+
+PARQUET_SCHEMA = pa.schema([
+    ('timestamp', pa.timestamp('us', tz='UTC')),
+    ('vehicle_id', pa.int32()),
+    ('can_id', pa.int32()),
+    ('signal_name', pa.dictionary(pa.int32(), pa.string())),
+    ('raw_value', pa.int64()),
+    ('physical_value', pa.float64()),
+    ('unit', pa.dictionary(pa.int32(), pa.string())),
+    ('payload', pa.binary(8)),
+])
+
+
+class _OpenFile:
+    """One partition's file being written, plus the rows waiting for its next row group"""
+
+    def __init__(self, path: str, compression: str):
+        self.path = path
+        # Hidden until closed, so readers never see a file without a footer
+        self.tmp_path = os.path.join(os.path.dirname(path), '.' + os.path.basename(path))
+        self.handle = open(self.tmp_path, 'wb')
+        self.writer = pq.ParquetWriter(self.handle, PARQUET_SCHEMA, compression=compression)
+        self.opened = time.monotonic()
+        self.pending: List[pa.RecordBatch] = []
+        self.pending_rows = 0
+
+
+class ParquetSink:
+    """
+    Rolling Parquet writer, an alternative to the database insert paths.
+
+    Files land in root/date=YYYY-MM-DD/hour=HH/signal_type=TYPE/ (UTC,
+    by record timestamp). Rows are buffered per partition until
+    row_group_size, then written as one row group. A file is closed and
+    renamed into place once it reaches max_file_bytes, has been open for
+    max_file_age_s, or its hour is over: records more than an hour newer
+    have arrived, which also bounds open files during a fast backfill.
+    """
+
+    def __init__(self, root: str, row_group_size: int = 100000, max_file_bytes: int = 256 * 1024 * 1024,
+                 max_file_age_s: float = 3600.0, compression: str = 'zstd'):
+        self.root = root
+        self.row_group_size = row_group_size
+        self.max_file_bytes = max_file_bytes
+        self.max_file_age_s = max_file_age_s
+        self.compression = compression
+        self.signals = SignalTable()  # for rows not already in a MessageBatch
+        self._files: Dict[Tuple[int, str], _OpenFile] = {}
+        self._sequence = 0
+        self._newest_hour = None
+
+        self.rows_written = 0
+        self.files_written = 0
+
+    def write(self, batch: MessageBatch) -> int:
+        """Buffer a batch into its partitions, writing every row group that fills up"""
+        n = len(batch)
+        if not n:
+            return 0
+        entries = batch.signals.entries
+        signal_index = batch.signal_index[:n]
+        hours = batch.timestamps[:n] // US_PER_HOUR
+
+        # Group rows by (hour, signal_type) with one sort instead of a scan per partition
+        signal_types = sorted({signal_type for signal_type, _, _ in entries})
+        type_of_signal = np.array([signal_types.index(signal_type) for signal_type, _, _ in entries], dtype=np.int64)
+        keys = (hours - hours.min()) * len(signal_types) + type_of_signal[signal_index]
+        order = np.argsort(keys, kind='stable')
+        _, starts, counts = np.unique(keys[order], return_index=True, return_counts=True)
+
+        names = pa.array([name for _, name, _ in entries], type=pa.string())
+        units = pa.array([unit for _, _, unit in entries], type=pa.string())
+        for start, count in zip(starts, counts):
+            rows = order[start:start + count]
+            first = rows[0]
+            partition = (int(hours[first]), entries[signal_index[first]][0])
+            record_batch = pa.RecordBatch.from_arrays([
+                pa.array(batch.timestamps[rows], type=pa.timestamp('us', tz='UTC')),
+                pa.array(batch.vehicle_ids[rows], type=pa.int32()),
+                pa.array(batch.can_ids[rows].astype(np.int32), type=pa.int32()),
+                pa.DictionaryArray.from_arrays(pa.array(signal_index[rows], type=pa.int32()), names),
+                pa.array(batch.raw[rows], type=pa.int64()),
+                pa.array(batch.physical[rows], type=pa.float64()),
+                pa.DictionaryArray.from_arrays(pa.array(signal_index[rows], type=pa.int32()), units),
+                pa.FixedSizeBinaryArray.from_buffers(pa.binary(8), len(rows),
+                                                     [None, pa.py_buffer(batch.payload[rows].tobytes())]),
+            ], schema=PARQUET_SCHEMA)
+            self._append(partition, record_batch)
+
+        self.rows_written += n
+        newest = int(hours.max())
+        self._newest_hour = newest if self._newest_hour is None else max(self._newest_hour, newest)
+        self._roll_expired()
+        return n
+
+    def write_rows(self, rows: Sequence[Sequence]) -> int:
+        """Write row tuples shaped like MessageBatch.rows()"""
+        batch = MessageBatch(len(rows), self.signals)
+        batch.append_rows(rows)
+        return self.write(batch)
+
+    def insert_messages(self, messages: List[Dict]):
+        """Drop-in for TimescaleDBConnector.insert_messages: dicts with epoch-second timestamps"""
+        self.write_rows([
+            (msg['timestamp'], msg['can_id'], msg['signal_type'], msg['signal_name'], msg['raw_value'],
+             msg['physical_value'], msg['unit'], msg['payload'] if 'payload' in msg else msg['data_hex'],
+             msg.get('vehicle_id', 0))
+            for msg in messages
+        ])
+        print(f"Wrote {len(messages)} messages to {self.root}")
+
+    def flush(self):
+        """Write every partially filled row group without closing files"""
+        for open_file in self._files.values():
+            self._write_row_group(open_file)
+
+    def close(self):
+        """Flush and finalize every open file"""
+        for partition in list(self._files):
+            self._close_file(partition)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _partition_dir(self, partition: Tuple[int, str]) -> str:
+        hour, signal_type = partition
+        start = datetime.fromtimestamp(hour * 3600, timezone.utc)
+        return os.path.join(self.root, f"date={start:%Y-%m-%d}", f"hour={start:%H}",
+                            f"signal_type={signal_type}")
+
+    def _append(self, partition: Tuple[int, str], record_batch: pa.RecordBatch):
+        open_file = self._files.get(partition)
+        if open_file is None:
+            directory = self._partition_dir(partition)
+            os.makedirs(directory, exist_ok=True)
+            self._sequence += 1
+            name = f"part-{os.getpid()}-{int(time.time())}-{self._sequence:05d}.parquet"
+            open_file = self._files[partition] = _OpenFile(os.path.join(directory, name), self.compression)
+
+        open_file.pending.append(record_batch)
+        open_file.pending_rows += record_batch.num_rows
+        if open_file.pending_rows >= self.row_group_size:
+            self._write_row_group(open_file)
+            if open_file.handle.tell() >= self.max_file_bytes:
+                self._close_file(partition)
+
+    def _write_row_group(self, open_file: _OpenFile):
+        if not open_file.pending:
+            return
+        table = pa.Table.from_batches(open_file.pending, schema=PARQUET_SCHEMA)
+        open_file.writer.write_table(table, row_group_size=max(table.num_rows, 1))
+        open_file.pending = []
+        open_file.pending_rows = 0
+
+    def _close_file(self, partition: Tuple[int, str]):
+        open_file = self._files.pop(partition)
+        self._write_row_group(open_file)
+        open_file.writer.close()
+        open_file.handle.close()
+        os.replace(open_file.tmp_path, open_file.path)
+        self.files_written += 1
+
+    def _roll_expired(self):
+        """Close files open longer than max_file_age_s or whose hour has passed"""
+        now = time.monotonic()
+        for partition, open_file in list(self._files.items()):
+            if now - open_file.opened >= self.max_file_age_s or partition[0] < self._newest_hour - 1:
+                self._close_file(partition)
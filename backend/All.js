@@ -237,7 +237,7 @@ class RawMessageController {
           raw_value,
           physical_value,
           unit,
-          data_hex
+          COALESCE(data_hex, encode(payload, 'hex')) AS data_hex
         FROM can_messages
         WHERE timestamp > NOW() - INTERVAL '${minutes} minutes'
         ORDER BY timestamp DESC
@@ -267,7 +267,7 @@ class RawMessageController {
           raw_value,
           physical_value,
           unit,
-          data_hex
+          COALESCE(data_hex, encode(payload, 'hex')) AS data_hex
         FROM can_messages
         WHERE can_id = $1
           AND timestamp > NOW() - INTERVAL '${minutes} minutes'
@@ -298,14 +298,14 @@ class RawMessageController {
           raw_value,
           physical_value,
           unit,
-          data_hex
+          COALESCE(data_hex, encode(payload, 'hex')) AS data_hex
         FROM can_messages
         WHERE timestamp > NOW() - INTERVAL '${minutes} minutes'
           AND (
             can_id ILIKE $1
             OR signal_type ILIKE $1
             OR signal_name ILIKE $1
-            OR data_hex ILIKE $1
+            OR COALESCE(data_hex, encode(payload, 'hex')) ILIKE $1
           )
         ORDER BY timestamp DESC
         LIMIT 1000
@@ -358,7 +358,7 @@ class RawMessageController {
           raw_value,
           physical_value,
           unit,
-          data_hex
+          COALESCE(data_hex, encode(payload, 'hex')) AS data_hex
         FROM can_messages
         WHERE timestamp BETWEEN $1 AND $2
         ORDER BY timestamp DESC
@@ -392,7 +392,7 @@ class RawMessageController {
           raw_value,
           physical_value,
           unit,
-          data_hex
+          COALESCE(data_hex, encode(payload, 'hex')) AS data_hex
         FROM can_messages
         WHERE can_id = ANY($1)
           AND timestamp > NOW() - INTERVAL '${minutes} minutes'
@@ -427,7 +427,7 @@ class RawMessageController {
           raw_value,
           physical_value,
           unit,
-          data_hex
+          COALESCE(data_hex, encode(payload, 'hex')) AS data_hex
         FROM can_messages
         WHERE signal_type = ANY($1)
           AND timestamp > NOW() - INTERVAL '${minutes} minutes'
@@ -506,7 +506,7 @@ class RawMessageController {
           raw_value,
           physical_value,
           unit,
-          data_hex
+          COALESCE(data_hex, encode(payload, 'hex')) AS data_hex
         FROM can_messages
         WHERE ${conditions.join(' AND ')}
         ORDER BY timestamp DESC
@@ -718,7 +718,7 @@ export function initializeWebSocket(server) {
           raw_value,
           physical_value,
           unit,
-          data_hex
+          COALESCE(data_hex, encode(payload, 'hex')) AS data_hex
         FROM can_messages
         WHERE timestamp > NOW() - INTERVAL '10 seconds'
         ORDER BY signal_name, timestamp DESC
@@ -741,7 +741,7 @@ export function initializeWebSocket(server) {
           raw_value,
           physical_value,
           unit,
-          data_hex
+          COALESCE(data_hex, encode(payload, 'hex')) AS data_hex
         FROM can_messages
         WHERE timestamp > NOW() - INTERVAL '2 seconds'
         ORDER BY timestamp DESC
@@ -16,7 +16,7 @@ export  class RawMessageController {
           raw_value,
           physical_value,
           unit,
-          data_hex
+          COALESCE(data_hex, encode(payload, 'hex')) AS data_hex
         FROM can_messages
         WHERE timestamp > NOW() - INTERVAL '${minutes} minutes'
         ORDER BY timestamp DESC
@@ -46,7 +46,7 @@ export  class RawMessageController {
           raw_value,
           physical_value,
           unit,
-          data_hex
+          COALESCE(data_hex, encode(payload, 'hex')) AS data_hex
         FROM can_messages
         WHERE can_id = $1
           AND timestamp > NOW() - INTERVAL '${minutes} minutes'
@@ -77,14 +77,14 @@ export  class RawMessageController {
           raw_value,
           physical_value,
           unit,
-          data_hex
+          COALESCE(data_hex, encode(payload, 'hex')) AS data_hex
         FROM can_messages
         WHERE timestamp > NOW() - INTERVAL '${minutes} minutes'
           AND (
             can_id ILIKE $1
             OR signal_type ILIKE $1
             OR signal_name ILIKE $1
-            OR data_hex ILIKE $1
+            OR COALESCE(data_hex, encode(payload, 'hex')) ILIKE $1
           )
         ORDER BY timestamp DESC
         LIMIT 1000
@@ -137,7 +137,7 @@ export  class RawMessageController {
           raw_value,
           physical_value,
           unit,
-          data_hex
+          COALESCE(data_hex, encode(payload, 'hex')) AS data_hex
         FROM can_messages
         WHERE timestamp BETWEEN $1 AND $2
         ORDER BY timestamp DESC
@@ -171,7 +171,7 @@ export  class RawMessageController {
           raw_value,
           physical_value,
           unit,
-          data_hex
+          COALESCE(data_hex, encode(payload, 'hex')) AS data_hex
         FROM can_messages
         WHERE can_id = ANY($1)
           AND timestamp > NOW() - INTERVAL '${minutes} minutes'
@@ -206,7 +206,7 @@ export  class RawMessageController {
           raw_value,
           physical_value,
           unit,
-          data_hex
+          COALESCE(data_hex, encode(payload, 'hex')) AS data_hex
         FROM can_messages
         WHERE signal_type = ANY($1)
           AND timestamp > NOW() - INTERVAL '${minutes} minutes'
@@ -285,7 +285,7 @@ export  class RawMessageController {
           raw_value,
           physical_value,
           unit,
-          data_hex
+          COALESCE(data_hex, encode(payload, 'hex')) AS data_hex
         FROM can_messages
         WHERE ${conditions.join(' AND ')}
         ORDER BY timestamp DESC
@@ -37,7 +37,7 @@ export function initializeWebSocket(server) {
           raw_value,
           physical_value,
           unit,
-          data_hex
+          COALESCE(data_hex, encode(payload, 'hex')) AS data_hex
         FROM can_messages
         WHERE timestamp > NOW() - INTERVAL '10 seconds'
         ORDER BY signal_name, timestamp DESC
@@ -60,7 +60,7 @@ export function initializeWebSocket(server) {
           raw_value,
           physical_value,
           unit,
-          data_hex
+          COALESCE(data_hex, encode(payload, 'hex')) AS data_hex
         FROM can_messages
         WHERE timestamp > NOW() - INTERVAL '2 seconds'
         ORDER BY timestamp DESC
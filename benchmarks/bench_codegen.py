@@ -0,0 +1,88 @@
+"""
+Throughput benchmark: generated straight-line decoders vs a naive per-bit decoder
+
+Usage: python benchmarks/bench_codegen.py [num_frames]
+"""
+
+import importlib.util
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "Simulators"))
+
+from DBCparser import DBCParser, CANMessage  # noqa: E402
+from synthetic_dbc import make_dbc  # noqa: E402
+
+
+def naive_decode(msg: CANMessage, data: bytes) -> dict:
+    """Reference decoder walking each signal one bit at a time"""
+    signals = {}
+    for sig in msg.signals:
+        raw = 0
+        if sig.byte_order == 'little_endian':
+            for i in range(sig.length):
+                pos = sig.start_bit + i
+                raw |= ((data[pos // 8] >> (pos % 8)) & 1) << i
+        else:
+            pos = sig.start_bit
+            for _ in range(sig.length):
+                raw = (raw << 1) | ((data[pos // 8] >> (pos % 8)) & 1)
+                pos = pos + 15 if pos % 8 == 0 else pos - 1
+        if sig.value_type == 'signed' and raw & (1 << (sig.length - 1)):
+            raw -= 1 << sig.length
+        signals[sig.name] = sig.raw_to_physical(raw)
+    return signals
+
+
+def load_module(path: Path):
+    spec = importlib.util.spec_from_file_location("can_messages_generated", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def main(num_frames: int = 200_000):
+    with tempfile.TemporaryDirectory() as tmp:
+        dbc = make_dbc(Path(tmp) / "bench.dbc", num_messages=50, signals_per_message=8)
+        parser = DBCParser(str(dbc))
+        messages = parser.parse()
+        generated = Path(tmp) / "can_messages_generated.py"
+        parser.generate_python_code(str(generated))
+        module = load_module(generated)
+    
+    rng = random.Random(7)
+    ids = list(messages)
+    frames = [(rng.choice(ids), rng.randbytes(8)) for _ in range(num_frames)]
+    
+    # Correctness check against the reference decoder
+    for can_id, data in frames[:5000]:
+        expected = naive_decode(messages[can_id], data)
+        actual = module.DECODERS[can_id](data)
+        for name, value in expected.items():
+            assert abs(actual[name] - value) < 1e-9, (hex(can_id), name, actual[name], value)
+        cls = getattr(module, messages[can_id].name)
+        assert cls.decode_raw(cls.encode(**actual)) == cls.decode_raw(data)
+    
+    decoders = module.DECODERS
+    start = time.perf_counter()
+    for can_id, data in frames:
+        decoders[can_id](data)
+    generated_s = time.perf_counter() - start
+    
+    sample = frames[: num_frames // 10]
+    start = time.perf_counter()
+    for can_id, data in sample:
+        naive_decode(messages[can_id], data)
+    naive_s = (time.perf_counter() - start) * (len(frames) / len(sample))
+    
+    print(f"\nDecoded {num_frames} frames (8 signals each)")
+    print(f"  generated: {num_frames / generated_s:12,.0f} frames/s")
+    print(f"  naive:     {num_frames / naive_s:12,.0f} frames/s (extrapolated)")
+    print(f"  speedup:   {naive_s / generated_s:.1f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000)
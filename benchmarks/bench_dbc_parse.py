@@ -0,0 +1,51 @@
+"""
+Parse-time benchmark on a synthetic DBC (default: 6250 messages x 8 = 50k signals)
+
+Usage: python benchmarks/bench_dbc_parse.py [num_messages]
+"""
+
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "Simulators"))
+
+from DBCparser import DBCParser  # noqa: E402
+from synthetic_dbc import make_dbc  # noqa: E402
+
+
+def main(num_messages: int = 6250, repeats: int = 3):
+    with tempfile.TemporaryDirectory() as tmp:
+        dbc = make_dbc(Path(tmp) / "bench.dbc", num_messages=num_messages, signals_per_message=8)
+        size_mb = dbc.stat().st_size / 1e6
+
+        timings = []
+        for _ in range(repeats):
+            parser = DBCParser(str(dbc), use_cache=False)
+            start = time.perf_counter()
+            messages = parser.parse()
+            timings.append(time.perf_counter() - start)
+
+        # Compiled cache: first call writes it, later calls load it
+        DBCParser(str(dbc)).parse()
+        cached_timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            cached = DBCParser(str(dbc)).parse()
+            cached_timings.append(time.perf_counter() - start)
+        assert cached == messages
+
+    num_signals = sum(len(msg.signals) for msg in messages.values())
+    assert num_signals == num_messages * 8
+    assert all(msg.cycle_time and msg.comment for msg in messages.values())
+    assert all(msg.signals[0].choices and msg.signals[0].comment for msg in messages.values())
+
+    best = min(timings)
+    print(f"\nParsed {len(messages)} messages / {num_signals} signals ({size_mb:.1f} MB)")
+    print(f"  parse, best of {repeats}: {best * 1000:.0f} ms ({num_signals / best:,.0f} signals/s)")
+    print(f"  cache, best of {repeats}: {min(cached_timings) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 6250)
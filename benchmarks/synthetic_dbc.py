@@ -0,0 +1,60 @@
+"""
+Synthetic DBC generator shared by the benchmarks
+Produces a mix of Intel/Motorola, signed/unsigned signals at mixed cycle times
+"""
+
+import random
+from pathlib import Path
+
+CYCLE_TIMES_MS = [10, 20, 50, 100, 200, 500, 1000]
+
+
+def make_dbc(path: str, num_messages: int = 100, signals_per_message: int = 8, seed: int = 1) -> Path:
+    """Write a synthetic DBC file and return its path"""
+    rng = random.Random(seed)
+    lines = [
+        'VERSION ""',
+        '',
+        'NS_ :',
+        '',
+        'BS_:',
+        '',
+        'BU_: ECU1 ECU2 Gateway',
+        '',
+    ]
+    comments = []
+    attributes = []
+    values = []
+    
+    for m in range(num_messages):
+        msg_id = 0x100 + m
+        lines.append(f"BO_ {msg_id} Msg_{m}: 8 ECU{1 + m % 2}")
+        bit_width = 64 // signals_per_message
+        for s in range(signals_per_message):
+            length = max(1, bit_width - rng.randint(0, bit_width // 2))
+            intel = rng.random() < 0.5
+            if intel:
+                start_bit = s * bit_width
+            else:
+                # Motorola start bit is the MSB of the field
+                lsb = 63 - (s * bit_width + length - 1)
+                msb = lsb + length - 1
+                start_bit = (7 - msb // 8) * 8 + msb % 8
+            sign = '-' if rng.random() < 0.3 else '+'
+            scale = rng.choice([1, 0.5, 0.25, 0.1, 0.01])
+            offset = rng.choice([0, 0, -40, 100])
+            lines.append(
+                f' SG_ Sig_{m}_{s} : {start_bit}|{length}@{1 if intel else 0}{sign}'
+                f' ({scale},{offset}) [0|0] "unit" Gateway'
+            )
+            if s == 0:
+                comments.append(f'CM_ SG_ {msg_id} Sig_{m}_{s} "First signal of Msg_{m}";')
+                values.append(f'VAL_ {msg_id} Sig_{m}_{s} 0 "Off" 1 "On" ;')
+        lines.append('')
+        comments.append(f'CM_ BO_ {msg_id} "Synthetic message {m}";')
+        attributes.append(f'BA_ "GenMsgCycleTime" BO_ {msg_id} {rng.choice(CYCLE_TIMES_MS)};')
+    
+    lines.extend(comments + attributes + values)
+    path = Path(path)
+    path.write_text("\n".join(lines) + "\n")
+    return path
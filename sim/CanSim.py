@@ -3,16 +3,40 @@ CAN Bus Message Simulator with direct database insertion
 Generates realistic vehicle behavior and stores directly in TimescaleDB
 """
 
+import argparse
+import queue
 import random
+import sys
 import time
 import struct
 from dataclasses import dataclass
-from datetime import datetime
-from typing import List
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
 from enum import Enum
+import numpy as np
 import psycopg2
 from psycopg2.extras import execute_batch
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "Simulators"))
+
+from BackgroundWriter import BackgroundWriter  # noqa: E402
+from CanLog import CAN_EFF_MASK  # noqa: E402
+from CopyWriter import PAYLOAD_COLUMNS, PAYLOAD_FORMATS, CopyWriter, can_message_columns  # noqa: E402
+from DBCparser import DBCParser, CANSignal  # noqa: E402
+from LatestValues import LatestValues  # noqa: E402
+from MessageBatch import MessageBatch, SignalTable, epoch_us  # noqa: E402
+from Scheduler import MessageScheduler  # noqa: E402
+from Pacer import PACING_POLICIES, PacingStats, RatePacer  # noqa: E402
+
+DEFAULT_DB_CONFIG = {
+    'host': 'localhost',
+    'port': 5432,
+    'database': 'canbus',
+    'user': 'postgres',
+    'password': 'canbus_pass'
+}
+
 
 class CANSignalType(Enum):
     """Standard automotive signal types"""
@@ -24,30 +48,52 @@ class CANSignalType(Enum):
     BATTERY_VOLTAGE = 0x42
 
 
-@dataclass
-class CANMessage:
-    """Represents a single CAN message"""
-    timestamp: datetime
-    can_id: str
+@dataclass(frozen=True)
+class SignalDefinition:
+    """Frame layout of one simulated signal"""
+    can_id: int
     signal_type: str
     signal_name: str
-    raw_value: int
-    physical_value: float
     unit: str
-    data_hex: str
+    scale: float
+    offset: float
+    pack_format: str  # struct format of the raw value
+    decimals: int  # rounding of the stored physical value
+    attribute: str  # VehicleState/FleetState field holding the value
     
-    def to_tuple(self):
-        """Convert to tuple for database insertion"""
-        return (
-            self.timestamp,
-            self.can_id,
-            self.signal_type,
-            self.signal_name,
-            self.raw_value,
-            self.physical_value,
-            self.unit,
-            self.data_hex
-        )
+    @property
+    def raw_mask(self) -> int:
+        return (1 << (8 * struct.calcsize(self.pack_format))) - 1
+
+
+SIGNAL_DEFINITIONS = {
+    CANSignalType.ENGINE_RPM: SignalDefinition(
+        0x100, 'ENGINE', 'RPM', 'rpm', 0.25, 0, '>H', 2, 'rpm'),
+    CANSignalType.VEHICLE_SPEED: SignalDefinition(
+        0x101, 'VEHICLE', 'Speed', 'km/h', 0.01, 0, '>H', 2, 'speed'),
+    CANSignalType.COOLANT_TEMP: SignalDefinition(
+        0x102, 'ENGINE', 'CoolantTemp', '°C', 1.0, -40, 'B', 2, 'coolant_temp'),
+    CANSignalType.THROTTLE_POS: SignalDefinition(
+        0x103, 'ENGINE', 'ThrottlePosition', '%', 0.39, 0, 'B', 2, 'throttle'),
+    CANSignalType.FUEL_LEVEL: SignalDefinition(
+        0x104, 'FUEL', 'FuelLevel', '%', 0.39, 0, 'B', 2, 'fuel_level'),
+    CANSignalType.BATTERY_VOLTAGE: SignalDefinition(
+        0x105, 'ELECTRICAL', 'BatteryVoltage', 'V', 0.01, 0, '>H', 3, 'battery_voltage'),
+}
+
+TRIP_MODES = ['idle', 'accelerating', 'cruising', 'decelerating']
+
+# execute_batch: parameterized INSERT ... ON CONFLICT DO NOTHING (default)
+# copy:          COPY straight into can_messages, fastest but fails on duplicate keys
+# copy_merge:    COPY into a staging table, then INSERT ... ON CONFLICT DO NOTHING
+INSERT_STRATEGIES = ('execute_batch', 'copy', 'copy_merge')
+
+# postgres: insert into can_messages with the selected insert strategy (default)
+# parquet:  write date/hour/signal_type partitioned Parquet files instead
+# canlog:   write frames to a fixed-record binary CAN log (Simulators/CanLog.py)
+SINKS = ('postgres', 'parquet', 'canlog', 'mqtt')
+# Default output location of the file sinks; the MQTT sink reads backend/config/mqtt_config.json
+SINK_OUTPUTS = {'parquet': 'parquet', 'canlog': 'capture.canlog'}
 
 
 class VehicleState:
@@ -72,8 +118,7 @@ class VehicleState:
         # Change driving mode periodically for variety
         if self.mode_timer > random.uniform(5, 15):
             self.mode_timer = 0
-            modes = ['idle', 'accelerating', 'cruising', 'decelerating']
-            self.trip_mode = random.choice(modes)
+            self.trip_mode = random.choice(TRIP_MODES)
         
         # Different behavior based on mode
         if self.trip_mode == 'idle':
@@ -128,195 +173,678 @@ class VehicleState:
         self.throttle = max(0, min(100, self.throttle + random.gauss(0, 1)))
 
 
+class FleetState:
+    """
+    Struct-of-arrays state for many vehicles. Runs the same physics as
+    VehicleState, one NumPy operation per quantity for the whole fleet.
+    """
+    
+    def __init__(self, num_vehicles: int, first_vehicle_id: int = 0, seed: Optional[int] = None):
+        n = num_vehicles
+        self.rng = np.random.default_rng(seed)
+        self.vehicle_ids = np.arange(first_vehicle_id, first_vehicle_id + n, dtype=np.int64)
+        self.rpm = np.full(n, 800.0)  # idle
+        self.speed = np.zeros(n)
+        self.throttle = np.zeros(n)
+        self.coolant_temp = np.full(n, 20.0)
+        self.fuel_level = np.full(n, 75.0)
+        self.battery_voltage = np.full(n, 12.6)
+        self.trip_mode = np.zeros(n, dtype=np.int8)  # index into TRIP_MODES
+        self.mode_timer = np.zeros(n)
+    
+    def __len__(self):
+        return len(self.vehicle_ids)
+    
+    def update(self, dt: float):
+        """Advance every vehicle by dt"""
+        rng = self.rng
+        n = len(self)
+        
+        self.mode_timer += dt
+        
+        # Change driving mode periodically for variety
+        switch = self.mode_timer > rng.uniform(5, 15, n)
+        self.mode_timer[switch] = 0
+        self.trip_mode[switch] = rng.integers(0, len(TRIP_MODES), switch.sum())
+        
+        idle = self.trip_mode == 0
+        accelerating = self.trip_mode == 1
+        cruising = self.trip_mode == 2
+        decelerating = self.trip_mode == 3
+        
+        # Throttle and target RPM per mode
+        self.throttle = np.select(
+            [idle, accelerating, cruising],
+            [np.maximum(0, self.throttle - 5 * dt),
+             np.minimum(100, self.throttle + 10 * dt),
+             30 + rng.uniform(-5, 5, n)],
+            np.maximum(0, self.throttle - 8 * dt)
+        )
+        target_rpm = np.select(
+            [idle, accelerating, cruising, decelerating],
+            [800.0,
+             800 + (self.throttle / 100) * 5200,
+             2000 + rng.uniform(-100, 100, n),
+             np.maximum(800, self.rpm - 200 * dt)]
+        )
+        
+        # RPM follows target with inertia
+        self.rpm += (target_rpm - self.rpm) * 0.1
+        np.maximum(self.rpm, 0, out=self.rpm)
+        
+        # Speed follows RPM (simplified transmission model)
+        running = self.rpm > 800
+        self.speed = np.where(
+            running,
+            self.speed + ((self.rpm - 800) / 80 - self.speed) * 0.05,
+            np.maximum(0, self.speed - 1 * dt)
+        )
+        
+        # Engine temperature rises with load
+        target_temp = np.where(running, 85 + (self.throttle / 100) * 15, 20.0)
+        self.coolant_temp += (target_temp - self.coolant_temp) * 0.01
+        
+        # Fuel consumption based on throttle and RPM
+        self.fuel_level -= (self.throttle / 100) * (self.rpm / 3000) * 0.001
+        np.maximum(self.fuel_level, 0, out=self.fuel_level)
+        
+        # Battery voltage varies with load
+        self.battery_voltage = np.where(
+            self.rpm > 1000,
+            np.minimum(14.4, self.battery_voltage + 0.002),
+            np.maximum(11.5, self.battery_voltage - 0.0005)
+        )
+        
+        # Add realistic noise to all signals
+        self.rpm += rng.normal(0, 15, n)
+        self.speed += rng.normal(0, 0.3, n)
+        self.coolant_temp += rng.normal(0, 0.3, n)
+        self.battery_voltage += rng.normal(0, 0.03, n)
+        self.throttle = np.clip(self.throttle + rng.normal(0, 1, n), 0, 100)
+    
+    def fill_batch(self, batch: MessageBatch, timestamp_us: int, signal_index: List[int]):
+        """
+        Write one row per vehicle and signal into batch. signal_index holds
+        the batch signal table index of each SIGNAL_DEFINITIONS entry.
+        """
+        n = len(self)
+        for sig, sig_index in zip(SIGNAL_DEFINITIONS.values(), signal_index):
+            values = getattr(self, sig.attribute)
+            rows = batch.extend(n)
+            batch.timestamps[rows] = timestamp_us
+            batch.can_ids[rows] = sig.can_id
+            batch.signal_index[rows] = sig_index
+            batch.vehicle_ids[rows] = self.vehicle_ids
+            raw = batch.raw[rows]
+            raw[:] = np.trunc((values - sig.offset) / sig.scale)
+            batch.physical[rows] = np.round(values, sig.decimals)
+            
+            # Same zero-padded frame as the single-vehicle rows of CANSimulator._tick
+            payload = batch.payload[rows]
+            masked = raw & sig.raw_mask
+            if sig.pack_format == '>H':
+                payload[:, 0] = masked >> 8
+                payload[:, 1] = masked & 0xFF
+            else:
+                payload[:, 0] = masked
+
+
+class DBCTrafficGenerator:
+    """Generates frames for every message of a DBC with random-walk signal values"""
+    
+    def __init__(self, parser: DBCParser, signals: SignalTable, default_cycle_ms: int = 100,
+                 seed: Optional[int] = None, message_ids: Optional[List[int]] = None, vehicle_id: int = 0):
+        # message_ids restricts generation to a subset, e.g. one shard of the bus
+        messages = parser.messages
+        if message_ids is not None:
+            messages = {msg_id: messages[msg_id] for msg_id in message_ids}
+        self.default_cycle_ms = default_cycle_ms
+        self.vehicle_id = vehicle_id
+        self.rng = random.Random(seed)
+        codecs = parser.compile_codecs()
+        
+        # Per message: generated codec class, (min, max) physical range per
+        # signal, position of the multiplexor signal (None if the message is
+        # not multiplexed), and per selectable multiplexor value the physical
+        # value to send plus the batch signal index, scale and offset arrays
+        # of the signals a frame then carries
+        self.messages = {}
+        self._codecs = {}
+        self.values: Dict[int, List[float]] = {}
+        for msg_id, msg in messages.items():
+            codec = getattr(codecs, msg.name)
+            # The codec leaves out signals that do not fit the frame; messages left without any are not sent
+            msg_signals = [sig for sig in msg.signals if sig.name in codec.SIGNALS]
+            if not msg_signals:
+                continue
+            self.messages[msg_id] = msg
+            ranges = [self._signal_range(sig) for sig in msg_signals]
+            selector = next((i for i, sig in enumerate(msg_signals) if sig.multiplexer == 'M'), None)
+            mux_values = sorted({sig.multiplexer_value for sig in msg_signals} - {None})
+            if not mux_values:
+                # Nothing multiplexed: a multiplexor, if any, walks like any other signal
+                selector, mux_values = None, [None]
+            selections = []
+            for mux_value in mux_values:
+                carried = [sig for sig in msg_signals if sig.multiplexer_value in (None, mux_value)]
+                signal_index = np.array([signals.index(msg_id, msg.name, sig.name, sig.unit) for sig in carried],
+                                        dtype=np.int32)
+                scales = np.array([sig.scale for sig in carried])
+                offsets = np.array([sig.offset for sig in carried])
+                selector_value = None if mux_value is None else msg_signals[selector].raw_to_physical(mux_value)
+                selections.append((selector_value, (signal_index, scales, offsets)))
+            self._codecs[msg_id] = (codec, ranges, selector, selections)
+            self.values[msg_id] = [self.rng.uniform(lo, hi) for lo, hi in ranges]
+    
+    @staticmethod
+    def _signal_range(sig: CANSignal) -> Tuple[float, float]:
+        """Physical range from the DBC, or the full raw range when [min|max] is unset"""
+        if sig.max_value > sig.min_value:
+            return sig.min_value, sig.max_value
+        if sig.value_type == 'signed':
+            raw_lo, raw_hi = -(1 << (sig.length - 1)), (1 << (sig.length - 1)) - 1
+        else:
+            raw_lo, raw_hi = 0, (1 << sig.length) - 1
+        lo, hi = sig.raw_to_physical(raw_lo), sig.raw_to_physical(raw_hi)
+        return min(lo, hi), max(lo, hi)
+    
+    def cycle_times_ms(self) -> Dict[int, float]:
+        """GenMsgCycleTime per message, falling back to the default"""
+        return {
+            msg_id: msg.cycle_time or self.default_cycle_ms
+            for msg_id, msg in self.messages.items()
+        }
+    
+    def fill_batch(self, batch: MessageBatch, frames: List[Tuple[int, int]]):
+        """
+        Step the signals of every (msg_id, timestamp_us) frame and append one
+        row per signal it carries to batch. A multiplexed message sends one
+        randomly chosen multiplexor value per frame, and so only the signals
+        that value selects. Frames are encoded one by one, but the columns
+        are written once for the whole list.
+        """
+        if not frames:
+            return
+        gauss = self.rng.gauss
+        choice = self.rng.choice
+        raw = []
+        payloads = []
+        dlcs = []
+        layouts = []
+        for msg_id, _ in frames:
+            codec, ranges, selector, selections = self._codecs[msg_id]
+            values = self.values[msg_id]
+            for i, (lo, hi) in enumerate(ranges):
+                value = values[i] + gauss(0, 0.01 * (hi - lo))
+                values[i] = lo if value < lo else hi if value > hi else value
+            
+            if selector is None:
+                layout = selections[0][1]
+                frame = codec.encode(*values)
+                raw.extend(codec.decode_raw(frame))
+            else:
+                values[selector], layout = choice(selections)
+                frame = codec.encode(*values)
+                raw.extend(value for value in codec.decode_raw(frame) if value is not None)
+            # CAN FD frames keep their length in dlc; the payload column holds the first 8 bytes
+            payloads.append(frame[:8].ljust(8, b'\x00'))
+            dlcs.append(len(frame))
+            layouts.append(layout)
+        
+        msg_ids, timestamps = zip(*frames)
+        counts = [len(signal_index) for signal_index, _, _ in layouts]
+        rows = batch.extend(len(raw))
+        batch.timestamps[rows] = np.repeat(timestamps, counts)
+        # DBC IDs of extended frames carry CAN_EFF_FLAG; rows get the bare arbitration ID like BatchDecoder's
+        batch.can_ids[rows] = np.repeat(msg_ids, counts) & CAN_EFF_MASK
+        batch.signal_index[rows] = np.concatenate([signal_index for signal_index, _, _ in layouts])
+        batch.raw[rows] = raw
+        batch.physical[rows] = (batch.raw[rows] * np.concatenate([scales for _, scales, _ in layouts])
+                                + np.concatenate([offsets for _, _, offsets in layouts]))
+        batch.vehicle_ids[rows] = self.vehicle_id
+        frame_bytes = np.frombuffer(b''.join(payloads), dtype=np.uint8).reshape(-1, 8)
+        batch.payload[rows] = np.repeat(frame_bytes, counts, axis=0)
+        batch.dlc[rows] = np.repeat(dlcs, counts)
+
+
 class CANSimulator:
     """Main simulator class with direct database insertion"""
     
-    def __init__(self, db_config: dict, sample_rate_hz: float = 10.0):
+    def __init__(self, db_config: dict, sample_rate_hz: float = 10.0, dbc_file: Optional[str] = None,
+                 num_vehicles: int = 1, first_vehicle_id: int = 0,
+                 bus_message_ids: Optional[List[int]] = None,
+                 insert_strategy: str = 'execute_batch', copy_format: str = 'binary',
+                 background_writer: bool = False, max_pending_batches: int = 1,
+                 payload_format: str = 'hex', sink: str = 'postgres', output_path: Optional[str] = None,
+                 pacing: str = 'catch_up'):
         self.vehicle = VehicleState()
+        self.first_vehicle_id = first_vehicle_id
+        # Fleet mode: vectorized state for many vehicles, rows tagged with vehicle_id
+        self.fleet = FleetState(num_vehicles, first_vehicle_id) if num_vehicles > 1 else None
         self.sample_rate = sample_rate_hz
+        # What run() does with ticks that fall behind schedule, see Pacer.PACING_POLICIES
+        if pacing not in PACING_POLICIES:
+            raise ValueError(f"Unknown pacing policy {pacing!r}, expected one of {PACING_POLICIES}")
+        self.pacing = pacing
         self.db_config = db_config
-        self.batch_buffer = []
         self.batch_size = 500
+        # Columnar buffer filled in place each tick; the signal table is shared
+        # by every batch so rows carry a small signal index instead of strings
+        self.signals = SignalTable()
+        self.batch_buffer = MessageBatch(capacity=2 * self.batch_size, signals=self.signals)
+        self._signal_index = [
+            self.signals.index(sig.can_id, sig.signal_type, sig.signal_name, sig.unit)
+            for sig in SIGNAL_DEFINITIONS.values()
+        ]
+        
+        if insert_strategy not in INSERT_STRATEGIES:
+            raise ValueError(f"Unknown insert strategy {insert_strategy!r}, expected one of {INSERT_STRATEGIES}")
+        self.insert_strategy = insert_strategy
+        # 'bytea' writes the 8 frame bytes to the payload column instead of hex text to data_hex
+        self.payload_format = payload_format
+        self.copy_writer = CopyWriter(columns=can_message_columns(payload_format), fmt=copy_format)
+        # Newest value per signal, upserted with each batch (sql/04_latest_signal_values.sql)
+        self.latest = LatestValues()
+        self._insert_sql = f"""
+                INSERT INTO can_messages 
+                (timestamp, can_id, signal_type, signal_name, raw_value, physical_value, unit, {PAYLOAD_COLUMNS[payload_format][0]}, vehicle_id)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT DO NOTHING
+            """
+        
+        # File or MQTT sink replacing the database, opened per run
+        if sink not in SINKS:
+            raise ValueError(f"Unknown sink {sink!r}, expected one of {SINKS}")
+        self.sink = sink
+        self.output_path = output_path or SINK_OUTPUTS.get(sink)
+        self.file_sink = None
+        
+        # Writer thread draining full buffers while generation continues
+        self.background_writer = background_writer
+        self.max_pending_batches = max_pending_batches
+        self.writer: Optional[BackgroundWriter] = None
+        self._spare_batches: queue.SimpleQueue = queue.SimpleQueue()
+        
+        # DBC bus mode: every message of the DBC on its own cycle time
+        self.bus = None
+        if dbc_file:
+            parser = DBCParser(dbc_file)
+            parser.parse()
+            self.bus = DBCTrafficGenerator(parser, self.signals, message_ids=bus_message_ids,
+                                           vehicle_id=first_vehicle_id)
         
     def _encode_signal(self, value: float, scale: float, offset: float) -> int:
         """Convert physical value to raw CAN value"""
         return int((value - offset) / scale)
     
-    def _create_can_frame(self, can_id: int, data: bytes) -> str:
-        """Create standard CAN frame and return as hex string"""
-        frame = data[:8].ljust(8, b'\x00')
-        return frame.hex()
-    
-    def generate_message(self, current_time: datetime, signal_type: CANSignalType) -> CANMessage:
-        """Generate a single CAN message based on vehicle state"""
-        
-        if signal_type == CANSignalType.ENGINE_RPM:
-            raw = self._encode_signal(self.vehicle.rpm, 0.25, 0)
-            data = struct.pack('>H', raw & 0xFFFF)
-            return CANMessage(
-                timestamp=current_time,
-                can_id='0x100',
-                signal_type='ENGINE',
-                signal_name='RPM',
-                raw_value=raw,
-                physical_value=round(self.vehicle.rpm, 2),
-                unit='rpm',
-                data_hex=self._create_can_frame(0x100, data)
-            )
-            
-        elif signal_type == CANSignalType.VEHICLE_SPEED:
-            raw = self._encode_signal(self.vehicle.speed, 0.01, 0)
-            data = struct.pack('>H', raw & 0xFFFF)
-            return CANMessage(
-                timestamp=current_time,
-                can_id='0x101',
-                signal_type='VEHICLE',
-                signal_name='Speed',
-                raw_value=raw,
-                physical_value=round(self.vehicle.speed, 2),
-                unit='km/h',
-                data_hex=self._create_can_frame(0x101, data)
-            )
-            
-        elif signal_type == CANSignalType.COOLANT_TEMP:
-            raw = self._encode_signal(self.vehicle.coolant_temp, 1.0, -40)
-            data = struct.pack('B', raw & 0xFF)
-            return CANMessage(
-                timestamp=current_time,
-                can_id='0x102',
-                signal_type='ENGINE',
-                signal_name='CoolantTemp',
-                raw_value=raw,
-                physical_value=round(self.vehicle.coolant_temp, 2),
-                unit='°C',
-                data_hex=self._create_can_frame(0x102, data)
-            )
-            
-        elif signal_type == CANSignalType.THROTTLE_POS:
-            raw = self._encode_signal(self.vehicle.throttle, 0.39, 0)
-            data = struct.pack('B', raw & 0xFF)
-            return CANMessage(
-                timestamp=current_time,
-                can_id='0x103',
-                signal_type='ENGINE',
-                signal_name='ThrottlePosition',
-                raw_value=raw,
-                physical_value=round(self.vehicle.throttle, 2),
-                unit='%',
-                data_hex=self._create_can_frame(0x103, data)
-            )
-            
-        elif signal_type == CANSignalType.FUEL_LEVEL:
-            raw = self._encode_signal(self.vehicle.fuel_level, 0.39, 0)
-            data = struct.pack('B', raw & 0xFF)
-            return CANMessage(
-                timestamp=current_time,
-                can_id='0x104',
-                signal_type='FUEL',
-                signal_name='FuelLevel',
-                raw_value=raw,
-                physical_value=round(self.vehicle.fuel_level, 2),
-                unit='%',
-                data_hex=self._create_can_frame(0x104, data)
-            )
-            
-        elif signal_type == CANSignalType.BATTERY_VOLTAGE:
-            raw = self._encode_signal(self.vehicle.battery_voltage, 0.01, 0)
-            data = struct.pack('>H', raw & 0xFFFF)
-            return CANMessage(
-                timestamp=current_time,
-                can_id='0x105',
-                signal_type='ELECTRICAL',
-                signal_name='BatteryVoltage',
-                raw_value=raw,
-                physical_value=round(self.vehicle.battery_voltage, 3),
-                unit='V',
-                data_hex=self._create_can_frame(0x105, data)
-            )
+    def write_rows(self, conn, cur, batch: MessageBatch) -> int:
+        """
+        Insert a batch using the selected insert strategy and commit.
+        Returns the rows written; for copy_merge, only those not already stored.
+        """
+        if self.file_sink is not None:
+            self.file_sink.write(batch)
+            return len(batch)
+        count = len(batch)
+        if self.insert_strategy == 'copy':
+            self.copy_writer.copy(cur, batch)
+        elif self.insert_strategy == 'copy_merge':
+            count = self.copy_writer.copy_merge(cur, batch)
+        else:
+            execute_batch(cur, self._insert_sql, batch.rows(self.payload_format), page_size=500)
+        self.latest.add_batch(batch)
+        self.latest.upsert(cur)
+        
+        conn.commit()
+        return count
     
     def flush_batch(self, conn, cur):
-        """Insert buffered messages to database"""
+        """Insert buffered messages to database using the selected insert strategy"""
         if not self.batch_buffer:
-            return
-        
-        execute_batch(cur, """
-            INSERT INTO can_messages 
-            (timestamp, can_id, signal_type, signal_name, raw_value, physical_value, unit, data_hex)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-            ON CONFLICT DO NOTHING
-        """, self.batch_buffer, page_size=500)
+            return 0
         
-        conn.commit()
-        count = len(self.batch_buffer)
+        count = self.write_rows(conn, cur, self.batch_buffer)
         self.batch_buffer.clear()
         return count
     
-    def run(self, num_samples: int = 10000):
-        """Run simulation and insert directly to database"""
+    def _connect(self):
+        """Open the database connection or file sink and, if enabled, start the writer thread on it"""
+        conn = cur = None
+        if self.sink == 'parquet':
+            # pyarrow is only needed when the Parquet sink is used
+            from ParquetSink import ParquetSink
+            self.file_sink = ParquetSink(self.output_path)
+        elif self.sink == 'canlog':
+            from CanLog import CanLogWriter
+            self.file_sink = CanLogWriter(self.output_path)
+        elif self.sink == 'mqtt':
+            # output_path, if given, is an alternative broker/topic config
+            from MqttSink import MqttSink
+            self.file_sink = MqttSink(self.output_path)
+        else:
+            conn = psycopg2.connect(**self.db_config)
+            cur = conn.cursor()
+        if self.background_writer:
+            # From here on only the writer thread touches conn/cur
+            self.writer = BackgroundWriter(
+                lambda batch: self._write_and_recycle(conn, cur, batch),
+                max_pending=self.max_pending_batches
+            ).start()
+        return conn, cur
+    
+    def _disconnect(self, conn, cur):
+        """Close the database connection, or finalize the file sink"""
+        if self.file_sink is not None:
+            file_sink, self.file_sink = self.file_sink, None
+            file_sink.close()
+            if self.sink != 'mqtt':
+                print(f"✓ {self.sink} output written to {self.output_path}")
+            return
+        cur.close()
+        conn.close()
+    
+    def _write_and_recycle(self, conn, cur, batch: MessageBatch) -> int:
+        """Writer thread: insert a batch, then hand its arrays back for refilling"""
+        count = self.write_rows(conn, cur, batch)
+        batch.clear()
+        self._spare_batches.put(batch)
+        return count
+    
+    def _flush(self, conn, cur) -> int:
+        """Flush the batch buffer inline, or swap it out to the writer thread"""
+        if self.writer is None:
+            return self.flush_batch(conn, cur)
+        batch = self.batch_buffer
+        try:
+            self.batch_buffer = self._spare_batches.get_nowait()
+        except queue.Empty:
+            self.batch_buffer = batch.empty_like()
+        self.writer.submit(batch)
+        return len(batch)
+    
+    def _finish_writer(self, total_inserted: int) -> int:
+        """Wait for queued batches and report what the database sustained"""
+        if self.writer is None:
+            return total_inserted
+        writer, self.writer = self.writer, None
+        total_inserted = writer.close()
+        print(f"Writer: {writer.batches_written} batches, DB sustained {writer.sustained_rate:,.0f} rows/s, "
+              f"generation blocked {writer.blocked_time_s:.1f}s on backpressure")
+        return total_inserted
+    
+    def _abort_writer(self):
+        """Stop the writer thread after a failure so the connection can be rolled back"""
+        if self.writer is None:
+            return
+        writer, self.writer = self.writer, None
+        try:
+            writer.close()
+        except RuntimeError:
+            pass
+    
+    def run(self, num_samples: int = 10000) -> int:
+        """Run simulation and insert directly to database, returning the rows inserted"""
         
         # Connect to database
-        conn = psycopg2.connect(**self.db_config)
-        cur = conn.cursor()
+        conn, cur = self._connect()
+        
+        rows_per_tick = len(CANSignalType) * (len(self.fleet) if self.fleet is not None else 1)
+        # Whole ticks, rounded up so a fleet larger than num_samples still runs one
+        num_ticks = max(1, -(-num_samples // rows_per_tick))
         
-        print(f"Starting simulation for {num_samples} samples at {self.sample_rate}Hz")
-        print(f"Estimated duration: {num_samples / (self.sample_rate * 6):.1f} seconds")
+        print(f"Starting simulation for {num_ticks * rows_per_tick} samples at {self.sample_rate}Hz "
+              f"({rows_per_tick * self.sample_rate:,.0f} records/s, {self.pacing} pacing)")
+        print(f"Estimated duration: {max(num_ticks - 1, 0) / self.sample_rate:.1f} seconds")
         
         dt = 1.0 / self.sample_rate
         total_inserted = 0
+        pacer = RatePacer(self.sample_rate, policy=self.pacing)
+        start_time = datetime.now()
+        previous = -1
         
         try:
-            for i in range(num_samples // 6):  # Divide by 6 signal types
-                current_time = datetime.now()
-                
-                # Update vehicle physics
-                self.vehicle.update(dt)
-                
-                # Generate messages for all signal types
-                for signal_type in CANSignalType:
-                    msg = self.generate_message(current_time, signal_type)
-                    self.batch_buffer.append(msg.to_tuple())
+            for tick, offset in pacer.ticks(num_ticks):
+                # Stamped with the scheduled time, so late ticks keep exact spacing;
+                # after dropped ticks the physics steps over the whole gap
+                self._tick(start_time + timedelta(seconds=offset), (tick - previous) * dt)
+                previous = tick
                 
                 # Flush batch when buffer is full
                 if len(self.batch_buffer) >= self.batch_size:
-                    count = self.flush_batch(conn, cur)
+                    count = self._flush(conn, cur)
                     total_inserted += count
-                    print(f"Inserted {total_inserted} records... (Trip mode: {self.vehicle.trip_mode}, "
-                          f"RPM: {self.vehicle.rpm:.0f}, Speed: {self.vehicle.speed:.1f} km/h)")
-                
-                # Small delay to prevent overwhelming the system
-                time.sleep(dt / 10)
+                    print(f"Inserted {total_inserted} records... ({self._status()})")
+            
+            print(pacer.stats.summary(self.sample_rate))
             
             # Flush remaining messages
             if self.batch_buffer:
-                count = self.flush_batch(conn, cur)
+                count = self._flush(conn, cur)
                 total_inserted += count
+            total_inserted = self._finish_writer(total_inserted)
             
             print(f"\n✓ Simulation complete!")
             print(f"✓ Total records inserted: {total_inserted}")
+            return total_inserted
             
         except Exception as e:
             print(f"Error during simulation: {e}")
-            conn.rollback()
+            self._abort_writer()
+            if conn is not None:
+                conn.rollback()
             raise
         finally:
-            cur.close()
-            conn.close()
+            self._disconnect(conn, cur)
+    
+    def _tick(self, current_time: datetime, dt: float):
+        """Advance the vehicle(s) by dt and append this tick's rows to the batch buffer"""
+        timestamp_us = epoch_us(current_time)
+        if self.fleet is not None:
+            # Whole fleet in one vectorized step
+            self.fleet.update(dt)
+            self.fleet.fill_batch(self.batch_buffer, timestamp_us, self._signal_index)
+            return
+        
+        # Update vehicle physics
+        self.vehicle.update(dt)
+        
+        # Generate messages for all signal types
+        for sig, sig_index in zip(SIGNAL_DEFINITIONS.values(), self._signal_index):
+            value = getattr(self.vehicle, sig.attribute)
+            raw = self._encode_signal(value, sig.scale, sig.offset)
+            self.batch_buffer.append(timestamp_us, sig.can_id, sig_index, raw, round(value, sig.decimals),
+                                     self.first_vehicle_id, struct.pack(sig.pack_format, raw & sig.raw_mask))
+    
+    def _synthetic_ticks(self, start: datetime, duration_s: float) -> Iterator[float]:
+        """
+        Fill the batch buffer along a synthetic clock that starts at start and
+        advances by dt per step instead of following the wall clock, yielding
+        the simulated seconds after each step
+        """
+        if self.bus is not None:
+            scheduler = MessageScheduler(self.bus.cycle_times_ms())
+            start_us = epoch_us(start)
+            step = 1.0  # drain one simulated second of bus traffic per step
+            now = 0.0
+            while now < duration_s:
+                now = min(now + step, duration_s)
+                self.bus.fill_batch(self.batch_buffer, [
+                    (msg_id, start_us + round(due * 1000000)) for due, msg_id in scheduler.pop_due(now)
+                ])
+                yield now
+        else:
+            dt = 1.0 / self.sample_rate
+            for i in range(int(duration_s * self.sample_rate)):
+                elapsed = i * dt
+                self._tick(start + timedelta(seconds=elapsed), dt)
+                yield elapsed
+    
+    def backfill(self, start: datetime, duration_s: float, rate_hz: Optional[float] = None) -> int:
+        """
+        Generate duration_s of history beginning at start, as fast as the CPU
+        and database allow. rate_hz overrides the vehicle-mode sample rate;
+        bus mode always follows the DBC cycle times.
+        """
+        if rate_hz:
+            self.sample_rate = rate_hz
+        
+        conn, cur = self._connect()
+        
+        end = start + timedelta(seconds=duration_s)
+        print(f"Backfilling {start} -> {end} ({timedelta(seconds=duration_s)})")
+        
+        total_inserted = 0
+        simulated = 0.0
+        wall_start = time.monotonic()
+        last_report = wall_start
+        
+        try:
+            for simulated in self._synthetic_ticks(start, duration_s):
+                if len(self.batch_buffer) >= self.batch_size:
+                    total_inserted += self._flush(conn, cur)
+                    if time.monotonic() - last_report >= 1.0:
+                        last_report = time.monotonic()
+                        speedup = simulated / (last_report - wall_start)
+                        print(f"Inserted {total_inserted} records... simulated "
+                              f"{timedelta(seconds=int(simulated))} ({speedup:,.0f}x real time)")
+            
+            if self.batch_buffer:
+                total_inserted += self._flush(conn, cur)
+            total_inserted = self._finish_writer(total_inserted)
+            
+            wall = time.monotonic() - wall_start
+            print(f"\n✓ Backfill complete!")
+            print(f"✓ Total records inserted: {total_inserted} in {wall:.1f}s "
+                  f"({total_inserted / wall if wall else 0:,.0f} rows/s)")
+            return total_inserted
+            
+        except Exception as e:
+            print(f"Error during backfill: {e}")
+            self._abort_writer()
+            if conn is not None:
+                conn.rollback()
+            raise
+        finally:
+            self._disconnect(conn, cur)
+    
+    def _status(self) -> str:
+        """One-line summary of the simulated vehicle(s) for progress output"""
+        if self.fleet is not None:
+            return (f"Vehicles: {len(self.fleet)}, mean RPM: {self.fleet.rpm.mean():.0f}, "
+                    f"mean speed: {self.fleet.speed.mean():.1f} km/h")
+        return (f"Trip mode: {self.vehicle.trip_mode}, "
+                f"RPM: {self.vehicle.rpm:.0f}, Speed: {self.vehicle.speed:.1f} km/h")
+    
+    def run_bus(self, duration_s: float = 60.0) -> int:
+        """Replay the DBC bus profile in real time, each message on its own cycle time"""
+        if self.bus is None:
+            raise ValueError("run_bus requires a simulator created with dbc_file")
+        
+        cycle_times = self.bus.cycle_times_ms()
+        scheduler = MessageScheduler(cycle_times)
+        frame_rate = sum(1000.0 / cycle for cycle in cycle_times.values())
+        
+        conn, cur = self._connect()
+        
+        print(f"Starting bus simulation of {len(scheduler)} messages for {duration_s}s")
+        print(f"Expected load: {frame_rate:.0f} frames/s")
+        
+        total_inserted = 0
+        total_frames = 0
+        start_us = epoch_us(datetime.now())
+        stats = PacingStats()
+        start = stats.start
+        last_report = start
+        
+        try:
+            while scheduler.next_due() < duration_s:
+                due = scheduler.next_due()
+                wait = due - (time.monotonic() - start)
+                if wait > 0:
+                    time.sleep(wait)
+                
+                # Rows are stamped with their scheduled time, so a slow flush
+                # delays insertion but never distorts the cycle times
+                now = min(time.monotonic() - start, duration_s)
+                stats.record(now - due)
+                frames = [(msg_id, start_us + round(due * 1000000)) for due, msg_id in scheduler.pop_due(now)]
+                total_frames += len(frames)
+                self.bus.fill_batch(self.batch_buffer, frames)
+                
+                if len(self.batch_buffer) >= self.batch_size:
+                    total_inserted += self._flush(conn, cur)
+                    if time.monotonic() - last_report >= 1.0:
+                        last_report = time.monotonic()
+                        print(f"Inserted {total_inserted} records... "
+                              f"({last_report - start:.0f}s / {duration_s:.0f}s)")
+            
+            print(stats.summary(frame_rate, events=total_frames, unit='frames'))
+            if self.batch_buffer:
+                total_inserted += self._flush(conn, cur)
+            total_inserted = self._finish_writer(total_inserted)
+            
+            print(f"\n✓ Bus simulation complete!")
+            print(f"✓ Total records inserted: {total_inserted}")
+            return total_inserted
+            
+        except Exception as e:
+            print(f"Error during simulation: {e}")
+            self._abort_writer()
+            if conn is not None:
+                conn.rollback()
+            raise
+        finally:
+            self._disconnect(conn, cur)
+
+
+def parse_duration(text: str) -> float:
+    """Seconds from '90', '90s', '15m', '12h' or '7d'"""
+    units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+    if text and text[-1] in units:
+        return float(text[:-1]) * units[text[-1]]
+    return float(text)
 
 
 # Main execution
 if __name__ == "__main__":
-    # Database configuration
-    db_config = {
-        'host': 'localhost',
-        'port': 5432,
-        'database': 'canbus',
-        'user': 'postgres',
-        'password': 'canbus_pass'
-    }
+    arg_parser = argparse.ArgumentParser(description="CAN bus simulator writing to TimescaleDB")
+    arg_parser.add_argument('--dbc', help="Simulate every message of this DBC on its GenMsgCycleTime")
+    arg_parser.add_argument('--duration', type=parse_duration, default=60.0,
+                            help="Bus/backfill length: seconds or 15m, 12h, 7d")
+    arg_parser.add_argument('--samples', type=int, default=10000, help="Records to generate in vehicle mode")
+    arg_parser.add_argument('--rate', type=float, default=10.0, help="Vehicle mode sample rate in Hz")
+    arg_parser.add_argument('--vehicles', type=int, default=1, help="Simulate a fleet of this many vehicles")
+    arg_parser.add_argument('--backfill', type=datetime.fromisoformat, metavar='START',
+                            help="Generate --duration of history from START (ISO time) at full speed")
+    arg_parser.add_argument('--insert', choices=INSERT_STRATEGIES, default='execute_batch',
+                            help="Database insert strategy")
+    arg_parser.add_argument('--copy-format', choices=['text', 'binary'], default='binary',
+                            help="COPY wire format for the copy strategies")
+    arg_parser.add_argument('--payload', choices=PAYLOAD_FORMATS, default='hex',
+                            help="Store frames as hex text (data_hex) or raw bytes (payload BYTEA)")
+    arg_parser.add_argument('--writer-thread', action='store_true',
+                            help="Insert on a background thread while generation continues")
+    arg_parser.add_argument('--pacing', choices=PACING_POLICIES, default='catch_up',
+                            help="Late ticks in real-time mode: run them back to back, or drop them")
+    arg_parser.add_argument('--sink', choices=SINKS, default='postgres',
+                            help="Write to TimescaleDB, Parquet files, a CAN log or an MQTT broker")
+    arg_parser.add_argument('--output', help="File sink location (default: ./parquet/ or ./capture.canlog, "
+                                             "which may end in .gz/.zst), "
+                                             "or the MQTT config JSON (default: backend/config/mqtt_config.json)")
+    args = arg_parser.parse_args()
     
     # Create simulator and run
-    simulator = CANSimulator(db_config, sample_rate_hz=10)
-    simulator.run(num_samples=10000)
+    simulator = CANSimulator(DEFAULT_DB_CONFIG, sample_rate_hz=args.rate, dbc_file=args.dbc,
+                             num_vehicles=args.vehicles, insert_strategy=args.insert,
+                             copy_format=args.copy_format, background_writer=args.writer_thread,
+                             payload_format=args.payload, sink=args.sink, output_path=args.output,
+                             pacing=args.pacing)
+    if args.backfill:
+        simulator.backfill(args.backfill, args.duration)
+    elif args.dbc:
+        simulator.run_bus(duration_s=args.duration)
+    else:
+        simulator.run(num_samples=args.samples)
     
     print("\nSimulation complete! Check your database with:")
     print("  SELECT COUNT(*) FROM can_messages;")
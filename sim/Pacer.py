@@ -0,0 +1,101 @@
+"""
+Drift-free rate pacing for the real-time simulator
+Ticks are scheduled on absolute monotonic deadlines (start + i * period),
+so sleep overshoot and slow flushes never accumulate into rate error
+"""
+
+import time
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# catch_up: run late ticks back to back until the schedule is met again; every tick is kept
+# drop:     skip ticks whose slot has fully passed; the rate holds, the data has gaps
+PACING_POLICIES = ('catch_up', 'drop')
+
+
+class PacingStats:
+    """Lateness of every tick against its deadline"""
+
+    def __init__(self):
+        self.lateness_s: List[float] = []
+        self.dropped = 0
+        self.start = time.monotonic()
+        self.first = self.last = None  # monotonic time of the first and latest recorded tick
+
+    def record(self, lateness_s: float):
+        self.last = time.monotonic()
+        if self.first is None:
+            self.first = self.last
+        self.lateness_s.append(lateness_s)
+
+    def percentiles_ms(self, *percentiles: float) -> List[float]:
+        if not self.lateness_s:
+            return [0.0] * len(percentiles)
+        return (np.percentile(self.lateness_s, percentiles) * 1000).tolist()
+
+    def summary(self, target_rate: float, events: Optional[int] = None, elapsed_s: Optional[float] = None,
+                unit: str = 'ticks') -> str:
+        """
+        Achieved vs target rate and lateness percentiles. By default the rate
+        is measured over the intervals between the first and last tick.
+        """
+        if events is None:
+            events = len(self.lateness_s) - 1
+            elapsed_s = self.last - self.first if events > 0 else 0.0
+        elif elapsed_s is None:
+            elapsed_s = time.monotonic() - self.start
+        achieved = events / elapsed_s if elapsed_s else 0.0
+        p50, p95, p99 = self.percentiles_ms(50, 95, 99)
+        worst = max(self.lateness_s, default=0.0) * 1000
+        dropped = f", {self.dropped} dropped" if self.dropped else ""
+        return (f"Rate: {achieved:,.2f} {unit}/s achieved vs {target_rate:,.2f} target "
+                f"({100 * achieved / target_rate if target_rate else 0:.1f}%){dropped}; "
+                f"lateness p50 {p50:.2f} ms, p95 {p95:.2f} ms, p99 {p99:.2f} ms, max {worst:.2f} ms")
+
+
+class RatePacer:
+    """Yields ticks at a fixed rate, sleeping until each deadline"""
+
+    def __init__(self, rate_hz: float, policy: str = 'catch_up', spin_s: float = 0.0005):
+        """
+        spin_s is the final stretch before a deadline that is busy-waited
+        instead of slept, since sleep() overshoots by tens of microseconds.
+        """
+        if rate_hz <= 0:
+            raise ValueError("Pacing rate must be positive")
+        if policy not in PACING_POLICIES:
+            raise ValueError(f"Unknown pacing policy {policy!r}, expected one of {PACING_POLICIES}")
+        self.rate_hz = rate_hz
+        self.period = 1.0 / rate_hz
+        self.policy = policy
+        self.spin_s = spin_s
+        self.stats = PacingStats()
+
+    def ticks(self, count: int) -> Iterator[Tuple[int, float]]:
+        """
+        Yield (tick index, scheduled seconds since start) for count ticks.
+        With the drop policy, indices of skipped ticks are never yielded.
+        """
+        period = self.period
+        self.stats = stats = PacingStats()
+        start = stats.start
+        i = 0
+        while i < count:
+            deadline = start + i * period
+            now = time.monotonic()
+            if now < deadline:
+                if deadline - now > self.spin_s:
+                    time.sleep(deadline - now - self.spin_s)
+                while now < deadline:
+                    now = time.monotonic()
+            elif self.policy == 'drop' and now - deadline >= period:
+                skipped = min(int((now - deadline) / period), count - i)
+                stats.dropped += skipped
+                i += skipped
+                if i >= count:
+                    break
+                deadline = start + i * period
+            stats.record(now - deadline)
+            yield i, deadline - start
+            i += 1
@@ -0,0 +1,180 @@
+"""
+Multi-process launcher for the CAN simulator
+Shards vehicles (or DBC messages) across a process pool; every worker owns
+its own database connection and batch buffer so insert load scales with cores
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional
+
+from CanSim import (CANSimulator, CANSignalType, DBCParser, DEFAULT_DB_CONFIG, INSERT_STRATEGIES,
+                    PACING_POLICIES, PAYLOAD_FORMATS, SINK_OUTPUTS, SINKS, parse_duration)
+from CompressedIO import COMPRESSION_SUFFIXES
+
+
+@dataclass
+class ShardResult:
+    """Outcome of one worker"""
+    worker: int
+    description: str
+    rows: int
+    elapsed_s: float
+
+    @property
+    def rows_per_s(self) -> float:
+        return self.rows / self.elapsed_s if self.elapsed_s else 0.0
+
+
+def _run_shard(shard: dict) -> ShardResult:
+    """Worker entry point: build a simulator for one shard and run it"""
+    # Single-vehicle shards draw from the global random through VehicleState;
+    # seed it per worker rather than rely on the interpreter reseeding after fork
+    random.seed()
+    simulator = CANSimulator(
+        shard['db_config'],
+        sample_rate_hz=shard['sample_rate_hz'],
+        dbc_file=shard.get('dbc_file'),
+        num_vehicles=shard.get('num_vehicles', 1),
+        first_vehicle_id=shard.get('first_vehicle_id', 0),
+        bus_message_ids=shard.get('message_ids'),
+        **shard.get('options', {})
+    )
+
+    start = time.monotonic()
+    if shard.get('backfill_start'):
+        rows = simulator.backfill(shard['backfill_start'], shard['duration_s'])
+    elif shard.get('dbc_file'):
+        rows = simulator.run_bus(duration_s=shard['duration_s'])
+    else:
+        rows = simulator.run(num_samples=shard['num_samples'])
+    return ShardResult(shard['worker'], shard['description'], rows, time.monotonic() - start)
+
+
+def plan_vehicle_shards(num_vehicles: int, workers: int, num_samples: int) -> List[dict]:
+    """Split vehicles into contiguous ID ranges, one per worker"""
+    workers = max(1, min(workers, num_vehicles))
+    shards = []
+    first = 0
+    for worker in range(workers):
+        count = num_vehicles // workers + (1 if worker < num_vehicles % workers else 0)
+        shards.append({
+            'worker': worker,
+            'description': f"vehicles {first}-{first + count - 1}",
+            'num_vehicles': count,
+            'first_vehicle_id': first,
+            # Keep the per-vehicle sample count identical across shards
+            'num_samples': num_samples * count // num_vehicles,
+        })
+        first += count
+    return shards
+
+
+def plan_bus_shards(dbc_file: str, workers: int, duration_s: float) -> List[dict]:
+    """Deal DBC messages round-robin so each worker gets a similar mix of cycle times"""
+    parser = DBCParser(dbc_file)
+    messages = parser.parse()
+    by_rate = sorted(messages.values(), key=lambda msg: msg.cycle_time or 0)
+    workers = max(1, min(workers, len(by_rate)))
+    return [
+        {
+            'worker': worker,
+            'description': f"{len(by_rate[worker::workers])} messages",
+            'dbc_file': dbc_file,
+            'message_ids': [msg.message_id for msg in by_rate[worker::workers]],
+            'duration_s': duration_s,
+        }
+        for worker in range(workers)
+    ]
+
+
+def run_sharded(shards: List[dict], db_config: dict, sample_rate_hz: float = 10.0,
+                backfill_start: Optional[datetime] = None,
+                backfill_duration_s: float = 0.0,
+                simulator_options: Optional[dict] = None) -> List[ShardResult]:
+    """
+    Run every shard in its own process and print aggregate throughput.
+    With backfill_start, every shard generates the same synthetic time window.
+    simulator_options are passed to every worker's CANSimulator.
+    """
+    for shard in shards:
+        shard['db_config'] = db_config
+        shard['sample_rate_hz'] = sample_rate_hz
+        shard['options'] = dict(simulator_options or {})
+        if shard['options'].get('sink') == 'canlog':
+            # A CAN log has a single writer; give each worker its own file
+            root, ext = os.path.splitext(shard['options'].get('output_path') or SINK_OUTPUTS['canlog'])
+            if ext in COMPRESSION_SUFFIXES:
+                root, inner = os.path.splitext(root)
+                ext = inner + ext
+            shard['options']['output_path'] = f"{root}-{shard['worker']}{ext}"
+        if backfill_start:
+            shard['backfill_start'] = backfill_start
+            shard['duration_s'] = backfill_duration_s
+
+    print(f"Launching {len(shards)} workers")
+    start = time.monotonic()
+    results = []
+    with multiprocessing.Pool(len(shards)) as pool:
+        for result in pool.imap_unordered(_run_shard, shards):
+            results.append(result)
+            print(f"  worker {result.worker} ({result.description}): {result.rows} rows "
+                  f"in {result.elapsed_s:.1f}s ({result.rows_per_s:,.0f} rows/s)")
+    elapsed = time.monotonic() - start
+
+    total = sum(result.rows for result in results)
+    print(f"\n✓ {total} rows from {len(results)} workers in {elapsed:.1f}s")
+    print(f"✓ Aggregate throughput: {total / elapsed:,.0f} rows/s")
+    return sorted(results, key=lambda result: result.worker)
+
+
+def main(argv: Optional[List[str]] = None):
+    arg_parser = argparse.ArgumentParser(description="Sharded multi-process CAN simulator")
+    arg_parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Worker processes")
+    arg_parser.add_argument('--vehicles', type=int, default=1000, help="Vehicles split across workers")
+    arg_parser.add_argument('--samples', type=int, default=None,
+                            help="Total records in vehicle mode (default: 100 ticks per vehicle)")
+    arg_parser.add_argument('--rate', type=float, default=10.0, help="Vehicle mode sample rate in Hz")
+    arg_parser.add_argument('--dbc', help="Shard the messages of this DBC instead of vehicles")
+    arg_parser.add_argument('--duration', type=parse_duration, default=60.0,
+                            help="Bus/backfill length: seconds or 15m, 12h, 7d")
+    arg_parser.add_argument('--backfill', type=datetime.fromisoformat, metavar='START',
+                            help="Generate --duration of history from START (ISO time) at full speed")
+    arg_parser.add_argument('--insert', choices=INSERT_STRATEGIES, default='execute_batch',
+                            help="Database insert strategy")
+    arg_parser.add_argument('--copy-format', choices=['text', 'binary'], default='binary',
+                            help="COPY wire format for the copy strategies")
+    arg_parser.add_argument('--payload', choices=PAYLOAD_FORMATS, default='hex',
+                            help="Store frames as hex text (data_hex) or raw bytes (payload BYTEA)")
+    arg_parser.add_argument('--writer-thread', action='store_true',
+                            help="Insert on a background thread in every worker")
+    arg_parser.add_argument('--sink', choices=SINKS, default='postgres',
+                            help="Write to TimescaleDB, Parquet files, a CAN log or an MQTT broker")
+    arg_parser.add_argument('--output',
+                            help="File sink location, or the MQTT config JSON; Parquet workers share a "
+                                 "directory, CAN logs get one file per worker, MQTT one connection per worker")
+    arg_parser.add_argument('--pacing', choices=PACING_POLICIES, default='catch_up',
+                            help="Late ticks in real-time mode: run them back to back, or drop them")
+    args = arg_parser.parse_args(argv)
+
+    if args.dbc:
+        shards = plan_bus_shards(args.dbc, args.workers, args.duration)
+    else:
+        num_samples = args.samples or args.vehicles * len(CANSignalType) * 100
+        shards = plan_vehicle_shards(args.vehicles, args.workers, num_samples)
+    return run_sharded(shards, DEFAULT_DB_CONFIG, sample_rate_hz=args.rate,
+                       backfill_start=args.backfill, backfill_duration_s=args.duration,
+                       simulator_options={'insert_strategy': args.insert, 'copy_format': args.copy_format,
+                                          'background_writer': args.writer_thread,
+                                          'payload_format': args.payload,
+                                          'sink': args.sink, 'output_path': args.output,
+                                          'pacing': args.pacing})
+
+
+if __name__ == "__main__":
+    main()
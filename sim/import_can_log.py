@@ -0,0 +1,145 @@
+"""
+Import raw candump or Vector ASC logs into TimescaleDB
+Frames are parsed a chunk at a time, every signal is decoded through the
+DBC with BatchDecoder, and the rows are COPYed into can_messages on a
+background thread while the next chunk is parsed and decoded
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import psycopg2
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "Simulators"))
+
+from BackgroundWriter import BackgroundWriter
+from BatchDecoder import BatchDecoder
+from CanLog import CHUNK_FRAMES, FLAG_RTR, read_asc, read_candump
+from CompressedIO import compression_of
+from CopyWriter import PAYLOAD_FORMATS, CopyWriter, can_message_columns
+from DBCparser import CANMessage, DBCParser
+from LatestValues import LatestValues
+from MessageBatch import MessageBatch, SignalTable
+from import_db_format_compatible import DB_CONFIG
+
+LOG_READERS = {'candump': read_candump, 'asc': read_asc}
+LOAD_STRATEGIES = ('copy', 'copy_merge')
+
+
+def log_format(path: str) -> str:
+    """'asc' for .asc logs, compressed or not, otherwise 'candump'"""
+    if compression_of(path):
+        path = os.path.splitext(path)[0]
+    return 'asc' if os.path.splitext(path)[1].lower() == '.asc' else 'candump'
+
+
+def decode_log(path: str, messages: Dict[int, CANMessage], fmt: Optional[str] = None, vehicle_id: int = 0,
+               payload_size: int = 8, chunk_frames: int = CHUNK_FRAMES) -> Iterator[Tuple[int, MessageBatch]]:
+    """
+    Yield (frames read, decoded rows) per chunk of a candump or ASC log.
+    Remote frames and frames whose ID is not in messages are counted but
+    produce no rows.
+    """
+    decoder = BatchDecoder(messages)
+    signals = SignalTable()
+    reader = LOG_READERS[fmt or log_format(path)]
+    capacity = chunk_frames
+    for records in reader(path, payload_size, chunk_frames):
+        batch = MessageBatch(capacity, signals)
+        # Remote frames request data and carry none to decode
+        data_frames = records[(records['flags'] & FLAG_RTR) == 0]
+        decoder.decode_batch(batch, data_frames['timestamp_ns'] // 1000, data_frames['can_id'],
+                             data_frames['data'], data_frames['dlc'], vehicle_id)
+        # Size the next chunk's batch for this log's signals per frame
+        capacity = max(capacity, batch.capacity)
+        yield len(records), batch
+
+
+def import_log(conn, path: str, messages: Dict[int, CANMessage], fmt: Optional[str] = None,
+               vehicle_id: int = 0, payload_size: int = 8, payload_format: str = 'hex',
+               copy_format: str = 'binary', strategy: str = 'copy_merge',
+               chunk_frames: int = CHUNK_FRAMES) -> Tuple[int, int]:
+    """
+    Decode a log and load its rows, one transaction per chunk, printing
+    progress. copy_merge skips rows whose key already exists; copy is
+    faster but fails the chunk on a duplicate. Returns (frames, rows).
+    """
+    if strategy not in LOAD_STRATEGIES:
+        raise ValueError(f"Unknown load strategy {strategy!r}, expected one of {LOAD_STRATEGIES}")
+    writer = CopyWriter(columns=can_message_columns(payload_format), fmt=copy_format)
+    latest = LatestValues()
+    cur = conn.cursor()
+
+    def load(batch: MessageBatch) -> int:
+        if strategy == 'copy_merge':
+            writer.copy_merge(cur, batch)
+        else:
+            writer.copy(cur, batch)
+        latest.add_batch(batch)
+        latest.upsert(cur)
+        conn.commit()
+        return len(batch)
+
+    # Two chunks may wait for the writer while the next one is decoded
+    background = BackgroundWriter(load, max_pending=2, name='log-import').start()
+    start = time.monotonic()
+    frames = rows = 0
+    try:
+        for chunk_frames_read, batch in decode_log(path, messages, fmt, vehicle_id, payload_size, chunk_frames):
+            background.submit(batch)
+            frames += chunk_frames_read
+            rows += len(batch)
+            elapsed = time.monotonic() - start
+            print(f"Decoded {frames} frames into {rows} rows, {frames / elapsed:,.0f} frames/s")
+        background.close()
+    except Exception:
+        # Stop the writer thread before rolling back the connection it uses
+        try:
+            background.close()
+        except RuntimeError:
+            pass
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+    return frames, rows
+
+
+def main(argv: Optional[List[str]] = None):
+    arg_parser = argparse.ArgumentParser(description="Decode candump/ASC logs through a DBC into TimescaleDB")
+    arg_parser.add_argument('log', help="candump -l or Vector ASC log, optionally .gz or .zst")
+    arg_parser.add_argument('--dbc', required=True, help="DBC used to decode the frames")
+    arg_parser.add_argument('--format', choices=list(LOG_READERS), help="Log format (default: from the extension)")
+    arg_parser.add_argument('--vehicle-id', type=int, default=0, help="vehicle_id of every imported row")
+    arg_parser.add_argument('--fd', action='store_true', help="Accept CAN FD frames of up to 64 bytes")
+    arg_parser.add_argument('--insert', choices=LOAD_STRATEGIES, default='copy_merge',
+                            help="copy_merge skips existing rows, copy is faster but rejects duplicates")
+    arg_parser.add_argument('--payload', choices=PAYLOAD_FORMATS, default='hex',
+                            help="Store frames as hex text (data_hex) or raw bytes (payload BYTEA)")
+    arg_parser.add_argument('--copy-format', choices=['text', 'binary'], default='binary',
+                            help="COPY wire format")
+    arg_parser.add_argument('--chunk-frames', type=int, default=CHUNK_FRAMES,
+                            help="Frames per decoded chunk and transaction")
+    args = arg_parser.parse_args(argv)
+
+    parser = DBCParser(args.dbc)
+    parser.parse()
+    start = time.monotonic()
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        frames, rows = import_log(conn, args.log, parser.messages, args.format, args.vehicle_id,
+                                  64 if args.fd else 8, args.payload, args.copy_format, args.insert,
+                                  args.chunk_frames)
+    finally:
+        conn.close()
+    elapsed = time.monotonic() - start
+    print(f"Import complete! {frames} frames, {rows} rows in {elapsed:.1f}s "
+          f"({frames / elapsed if elapsed else 0:,.0f} frames/s)")
+
+
+if __name__ == "__main__":
+    main()
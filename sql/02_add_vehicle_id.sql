@@ -0,0 +1,7 @@
+-- Tag every row with the simulated/recorded vehicle so fleets share one hypertable
+ALTER TABLE can_messages ADD COLUMN IF NOT EXISTS vehicle_id INTEGER NOT NULL DEFAULT 0;
+
+ALTER TABLE can_messages DROP CONSTRAINT IF EXISTS can_messages_pkey;
+ALTER TABLE can_messages ADD PRIMARY KEY (timestamp, vehicle_id, can_id, signal_name);
+
+CREATE INDEX IF NOT EXISTS idx_vehicle_signal ON can_messages (vehicle_id, signal_name, timestamp DESC);
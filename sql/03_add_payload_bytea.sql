@@ -0,0 +1,10 @@
+-- Raw frame bytes as BYTEA: 8 bytes per classic CAN frame instead of 16 hex characters.
+-- Writers in the 'bytea' payload mode fill payload and leave data_hex NULL;
+-- readers use COALESCE(data_hex, encode(payload, 'hex')) to serve both.
+ALTER TABLE can_messages ADD COLUMN IF NOT EXISTS payload BYTEA;
+
+-- Optional: convert existing rows. This rewrites every chunk, so on large
+-- hypertables run it per time range during a quiet period.
+-- UPDATE can_messages
+-- SET payload = decode(data_hex, 'hex'), data_hex = NULL
+-- WHERE payload IS NULL AND data_hex ~ '^([0-9a-fA-F]{2})*$';
@@ -0,0 +1,40 @@
+-- Newest value per vehicle and signal, upserted by the writers with every batch
+-- (Simulators/LatestValues.py), so latest-state reads touch one row per signal
+-- instead of running DISTINCT ON over the whole hypertable. Signals are keyed
+-- by CAN ID as well as name, since different messages may reuse a signal name.
+CREATE TABLE IF NOT EXISTS latest_signal_values (
+    vehicle_id INTEGER NOT NULL,
+    can_id INTEGER NOT NULL,
+    signal_name VARCHAR(100) NOT NULL,
+    timestamp TIMESTAMPTZ NOT NULL,
+    physical_value DOUBLE PRECISION,
+    unit VARCHAR(20),
+    PRIMARY KEY (vehicle_id, can_id, signal_name)
+);
+
+-- Seed from the rows already stored; this is the last full scan
+INSERT INTO latest_signal_values (vehicle_id, can_id, signal_name, timestamp, physical_value, unit)
+SELECT DISTINCT ON (vehicle_id, can_id, signal_name)
+    vehicle_id,
+    can_id,
+    signal_name,
+    timestamp,
+    physical_value,
+    unit
+FROM can_messages
+ORDER BY vehicle_id, can_id, signal_name, timestamp DESC
+ON CONFLICT (vehicle_id, can_id, signal_name) DO UPDATE
+SET timestamp = EXCLUDED.timestamp,
+    physical_value = EXCLUDED.physical_value,
+    unit = EXCLUDED.unit
+WHERE latest_signal_values.timestamp < EXCLUDED.timestamp;
+
+-- Same columns as before, for dashboards that query the view
+CREATE OR REPLACE VIEW latest_vehicle_state AS
+SELECT DISTINCT ON (signal_name)
+    signal_name,
+    physical_value,
+    unit,
+    timestamp
+FROM latest_signal_values
+ORDER BY signal_name, timestamp DESC;
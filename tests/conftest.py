@@ -0,0 +1,27 @@
+"""
+Shared fixtures; the simulator modules are scripts, so they are imported
+from Simulators/ and sim/ the same way the benchmarks do
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "Simulators"))
+sys.path.insert(0, str(ROOT / "sim"))
+
+from DBCparser import DBCParser  # noqa: E402
+
+
+@pytest.fixture
+def parse_dbc(tmp_path):
+    """Write DBC text to a temporary file and return its parsed DBCParser"""
+    def parse(text: str) -> DBCParser:
+        path = tmp_path / "test.dbc"
+        path.write_text(text)
+        parser = DBCParser(str(path), use_cache=False)
+        parser.parse()
+        return parser
+    return parse
@@ -0,0 +1,96 @@
+"""Generated encoders/decoders (DBCParser.generate_python_source)"""
+
+import importlib.util
+
+import numpy as np
+
+from BatchDecoder import BatchDecoder
+from CanSim import CANSimulator, DBCTrafficGenerator
+from MessageBatch import MessageBatch, SignalTable
+
+# Vector tools park signals not mapped to any frame in this dlc 0 pseudo-message
+INDEPENDENT_SIGNALS_DBC = """
+BU_: ECU1
+
+BO_ 256 Engine: 8 ECU1
+ SG_ RPM : 0|16@1+ (0.25,0) [0|16000] "rpm" Vector__XXX
+ SG_ Temp : 23|8@0- (1,0) [-128|127] "degC" Vector__XXX
+
+BO_ 3221225472 VECTOR__INDEPENDENT_SIG_MSG: 0 Vector__XXX
+ SG_ Unmapped : 0|8@1+ (1,0) [0|255] "" Vector__XXX
+"""
+
+
+def test_skips_signals_outside_the_frame(parse_dbc, capsys):
+    parser = parse_dbc(INDEPENDENT_SIGNALS_DBC)
+    codecs = parser.compile_codecs()
+    assert "Skipping signal VECTOR__INDEPENDENT_SIG_MSG.Unmapped" in capsys.readouterr().out
+
+    assert codecs.VECTOR__INDEPENDENT_SIG_MSG.SIGNALS == ()
+    assert codecs.VECTOR__INDEPENDENT_SIG_MSG.encode() == b''
+    assert codecs.VECTOR__INDEPENDENT_SIG_MSG.decode(b'') == {}
+    frame = codecs.Engine.encode(3000.0, -12)
+    assert codecs.DECODERS[0x100](frame) == {'RPM': 3000.0, 'Temp': -12.0}
+
+
+def test_written_module_imports(parse_dbc, tmp_path):
+    parser = parse_dbc(INDEPENDENT_SIGNALS_DBC)
+    path = tmp_path / "codecs.py"
+    parser.generate_python_code(str(path))
+    spec = importlib.util.spec_from_file_location("codecs_generated", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    assert module.Engine.SIGNALS == ('RPM', 'Temp')
+
+
+def test_traffic_leaves_out_messages_without_signals(parse_dbc, tmp_path):
+    parser = parse_dbc(INDEPENDENT_SIGNALS_DBC)
+    assert list(DBCTrafficGenerator(parser, SignalTable()).cycle_times_ms()) == [256]
+
+    simulator = CANSimulator({}, dbc_file=str(tmp_path / "test.dbc"))
+    assert list(simulator.bus.messages) == [256]
+
+MULTIPLEXED_DBC = """
+BU_: ECU1
+
+BO_ 512 Diag: 8 ECU1
+ SG_ Selector M : 0|8@1+ (1,0) [0|255] "" Vector__XXX
+ SG_ Counter : 8|4@1+ (1,0) [0|15] "" Vector__XXX
+ SG_ A m3 : 16|8@1+ (1,0) [0|255] "" Vector__XXX
+ SG_ B m4 : 16|8@1+ (1,0) [0|255] "" Vector__XXX
+ SG_ C m4 : 31|8@0- (0.5,-10) [-74|53.5] "V" Vector__XXX
+"""
+
+
+def test_multiplexed_encode_writes_selected_signals(parse_dbc):
+    codecs = parse_dbc(MULTIPLEXED_DBC).compile_codecs()
+
+    frame = codecs.Diag.encode(3, 5, 76, 25, -12.5)
+    assert codecs.Diag.decode(frame) == {'Selector': 3.0, 'Counter': 5.0, 'A': 76.0}
+    assert codecs.Diag.decode_raw(frame) == (3, 5, 76, None, None)
+
+    frame = codecs.Diag.encode(4, 5, 76, 25, -12.5)
+    assert codecs.Diag.decode(frame) == {'Selector': 4.0, 'Counter': 5.0, 'B': 25.0, 'C': -12.5}
+    assert codecs.Diag.decode_raw(frame) == (4, 5, None, 25, -5)
+
+    # No signal is selected by 7, so only the unmultiplexed ones are written
+    frame = codecs.Diag.encode(7, 5, 76, 25, -12.5)
+    assert frame == bytes([7, 5, 0, 0, 0, 0, 0, 0])
+    assert codecs.Diag.decode(frame) == {'Selector': 7.0, 'Counter': 5.0}
+
+
+def test_multiplexed_decode_matches_batch_decoder(parse_dbc):
+    parser = parse_dbc(MULTIPLEXED_DBC)
+    codecs = parser.compile_codecs()
+    rng = np.random.default_rng(0)
+    payloads = rng.integers(0, 256, (200, 8), dtype=np.uint8)
+    payloads[:, 0] = rng.integers(2, 6, 200)
+
+    batch = MessageBatch()
+    BatchDecoder(parser.messages).decode_batch(batch, np.arange(200), np.full(200, 512), payloads)
+    expected = [{} for _ in payloads]
+    entries = batch.signals.entries
+    for row, sig, physical in zip(batch.timestamps[:len(batch)].tolist(), batch.signal_index[:len(batch)].tolist(),
+                                  batch.physical[:len(batch)].tolist()):
+        expected[row][entries[sig][1]] = physical
+    assert [codecs.Diag.decode(payload.tobytes()) for payload in payloads] == expected
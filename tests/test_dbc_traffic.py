@@ -0,0 +1,96 @@
+"""DBCTrafficGenerator rows against the DBC they are generated from"""
+
+import numpy as np
+
+from BatchDecoder import BatchDecoder
+from CanLog import CAN_EFF_FLAG
+from CanSim import DBCTrafficGenerator
+from MessageBatch import MessageBatch, SignalTable
+
+J1939_ID = 0x18FEF100
+
+EXTENDED_DBC = f"""
+BU_: ECU1
+
+BO_ {J1939_ID | CAN_EFF_FLAG} EngineTemp: 8 ECU1
+ SG_ CoolantTemp : 0|8@1+ (1,-40) [-40|210] "degC" Vector__XXX
+ SG_ OilTemp : 16|16@1+ (0.03125,-273) [-273|1735] "degC" Vector__XXX
+
+BO_ 256 Wheels: 8 ECU1
+ SG_ Speed : 0|16@1+ (0.01,0) [0|250] "km/h" Vector__XXX
+"""
+
+
+def generate(parser, frames):
+    signals = SignalTable()
+    generator = DBCTrafficGenerator(parser, signals, seed=1)
+    batch = MessageBatch(signals=signals)
+    generator.fill_batch(batch, frames)
+    return batch
+
+
+def test_extended_ids_are_stored_without_flag(parse_dbc):
+    parser = parse_dbc(EXTENDED_DBC)
+    batch = generate(parser, [(J1939_ID | CAN_EFF_FLAG, 1000), (256, 1000), (J1939_ID | CAN_EFF_FLAG, 2000)])
+
+    can_ids = batch.can_ids[:len(batch)].tolist()
+    assert sorted(set(can_ids)) == [256, J1939_ID]
+    # Bare IDs fit the can_messages INTEGER column
+    assert max(can_ids) < 2 ** 31
+
+
+def sorted_rows(batch):
+    """(timestamp, can_id, signal, raw) of every row, in a fixed order"""
+    n = len(batch)
+    return sorted(zip(batch.timestamps[:n].tolist(), batch.can_ids[:n].tolist(),
+                      batch.signal_index[:n].tolist(), batch.raw[:n].tolist()))
+
+
+def test_rows_match_batch_decoder(parse_dbc):
+    parser = parse_dbc(EXTENDED_DBC)
+    frames = [(msg_id, 1000 * i) for i in range(20) for msg_id in (J1939_ID | CAN_EFF_FLAG, 256)]
+    generated = generate(parser, frames)
+
+    # Every frame writes one row per signal, in frame order
+    counts = [len(parser.messages[msg_id].signals) for msg_id, _ in frames]
+    first_rows = np.cumsum([0] + counts[:-1])
+    decoded = MessageBatch(signals=generated.signals)
+    BatchDecoder(parser.messages).decode_batch(
+        decoded, np.array([t for _, t in frames]), np.array([msg_id for msg_id, _ in frames]),
+        generated.payload[first_rows])
+    assert sorted_rows(decoded) == sorted_rows(generated)
+
+
+MULTIPLEXED_DBC = """
+BU_: ECU1
+
+BO_ 512 Diag: 8 ECU1
+ SG_ Selector M : 0|8@1+ (1,0) [0|255] "" Vector__XXX
+ SG_ Counter : 8|4@1+ (1,0) [0|15] "" Vector__XXX
+ SG_ A m3 : 16|8@1+ (1,0) [0|255] "" Vector__XXX
+ SG_ B m4 : 16|8@1+ (1,0) [0|255] "" Vector__XXX
+ SG_ C m4 : 31|8@0- (0.5,-10) [-74|53.5] "V" Vector__XXX
+"""
+
+
+def test_multiplexed_frames_carry_selected_signals(parse_dbc):
+    parser = parse_dbc(MULTIPLEXED_DBC)
+    frames = [(512, 1000 * i) for i in range(50)]
+    generated = generate(parser, frames)
+
+    n = len(generated)
+    entries = generated.signals.entries
+    signals_per_frame = {}
+    for timestamp, sig, physical in zip(generated.timestamps[:n].tolist(), generated.signal_index[:n].tolist(),
+                                        generated.physical[:n].tolist()):
+        signals_per_frame.setdefault(timestamp, {})[entries[sig][1]] = physical
+    assert {frozenset(signals) for signals in signals_per_frame.values()} == {
+        frozenset({'Selector', 'Counter', 'A'}), frozenset({'Selector', 'Counter', 'B', 'C'})}
+    for signals in signals_per_frame.values():
+        assert signals['Selector'] == (3 if 'A' in signals else 4)
+
+    first_rows = np.unique(generated.timestamps[:n], return_index=True)[1]
+    decoded = MessageBatch(signals=generated.signals)
+    BatchDecoder(parser.messages).decode_batch(
+        decoded, generated.timestamps[first_rows], np.full(len(first_rows), 512), generated.payload[first_rows])
+    assert sorted_rows(decoded) == sorted_rows(generated)
@@ -0,0 +1,64 @@
+"""Newest value per vehicle, CAN ID and signal (LatestValues)"""
+
+import numpy as np
+import pytest
+
+import LatestValues as latest_values
+from LatestValues import LatestValues, UNIX_EPOCH
+from MessageBatch import MessageBatch
+
+
+@pytest.fixture
+def upserted(monkeypatch):
+    """Rows each upsert() passes to execute_values, instead of a database"""
+    rows = []
+    monkeypatch.setattr(latest_values, 'execute_values',
+                        lambda cur, sql, values, page_size: rows.extend(values))
+    return rows
+
+
+def test_same_signal_name_in_two_messages_is_kept_apart(upserted):
+    batch = MessageBatch()
+    front = batch.signals.index(0x200, 'WheelsFront', 'Speed', 'km/h')
+    rear = batch.signals.index(0x201, 'WheelsRear', 'Speed', 'km/h')
+    batch.append(1000, 0x200, front, 0, 50.0, 3, b'')
+    batch.append(2000, 0x201, rear, 0, 48.0, 3, b'')
+    batch.append(3000, 0x200, front, 0, 51.0, 3, b'')
+
+    latest = LatestValues()
+    latest.add_batch(batch)
+    assert latest.upsert(None) == 2
+    assert [(vehicle_id, can_id, name, value) for vehicle_id, can_id, name, _, value, _ in upserted] == [
+        (3, 0x200, 'Speed', 51.0), (3, 0x201, 'Speed', 48.0)]
+    assert len(latest) == 0
+
+
+def test_older_values_do_not_replace_newer(upserted):
+    latest = LatestValues()
+    latest.add(0, 0x100, 'RPM', 2000, 900.0, 'rpm')
+    latest.add(0, 0x100, 'RPM', 1000, 800.0, 'rpm')
+    latest.add(0, 0x100, 'RPM', 2000, 950.0, 'rpm')
+    latest.upsert(None)
+    assert [row[4] for row in upserted] == [950.0]
+    assert upserted[0][3] == UNIX_EPOCH.replace(microsecond=2000)
+
+
+@pytest.mark.parametrize('vehicle_ids', [np.arange(4), np.array([0, 1000, 2 ** 20, 2 ** 30])])
+def test_add_batch_matches_row_by_row(vehicle_ids, upserted):
+    rng = np.random.default_rng(1)
+    batch = MessageBatch()
+    signals = [batch.signals.index(can_id, 'Msg', name, '') for can_id in (0x100, 0x101) for name in 'ABC']
+    can_ids = {sig: can_id for sig, can_id in zip(signals, (0x100,) * 3 + (0x101,) * 3)}
+    for _ in range(2000):
+        sig = int(rng.choice(signals))
+        batch.append(int(rng.integers(0, 50)), can_ids[sig], sig, 0, float(rng.normal()),
+                     int(rng.choice(vehicle_ids)), b'')
+
+    expected = LatestValues()
+    for i in range(len(batch)):
+        _, name, unit = batch.signals.entries[batch.signal_index[i]]
+        expected.add(int(batch.vehicle_ids[i]), int(batch.can_ids[i]), name, int(batch.timestamps[i]),
+                     float(batch.physical[i]), unit)
+    latest = LatestValues()
+    latest.add_batch(batch)
+    assert latest.values == expected.values
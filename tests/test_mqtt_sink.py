@@ -0,0 +1,222 @@
+"""MqttClient and MqttSink against the in-process LocalBroker"""
+
+import asyncio
+import json
+import threading
+
+import numpy as np
+import pytest
+
+from CanLog import LOG_HEADER, LOG_MAGIC, frame_dtype
+from MessageBatch import MessageBatch
+from MqttSink import (CONNACK, CONNECT, DISCONNECT, PINGREQ, PINGRESP, PUBLISH, LocalBroker, MqttClient, MqttSink,
+                      _packet, _read_packet)
+
+
+@pytest.fixture
+def broker_loop():
+    """Start LocalBrokers on an event loop thread, for the synchronous MqttSink"""
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    brokers = []
+
+    def start(**kwargs) -> LocalBroker:
+        broker = LocalBroker(**kwargs)
+        asyncio.run_coroutine_threadsafe(broker.start(), loop).result()
+        brokers.append(broker)
+        return broker
+
+    yield start
+    for broker in brokers:
+        asyncio.run_coroutine_threadsafe(broker.stop(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+
+def frames_batch(num_frames: int) -> MessageBatch:
+    """Two signal rows per frame, frames 10 ms apart"""
+    batch = MessageBatch()
+    for i in range(num_frames):
+        payload = bytes([i % 256, 1, 2, 3])
+        batch.append(i * 10000, 0x100, batch.signals.index(0x100, 'ENGINE', 'RPM', 'rpm'), i, i * 0.25, 7, payload)
+        batch.append(i * 10000, 0x100, batch.signals.index(0x100, 'ENGINE', 'Load', '%'), 50, 19.5, 7, payload)
+    return batch
+
+
+def test_client_qos1_publish_is_acknowledged():
+    async def scenario():
+        broker = LocalBroker()
+        client = MqttClient('127.0.0.1', await broker.start(), client_id='test')
+        await client.connect()
+        for i in range(20):
+            await client.publish('can/raw', bytes([i]) * 10)
+        await client.flush()
+        await client.disconnect()
+        await broker.stop()
+        return broker, client
+
+    broker, client = asyncio.run(scenario())
+    assert broker.messages == [('can/raw', bytes([i]) * 10) for i in range(20)]
+    assert client.messages_sent == 20
+    assert client.bytes_sent == 200
+    assert len(client.ack_latency_s) == 20
+    assert not client._pending
+
+
+def test_client_qos0_is_not_tracked():
+    async def scenario():
+        broker = LocalBroker()
+        client = MqttClient('127.0.0.1', await broker.start())
+        await client.connect()
+        await client.publish('can/raw', b'fire and forget', qos=0)
+        await client.flush()
+        await client.disconnect()
+        await broker.stop()
+        return broker, client
+
+    broker, client = asyncio.run(scenario())
+    assert broker.messages == [('can/raw', b'fire and forget')]
+    assert client.ack_latency_s == []
+
+
+def test_client_in_flight_messages_are_bounded():
+    async def scenario():
+        broker = LocalBroker(ack_delay_s=0.02)
+        client = MqttClient('127.0.0.1', await broker.start(), max_in_flight=2)
+        await client.connect()
+        in_flight = []
+        for i in range(8):
+            await client.publish('can/raw', bytes([i]))
+            in_flight.append(len(client._pending))
+        await client.flush()
+        await client.disconnect()
+        await broker.stop()
+        return broker, client, in_flight
+
+    broker, client, in_flight = asyncio.run(scenario())
+    # publish() waits for a PUBACK once two messages are unacknowledged
+    assert max(in_flight) == 2
+    assert len(broker.messages) == 8
+    assert len(client.ack_latency_s) == 8
+
+
+def test_client_reports_refused_connection():
+    async def refuse(reader, writer):
+        await _read_packet(reader)
+        writer.write(_packet(CONNACK, b'\x00\x05'))
+        await writer.drain()
+        writer.close()
+
+    async def scenario():
+        server = await asyncio.start_server(refuse, '127.0.0.1', 0)
+        client = MqttClient('127.0.0.1', server.sockets[0].getsockname()[1])
+        try:
+            with pytest.raises(ConnectionError, match='not authorized'):
+                await client.connect()
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    asyncio.run(scenario())
+
+
+def test_client_lost_connection_wakes_publishers():
+    async def drop_after_connack(reader, writer):
+        await _read_packet(reader)
+        writer.write(_packet(CONNACK, b'\x00\x00'))
+        await writer.drain()
+        await _read_packet(reader)
+        writer.close()
+
+    async def scenario():
+        server = await asyncio.start_server(drop_after_connack, '127.0.0.1', 0)
+        client = MqttClient('127.0.0.1', server.sockets[0].getsockname()[1], max_in_flight=1)
+        await client.connect()
+        try:
+            with pytest.raises(ConnectionError, match='lost'):
+                # The first PUBLISH is never acknowledged, so only the lost connection frees the slot
+                for _ in range(3):
+                    await client.publish('can/raw', b'x')
+                    await asyncio.sleep(0.01)
+        finally:
+            await client.disconnect()
+            server.close()
+            await server.wait_closed()
+
+    asyncio.run(scenario())
+
+
+def test_client_disconnect_flushes_ping_and_disconnect():
+    received = []
+
+    async def record(reader, writer):
+        try:
+            while True:
+                first, _ = await _read_packet(reader)
+                received.append(first & 0xF0)
+                if first & 0xF0 == CONNECT:
+                    writer.write(_packet(CONNACK, b'\x00\x00'))
+                elif first & 0xF0 == PINGREQ:
+                    writer.write(_packet(PINGRESP, b''))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+
+    async def scenario():
+        server = await asyncio.start_server(record, '127.0.0.1', 0)
+        # keepalive 1 s pings every 0.5 s
+        client = MqttClient('127.0.0.1', server.sockets[0].getsockname()[1], keepalive=1)
+        await client.connect()
+        await asyncio.sleep(0.6)
+        await client.publish('can/raw', b'last', qos=0)
+        await client.disconnect()
+        server.close()
+        await server.wait_closed()
+
+    asyncio.run(scenario())
+    assert received == [CONNECT, PINGREQ, PUBLISH, DISCONNECT]
+
+
+def test_sink_publishes_raw_frames_and_decoded_signals(broker_loop):
+    broker = broker_loop()
+    sink = MqttSink(host='127.0.0.1', port=broker.port, max_records=40)
+    batch = frames_batch(100)
+    assert sink.write(batch) == 200
+    sink.close()
+
+    raw = [payload for topic, payload in broker.messages if topic == sink.topics['raw_can']]
+    decoded = [json.loads(payload) for topic, payload in broker.messages if topic == sink.topics['decoded']]
+    # 100 frames and 200 signal rows, at most 40 records per message
+    assert len(raw) == 3
+    assert len(decoded) == 5
+
+    records = []
+    for payload in raw:
+        magic, _, payload_size, record_size = LOG_HEADER.unpack_from(payload)
+        assert magic == LOG_MAGIC
+        assert record_size == frame_dtype(payload_size).itemsize
+        records.append(np.frombuffer(payload[LOG_HEADER.size:], dtype=frame_dtype(payload_size)))
+    records = np.concatenate(records)
+    assert records['timestamp_ns'].tolist() == [i * 10000000 for i in range(100)]
+    assert records['channel'].tolist() == [7] * 100
+    assert records['data'][:, 0].tolist() == list(range(100))
+
+    values = [value for message in decoded for value in message['value']]
+    names = [message['names'][i] for message in decoded for i in message['signal']]
+    assert values == batch.physical[:200].tolist()
+    assert names == ['RPM', 'Load'] * 100
+    assert sink.rows_written == 200
+
+
+def test_sink_write_blocks_on_slow_broker(broker_loop):
+    broker = broker_loop(ack_delay_s=0.01)
+    sink = MqttSink(host='127.0.0.1', port=broker.port, max_in_flight=1, max_records=10)
+    try:
+        sink.write(frames_batch(30))
+        # With one message in flight, write() returns only after all but the last are acknowledged
+        assert len(sink.client.ack_latency_s) >= len(broker.messages) - 1
+    finally:
+        sink.close()
+    assert len(sink.client.ack_latency_s) == len(broker.messages) == 9